@@ -1,6 +1,6 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import shutil
@@ -8,6 +8,7 @@ import os
 import sys
 import time
 import uuid
+import io
 import json
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -26,9 +27,17 @@ sys.path.append(str(root_dir))
 try:
     from src.pdf_processor import PDFProcessor
     from src.logger import ExtractionLogger
-    from src.config import PROJECT_ROOT, OUTPUT_DIR
+    from src.config import PROJECT_ROOT, OUTPUT_DIR, METRICS_ENABLED, METRICS_TOKEN
     from src.logging_setup import setup_logging, set_request_context, clear_request_context
     from src.event_logger import event_logger
+    from src.document_source import DocumentSource
+    from src.memory_governor import maybe_collect
+    from src.budget import BudgetExceededError, SCOPE_REQUEST
+    from src.tracing import server_timing_header
+    from src.metrics import (
+        CONTENT_TYPE as METRICS_CONTENT_TYPE, EXTRACTIONS, HTTP_REQUEST_SECONDS, JOBS_IN_FLIGHT,
+        UPLOAD_BYTES, UPLOAD_SIZE_BYTES, render_metrics, start_exporter,
+    )
 except ImportError as e:
     print(f"Chyba importu: {e}")
     # Fallback pro případ, že se spouští jinak
@@ -36,9 +45,17 @@ except ImportError as e:
     try:
         from src.pdf_processor import PDFProcessor
         from src.logger import ExtractionLogger
-        from src.config import PROJECT_ROOT, OUTPUT_DIR
+        from src.config import PROJECT_ROOT, OUTPUT_DIR, METRICS_ENABLED, METRICS_TOKEN
         from src.logging_setup import setup_logging, set_request_context, clear_request_context
         from src.event_logger import event_logger
+        from src.document_source import DocumentSource
+        from src.memory_governor import maybe_collect
+        from src.budget import BudgetExceededError, SCOPE_REQUEST
+        from src.tracing import server_timing_header
+        from src.metrics import (
+            CONTENT_TYPE as METRICS_CONTENT_TYPE, EXTRACTIONS, HTTP_REQUEST_SECONDS, JOBS_IN_FLIGHT,
+            UPLOAD_BYTES, UPLOAD_SIZE_BYTES, render_metrics, start_exporter,
+        )
     except ImportError:
         print("Nepodařilo se importovat moduly ze src.")
         raise
@@ -176,6 +193,9 @@ access_logger = logging.getLogger("dsv.access")
 async def on_startup():
     """Event handler pro start serveru."""
     event_logger.log_startup()
+    if METRICS_ENABLED:
+        # Každý uvicorn worker ukládá své metriky, /metrics je sčítá
+        start_exporter()
 
 
 @app.on_event("shutdown")
@@ -205,6 +225,7 @@ async def request_logging_middleware(request: Request, call_next):
         response = await call_next(request)
     except Exception as e:
         duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        _observe_request(request, 500, start)
         # Aplikační error log s tracebackem
         logger.exception("unhandled_exception")
         # Event log pro neošetřenou výjimku
@@ -228,6 +249,7 @@ async def request_logging_middleware(request: Request, call_next):
         raise
     else:
         duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        _observe_request(request, response.status_code, start)
         response.headers["X-Request-ID"] = request_id
         access_logger.info(
             "http_access",
@@ -240,6 +262,13 @@ async def request_logging_middleware(request: Request, call_next):
         clear_request_context()
         return response
 
+def _observe_request(request: Request, status_code: int, start: float) -> None:
+    """Latence requestu do metrik podle šablony routy (ne podle konkrétní cesty)."""
+    route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start, method=request.method, route=route, status=str(status_code)
+    )
+
 # Inicializace procesoru
 try:
     extraction_logger = ExtractionLogger(log_file=PROJECT_ROOT / "logs" / "extraction_log_api.jsonl")
@@ -253,6 +282,17 @@ async def root():
     return {"message": "DSV PDF Processor API is running"}
 
 
+@app.get("/metrics")
+def metrics(request: Request):
+    """Metriky ve formátu Prometheus, sečtené přes všechny uvicorn workery."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    # Synchronní handler: čtení souborů workerů běží v threadpoolu
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 # ============================================
 # AUTH ENDPOINTS
 # ============================================
@@ -318,99 +358,167 @@ async def process_pdf(
     start_time = time.perf_counter()
 
     try:
-        # Vytvoření dočasného souboru
-        temp_dir = root_dir / "temp_uploads"
-        temp_dir.mkdir(exist_ok=True)
-        temp_file_path = temp_dir / file.filename
-        
-        # Optimalizace: Použití streamu s pevnou velikostí chunků (1MB)
-        # To zabrání načtení celého souboru do RAM při ukládání
-        file_size = 0
-        with open(temp_file_path, "wb") as buffer:
-            while content := await file.read(1024 * 1024):  # 1MB chunks
-                buffer.write(content)
-                file_size += len(content)
-        
-        # Event log: PDF nahráno
-        event_logger.log_pdf_uploaded(
-            filename=file.filename,
-            size_bytes=file_size,
-            username=current_user,
-        )
-            
-        logger.info("pdf_saved", extra={"extraction_id": extraction_id, "pdf_filename": file.filename})
-
-        # Event log: Začátek zpracování
-        event_logger.log_pdf_processing_start(
-            extraction_id=extraction_id,
-            filename=file.filename,
-            username=current_user,
-        )
+        # Upload se nekopíruje do temp_uploads: procesor čte přímo buffer UploadFile
+        # (SpooledTemporaryFile je nad 1 MB na disku a namapuje se přes mmap)
+        source = DocumentSource.from_fileobj(file.file, name=file.filename)
+        _log_upload(file.filename, source.size, extraction_id, current_user)
 
-        # Zpracování PDF
-        # Použijeme existující output adresář z configu
-        result = processor.process_pdf(temp_file_path, OUTPUT_DIR, extraction_id=extraction_id)
-        
-        # Explicitní úklid paměti po zpracování
-        import gc
-        gc.collect()
-        
-        # Úklid dočasného souboru (šetří místo na disku)
+        JOBS_IN_FLIGHT.inc()
         try:
-            os.remove(temp_file_path)
-        except Exception as e:
-            logger.warning(f"Could not remove temp file: {e}")
+            # Zpracování PDF
+            # Použijeme existující output adresář z configu.
+            # Async varianta neblokuje event loop (login a další requesty běží během extrakce dál).
+            result = await processor.aprocess_pdf(source, OUTPUT_DIR, extraction_id=extraction_id, user=current_user)
+        finally:
+            JOBS_IN_FLIGHT.dec()
+            source.close()
         
-        # Obohacení výsledku o cesty ke stažení (relativní URL)
-        output_folder_name = temp_file_path.stem
-        processing_time = time.perf_counter() - start_time
-        
-        # Event log: Úspěšné zpracování
-        usage_info = result.get("usage_info", {})
-        event_logger.log_pdf_processing_success(
-            extraction_id=extraction_id,
-            filename=file.filename,
-            processing_time_seconds=processing_time,
-            records_count=len(result.get("extracted_data", [])),
-            tokens_used=usage_info.get("total_tokens"),
-            cost_usd=usage_info.get("total_cost_usd"),
-        )
-        
-        # Konstrukce odpovědi
-        response_data = {
-            "status": "success",
-            "filename": file.filename,
-            "job_id": output_folder_name, # Frontend očekává job_id
-            "extracted_data": result.get("extracted_data", []),
-            "output_files": result.get("output_files", {}),
-            "usage_info": result.get("usage_info"),
-            "processing_time": result.get("processing_time"),
-            "extraction_id": extraction_id,
-        }
+        # Úklid paměti po zpracování (plný gc jen nad prahem GC_THRESHOLD_MB)
+        maybe_collect()
         
-        return JSONResponse(content=response_data)
+        response_data = _success_response(file.filename, extraction_id, result, start_time)
+        # Časy kroků extrakce pro DevTools / proxy (parse, extract, gemini.*, classify, write)
+        server_timing = server_timing_header(result.get("timings"))
+        return JSONResponse(content=response_data, headers={"Server-Timing": server_timing} if server_timing else None)
+
+    except BudgetExceededError as e:
+        # Příliš drahý dokument (413), nebo vyčerpaný denní rozpočet (429)
+        _log_processing_failure(file, extraction_id, e, start_time)
+        raise HTTPException(status_code=413 if e.scope == SCOPE_REQUEST else 429, detail=str(e))
+    except Exception as e:
+        _log_processing_failure(file, extraction_id, e, start_time)
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+
+@app.post("/process-pdf/stream")
+async def process_pdf_stream(
+    file: UploadFile = File(...),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Streamovaná varianta /process-pdf/ (NDJSON, jeden JSON objekt na řádek).
 
+    Záznamy se posílají jako `{"event": "record", ...}`, jakmile je model vrátí;
+    poslední řádek je `{"event": "result", ...}` se stejným obsahem jako odpověď
+    /process-pdf/, případně `{"event": "error", ...}`.
+    """
+    if not processor:
+        raise HTTPException(status_code=500, detail="PDF Processor not initialized properly")
+    
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+
+    extraction_id = f"api_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    start_time = time.perf_counter()
+
+    try:
+        # Tělo odpovědi se streamuje až po návratu z handleru, kdy FastAPI upload zavírá;
+        # zdroj proto převezme jeho soubor a UploadFile dostane prázdnou náhradu
+        source = DocumentSource.from_fileobj(file.file, name=file.filename, owned=True)
+        file.file = io.BytesIO()
+        _log_upload(file.filename, source.size, extraction_id, current_user)
     except Exception as e:
-        processing_time = time.perf_counter() - start_time
-        logger.error(
-            "pdf_processing_failed",
-            extra={
-                "extraction_id": extraction_id,
-                "pdf_filename": getattr(file, "filename", None),
-                "error": {"message": str(e), "type": type(e).__name__},
-            },
-        )
-        # Event log: Chyba při zpracování
-        event_logger.log_pdf_processing_error(
-            extraction_id=extraction_id,
-            filename=getattr(file, "filename", "unknown"),
-            error=str(e),
-            error_type=type(e).__name__,
-            processing_time_seconds=processing_time,
-        )
-        traceback.print_exc()
+        _log_processing_failure(file, extraction_id, e, start_time)
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+    def _ndjson_events():
+        # Synchronní generátor: Starlette ho iteruje v threadpoolu, event loop se neblokuje
+        JOBS_IN_FLIGHT.inc()
+        try:
+            for event in processor.process_pdf_stream(source, OUTPUT_DIR, extraction_id=extraction_id, user=current_user):
+                if event.get("event") == "result":
+                    response_data = _success_response(file.filename, extraction_id, event["result"], start_time)
+                    event = {"event": "result", **response_data}
+                yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            _log_processing_failure(file, extraction_id, e, start_time)
+            yield json.dumps({
+                "event": "error",
+                "extraction_id": extraction_id,
+                "detail": f"Error processing PDF: {str(e)}",
+            }, ensure_ascii=False) + "\n"
+        finally:
+            JOBS_IN_FLIGHT.dec()
+            source.close()
+
+    return StreamingResponse(_ndjson_events(), media_type="application/x-ndjson")
+
+
+def _log_upload(filename: str, size_bytes: int, extraction_id: str, current_user: str) -> None:
+    """Zaloguje nahrání PDF a začátek zpracování."""
+    UPLOAD_BYTES.inc(size_bytes)
+    UPLOAD_SIZE_BYTES.observe(size_bytes)
+    # Event log: PDF nahráno
+    event_logger.log_pdf_uploaded(
+        filename=filename,
+        size_bytes=size_bytes,
+        username=current_user,
+    )
+        
+    logger.info("pdf_saved", extra={"extraction_id": extraction_id, "pdf_filename": filename})
+
+    # Event log: Začátek zpracování
+    event_logger.log_pdf_processing_start(
+        extraction_id=extraction_id,
+        filename=filename,
+        username=current_user,
+    )
+
+
+def _success_response(filename: str, extraction_id: str, result: dict, start_time: float) -> dict:
+    """Zaloguje úspěšné zpracování a sestaví odpověď pro frontend."""
+    # Obohacení výsledku o cesty ke stažení (relativní URL)
+    output_folder_name = Path(filename).stem
+    processing_time = time.perf_counter() - start_time
+    
+    # Event log: Úspěšné zpracování
+    usage_info = result.get("usage_info") or {}
+    event_logger.log_pdf_processing_success(
+        extraction_id=extraction_id,
+        filename=filename,
+        processing_time_seconds=processing_time,
+        records_count=len(result.get("extracted_data", [])),
+        tokens_used=usage_info.get("total_tokens"),
+        cost_usd=usage_info.get("total_cost_usd"),
+    )
+    
+    # Konstrukce odpovědi
+    return {
+        "status": "success",
+        "filename": filename,
+        "job_id": output_folder_name, # Frontend očekává job_id
+        "extracted_data": result.get("extracted_data", []),
+        "output_files": result.get("output_files", {}),
+        "usage_info": result.get("usage_info"),
+        "processing_time": result.get("processing_time"),
+        "timings": result.get("timings"),
+        "extraction_id": extraction_id,
+        "degraded": result.get("degraded", False),
+    }
+
+
+def _log_processing_failure(file: UploadFile, extraction_id: str, error: Exception, start_time: float) -> None:
+    """Zaloguje chybu zpracování do aplikačního i event logu."""
+    EXTRACTIONS.inc(outcome="failure")
+    processing_time = time.perf_counter() - start_time
+    logger.error(
+        "pdf_processing_failed",
+        extra={
+            "extraction_id": extraction_id,
+            "pdf_filename": getattr(file, "filename", None),
+            "error": {"message": str(error), "type": type(error).__name__},
+        },
+    )
+    # Event log: Chyba při zpracování
+    event_logger.log_pdf_processing_error(
+        extraction_id=extraction_id,
+        filename=getattr(file, "filename", "unknown"),
+        error=str(error),
+        error_type=type(error).__name__,
+        processing_time_seconds=processing_time,
+    )
+    traceback.print_exc()
+
 @app.get("/download/{download_id}/{file_type}")
 async def download_result(
     download_id: str,
@@ -5,13 +5,13 @@ Tento modul je adaptér mezi Flask uploadem (Werkzeug `FileStorage`) a core logi
 
 from __future__ import annotations
 
-import tempfile
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
+from src.document_source import DocumentSource
 from src.logger import ExtractionLogger
 from src.pdf_processor import PDFProcessor
 
@@ -45,14 +45,12 @@ class PDFService:
 
         original_filename = secure_filename(file.filename)
 
-        # Uložíme upload do dočasného souboru (PDFProcessor očekává Path)
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp_path = Path(tmp.name)
-            file.save(tmp)
+        # Upload předáme procesoru přímo (BytesIO bez kopie, SpooledTemporaryFile přes mmap)
+        source = DocumentSource.from_fileobj(file.stream, name=original_filename or "upload.pdf")
 
         try:
             result = self.processor.process_pdf(
-                pdf_path=tmp_path,
+                pdf_path=source,
                 output_dir=output_dir,
                 extraction_id=extraction_id,
             )
@@ -93,5 +91,5 @@ class PDFService:
 
             return result
         finally:
-            tmp_path.unlink(missing_ok=True)
+            source.close()
 
@@ -0,0 +1,218 @@
+"""Dávkové zpracování složky PDF jako pipeline (`python -m src.main --workers N`).
+
+Pipeline má tři fáze propojené omezenými frontami:
+
+1. příprava: extrakce textu a klasifikace stránek v process poolu (N procesů),
+2. AI: extrakce přes Gemini, nejvýše N dokumentů souběžně (async); záznamy
+   se průběžně zapisují do výstupů otevřených před extrakcí,
+3. zápis: dokončení CSV a dalších formátů a MRN PDF (jeden writer, běží ve vlákně).
+
+Plná fronta brzdí předchozí fázi, takže se v paměti drží nejvýš ~2N
+připravených dokumentů. Hloubky front se průběžně vypisují.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .memory_governor import MemoryGovernor
+from .pdf_document import PDFDocumentSession
+
+# Limit stránek, nad kterým CLI varuje (dříve kontrola přes pdfplumber)
+PAGE_COUNT_WARNING = 150
+# Interval výpisu hloubek front (sekundy)
+STATUS_INTERVAL = 10.0
+
+_STOP = None
+
+
+def _prepare_document(pdf_path: str) -> Dict[str, Any]:
+    """Worker: extrahuje text a klasifikaci všech stránek (výsledek se předá relaci v hlavním procesu)."""
+    with PDFDocumentSession(pdf_path) as session:
+        page_count = session.page_count
+        texts: Dict[int, str] = {}
+        flags: Dict[int, Dict[str, bool]] = {}
+        scores: Dict[int, Dict[str, float]] = {}
+        for page_num in range(1, page_count + 1):
+            texts[page_num] = session.page_text(page_num)
+            flags[page_num] = session.page_flags(page_num)
+            scores[page_num] = session.page_scores(page_num)
+    return {"page_count": page_count, "texts": texts, "flags": flags, "scores": scores}
+
+
+class BatchPipeline:
+    """Pipeline příprava → AI → zápis nad seznamem PDF souborů."""
+
+    def __init__(self, processor: Any, logger: Any, output_dir: Path, workers: int = 1):
+        """
+        Args:
+            processor: Instance `PDFProcessor`
+            logger: Instance `ExtractionLogger`
+            output_dir: Složka pro výstupní soubory
+            workers: Počet procesů přípravy a souběžných AI extrakcí
+        """
+        self.processor = processor
+        self.logger = logger
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+
+        self.processed_count = 0
+        self.error_count = 0
+        self.total_cost_usd = 0.0
+        self.total_tokens = 0
+        self.results: List[Dict[str, Any]] = []
+        # Počet dokumentů, které fáze právě zpracovává
+        self._active = {"prepare": 0, "ai": 0, "write": 0}
+
+    def run(self, pdf_files: List[Path]) -> Dict[str, Any]:
+        """Zpracuje soubory a vrátí souhrn relace."""
+        return asyncio.run(self.arun(pdf_files))
+
+    async def arun(self, pdf_files: List[Path]) -> Dict[str, Any]:
+        start_time = time.time()
+        path_queue: asyncio.Queue = asyncio.Queue()
+        for pdf_file in pdf_files:
+            path_queue.put_nowait(pdf_file)
+        ai_queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        queues = {"prepare": path_queue, "ai": ai_queue, "write": write_queue}
+
+        # "spawn": fork z procesu s vlákny (executor, gRPC klient Gemini) není bezpečný
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        monitor = asyncio.create_task(self._monitor(queues, len(pdf_files)))
+        try:
+            preparers = [asyncio.create_task(self._prepare_stage(pool, path_queue, ai_queue)) for _ in range(self.workers)]
+            ai_workers = [asyncio.create_task(self._ai_stage(ai_queue, write_queue)) for _ in range(self.workers)]
+            writer = asyncio.create_task(self._write_stage(write_queue))
+
+            await asyncio.gather(*preparers)
+            for _ in ai_workers:
+                await ai_queue.put(_STOP)
+            await asyncio.gather(*ai_workers)
+            await write_queue.put(_STOP)
+            await writer
+        finally:
+            monitor.cancel()
+            pool.shutdown(wait=True)
+
+        return {
+            "total_files": len(pdf_files),
+            "processed_count": self.processed_count,
+            "error_count": self.error_count,
+            "total_cost_usd": self.total_cost_usd,
+            "total_tokens": self.total_tokens,
+            "total_processing_time": time.time() - start_time,
+        }
+
+    async def _prepare_stage(self, pool: ProcessPoolExecutor, path_queue: asyncio.Queue, ai_queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while not path_queue.empty():
+            pdf_file = path_queue.get_nowait()
+            job = {
+                "path": pdf_file,
+                "extraction_id": self.logger.log_extraction_start(pdf_file.name, pdf_file),
+                "start_time": time.time(),
+            }
+            self._active["prepare"] += 1
+            try:
+                job["prepared"] = await loop.run_in_executor(pool, _prepare_document, str(pdf_file))
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            finally:
+                self._active["prepare"] -= 1
+
+            page_count = job["prepared"]["page_count"]
+            if page_count > PAGE_COUNT_WARNING:
+                print(f"⚠ Varování: {pdf_file.name} má {page_count} stránek, což překračuje limit {PAGE_COUNT_WARNING} stránek.")
+                print("  Soubor bude zpracován, ale může dojít k problémům.\n")
+            await ai_queue.put(job)
+
+    async def _ai_stage(self, ai_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await ai_queue.get()
+            if job is _STOP:
+                return
+            self._active["ai"] += 1
+            session: Optional[PDFDocumentSession] = None
+            try:
+                print(f"Zpracovávám: {job['path'].name}")
+                session = await loop.run_in_executor(None, PDFDocumentSession, job["path"])
+                prepared = job.pop("prepared")
+                job["memory"] = MemoryGovernor()
+                # Režim musí platit před preload (mimo "full" se texty stránek nedrží)
+                self.processor._plan_memory(session, job["memory"])
+                session.preload(prepared["texts"], prepared["flags"], prepared["scores"])
+                # Výstupy se otevřou před extrakcí, záznamy segmentů se zapisují průběžně
+                job["outputs"] = await loop.run_in_executor(None, self.processor._open_outputs, session, self.output_dir)
+                job["extraction"] = await self.processor._aextract_session(session, job["memory"])
+                job["session"] = session
+            except Exception as e:
+                if "outputs" in job:
+                    job["outputs"].discard()
+                if session is not None:
+                    session.close()
+                self._fail(job, e)
+                continue
+            finally:
+                self._active["ai"] -= 1
+            await write_queue.put(job)
+
+    async def _write_stage(self, write_queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await write_queue.get()
+            if job is _STOP:
+                return
+            self._active["write"] += 1
+            session = job["session"]
+            try:
+                extracted_data, page_types, usage_info = job["extraction"]
+                result = await loop.run_in_executor(
+                    None,
+                    self.processor._write_outputs,
+                    session, self.output_dir, job["extraction_id"], job["start_time"],
+                    extracted_data, page_types, usage_info, job["memory"], job["outputs"],
+                )
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            finally:
+                job["outputs"].discard()
+                session.close()
+                self._active["write"] -= 1
+
+            self.results.append(result)
+            usage_info = result.get("usage_info") or {}
+            self.total_cost_usd += usage_info.get("total_cost_usd", 0)
+            self.total_tokens += usage_info.get("total_tokens", 0)
+            self.processed_count += 1
+            print(f"✓ Hotovo: {job['path'].name} ({self.processed_count + self.error_count} zpracováno)\n")
+
+    def _fail(self, job: Dict[str, Any], error: Exception) -> None:
+        """Zaloguje chybu dokumentu; pipeline pokračuje dalšími soubory."""
+        self.logger.log_extraction_error(
+            extraction_id=job.get("extraction_id") or "unknown",
+            pdf_filename=job["path"].name,
+            error_message=str(error),
+            error_type=type(error).__name__,
+            processing_time=time.time() - job["start_time"],
+        )
+        print(f"✗ Chyba při zpracování {job['path'].name}: {error}\n", file=sys.stderr)
+        self.error_count += 1
+
+    async def _monitor(self, queues: Dict[str, asyncio.Queue], total: int) -> None:
+        """Průběžně vypisuje hloubky front a počet rozpracovaných dokumentů po fázích."""
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            stages = " | ".join(
+                f"{name}: {queues[name].qsize()} ve frontě, {self._active[name]} běží" for name in queues
+            )
+            print(f"[pipeline] {stages} | hotovo {self.processed_count + self.error_count}/{total}")
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Benchmark kroků zpracování PDF s regresní kontrolou proti JSON baseline.
+
+Měří `PDFProcessor` nad PDF z `src/test-files` a jejich syntetickými variantami
+(prvních 10 stránek, dokument zopakovaný 3×). Pro každý dokument a krok
+(parse, classify, fallback, csv, mrn_pdf a celý `process_pdf` jako pipeline)
+zapíše čas (wall), CPU čas procesu a špičku RSS. AI se nevolá: procesor běží
+s `LLM_PROVIDER=fake` bez latence, výsledky cache i kvóty jsou vypnuté.
+
+Každý dokument běží v novém procesu, aby se RSS a cache dokumentů neovlivňovaly.
+Špička RSS kroku se vzorkuje vláknem (`current_rss_bytes` po 5 ms). CPU čas
+nezahrnuje worker procesy extrakce textu, proto se ve výchozím stavu čte sériově
+(`--workers 1`).
+
+Použití:
+    python -m src.benchmark run --baseline                # uloží benchmarks/baseline.json
+    python -m src.benchmark run --compare benchmarks/baseline.json
+    python -m src.benchmark compare benchmarks/baseline.json cache/benchmarks/run-....json
+
+`compare` (i `run --compare`) skončí s kódem 1, pokud některý krok zpomalí
+nebo naroste v paměti víc než o `--threshold` (a zároveň víc než o šumový práh).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Benchmark nesmí volat Gemini ani vracet výsledky z cache (nastaví se před importem konfigurace)
+for _name, _value in (
+    ("LLM_PROVIDER", "fake"),
+    ("FAKE_LLM_LATENCY", "fixed:0"),
+    ("FAKE_LLM_ERRORS", ""),
+    ("FAKE_LLM_FILE_READY", "0"),
+    ("RESULT_CACHE_ENABLED", "0"),
+    ("GEMINI_QUOTA_ENABLED", "0"),
+):
+    os.environ[_name] = _value
+
+# Umožní spouštění jak přes `python3 -m src.benchmark`, tak i `python3 src/benchmark.py`
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.config import BENCHMARK_DIR, PROJECT_ROOT
+from src.memory_governor import current_rss_bytes
+
+STAGES = ("parse", "classify", "fallback", "csv", "mrn_pdf", "pipeline")
+TEST_FILES_DIR = Path(__file__).parent / "test-files"
+RUNS_DIR = PROJECT_ROOT / "cache" / "benchmarks"
+
+_MB = 1024 * 1024
+_RSS_SAMPLE_SECONDS = 0.005
+# Šumové prahy: menší absolutní rozdíl se za regresi nepovažuje
+_MIN_DELTA = {"wall_seconds": 0.05, "cpu_seconds": 0.05, "peak_rss_mb": 10.0}
+
+
+class _RssSampler:
+    """Vlákno, které během kroku vzorkuje RSS procesu a drží maximum."""
+
+    def __init__(self):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(_RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+@contextlib.contextmanager
+def _measure(results: Dict[str, Dict[str, float]], stage: str) -> Iterator[None]:
+    """Změří krok (wall, CPU, špička RSS); výpisy procesoru se potlačí."""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with _RssSampler() as sampler, contextlib.redirect_stdout(io.StringIO()):
+        yield
+    results[stage] = {
+        "wall_seconds": round(time.perf_counter() - wall_start, 4),
+        "cpu_seconds": round(time.process_time() - cpu_start, 4),
+        "peak_rss_mb": round(sampler.peak / _MB, 1),
+    }
+
+
+def _run_document(pdf_path: str, workers: int) -> Dict[str, Any]:
+    """Jeden průchod všemi kroky nad dokumentem (běží v samostatném procesu)."""
+    from src.pdf_document import PDFDocumentSession
+    from src.pdf_processor import PDFProcessor
+
+    processor = PDFProcessor()
+    stages: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        out = Path(out_dir)
+        with _measure(stages, "parse"):
+            session = PDFDocumentSession(pdf_path)
+            session.prefetch_texts(workers)
+            for page_num in range(1, session.page_count + 1):
+                session.page_text(page_num)
+        try:
+            with _measure(stages, "classify"):
+                mrn_pages = session.pages_of_type("MRN")
+            with _measure(stages, "fallback"):
+                records = processor.extract_data_without_ai(session.pdf_path, session=session)
+            with _measure(stages, "csv"):
+                processor.convert_to_csv(records, out / "records.csv")
+            with _measure(stages, "mrn_pdf"):
+                if mrn_pages:
+                    processor.save_extracted_pages(session.pdf_path, mrn_pages, out / "mrn.pdf", session=session)
+            page_count = session.page_count
+        finally:
+            session.close()
+
+        with _measure(stages, "pipeline"):
+            processor.process_pdf(Path(pdf_path), out / "pipeline")
+
+    return {"pages": page_count, "records": len(records), "mrn_pages": len(mrn_pages), "stages": stages}
+
+
+def _synthetic_variants(sources: List[Path], target_dir: Path) -> List[Path]:
+    """Varianty testovacích PDF: prvních 10 stránek a dokument zopakovaný 3×."""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    variants = []
+    for source in sources:
+        reader = PdfReader(str(source))
+        for suffix, pages in (
+            ("head10", list(range(min(10, len(reader.pages))))),
+            ("x3", list(range(len(reader.pages))) * 3),
+        ):
+            writer = PdfWriter()
+            for index in pages:
+                writer.add_page(reader.pages[index])
+            path = target_dir / f"{source.stem}__{suffix}.pdf"
+            with open(path, "wb") as f:
+                writer.write(f)
+            variants.append(path)
+    return variants
+
+
+def _summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Medián času a CPU přes opakování, maximum RSS."""
+    stages = {}
+    for stage in STAGES:
+        samples = [run["stages"][stage] for run in runs if stage in run["stages"]]
+        if not samples:
+            continue
+        stages[stage] = {
+            "wall_seconds": round(statistics.median(s["wall_seconds"] for s in samples), 4),
+            "cpu_seconds": round(statistics.median(s["cpu_seconds"] for s in samples), 4),
+            "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+        }
+    first = runs[0]
+    return {"pages": first["pages"], "records": first["records"], "mrn_pages": first["mrn_pages"], "stages": stages}
+
+
+def run_benchmark(files: List[Path], repeat: int = 3, workers: int = 1, synthetic: bool = True) -> Dict[str, Any]:
+    """
+    Spustí benchmark nad dokumenty.
+
+    Args:
+        files: PDF soubory
+        repeat: Počet opakování každého dokumentu (do výsledku jde medián)
+        workers: Počet procesů extrakce textu v kroku parse
+        synthetic: Přidat syntetické varianty dokumentů
+
+    Returns:
+        Výsledek ve formátu baseline
+    """
+    documents: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as variants_dir:
+        paths = list(files)
+        if synthetic:
+            paths += _synthetic_variants(files, Path(variants_dir))
+        # Nový proces pro každý průchod (spawn: žádné zděděné cache ani RSS)
+        context = get_context("spawn")
+        for path in paths:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(_run_document, str(path), workers).result())
+            documents[path.stem] = {"size_bytes": path.stat().st_size, **_summarize(runs)}
+            print(f"  → {path.stem}: " + ", ".join(
+                f"{stage} {values['wall_seconds']:.3f} s" for stage, values in documents[path.stem]["stages"].items()
+            ))
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "workers": workers,
+        "documents": documents,
+    }
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.25,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Porovná běh s baseline.
+
+    Regrese je zhoršení metriky o víc než `threshold` (podíl) a zároveň o víc
+    než šumový práh `_MIN_DELTA`.
+
+    Returns:
+        (regrese, dokumenty / kroky z baseline, které v běhu chybí)
+    """
+    regressions = []
+    missing = []
+    for name, base_doc in baseline.get("documents", {}).items():
+        doc = current.get("documents", {}).get(name)
+        if doc is None:
+            missing.append(name)
+            continue
+        for stage, base_stage in base_doc["stages"].items():
+            values = doc["stages"].get(stage)
+            if values is None:
+                missing.append(f"{name}/{stage}")
+                continue
+            for metric, min_delta in _MIN_DELTA.items():
+                before, after = base_stage.get(metric), values.get(metric)
+                if before is None or after is None:
+                    continue
+                if after - before > min_delta and after > before * (1 + threshold):
+                    regressions.append({
+                        "document": name,
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                        "change": round(after / before - 1, 3) if before else None,
+                    })
+    return regressions, missing
+
+
+def _report_comparison(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Vypíše porovnání; vrací návratový kód (1 = regrese)."""
+    regressions, missing = compare_results(baseline, current, threshold)
+    for item in missing:
+        print(f"Varování: V běhu chybí {item} z baseline")
+    if not regressions:
+        print(f"✓ Žádná regrese nad {threshold:.0%}")
+        return 0
+    print(f"✗ Regrese nad {threshold:.0%}:")
+    for r in regressions:
+        change = f"+{r['change']:.0%}" if r["change"] is not None else "nově"
+        print(f"  {r['document']} / {r['stage']} / {r['metric']}: {r['baseline']} → {r['current']} ({change})")
+    return 1
+
+
+def _load(path: Path) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save(result: Dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Výsledek uložen: {path}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Vstupní bod CLI (`run` / `compare`)."""
+    parser = argparse.ArgumentParser(description="Benchmark kroků zpracování PDF (AI se nevolá)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Spustí benchmark a uloží výsledek jako JSON")
+    run.add_argument("files", nargs="*", type=Path, help=f"PDF soubory (výchozí: {TEST_FILES_DIR})")
+    run.add_argument("-n", "--repeat", type=int, default=3, help="Počet opakování dokumentu (výchozí: 3)")
+    run.add_argument("-w", "--workers", type=int, default=1, help="Procesy extrakce textu (výchozí: 1)")
+    run.add_argument("--no-synthetic", action="store_true", help="Bez syntetických variant dokumentů")
+    run.add_argument("-o", "--output", type=Path, help=f"Výstupní JSON (výchozí: {RUNS_DIR}/run-<čas>.json)")
+    run.add_argument("--baseline", action="store_true", help=f"Uložit jako baseline ({BENCHMARK_DIR / 'baseline.json'})")
+    run.add_argument("--compare", type=Path, help="Po běhu porovnat s baseline")
+    run.add_argument("-t", "--threshold", type=float, default=0.25, help="Povolené zhoršení (výchozí: 0.25)")
+
+    compare = commands.add_parser("compare", help="Porovná běh s baseline (kód 1 = regrese)")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("current", type=Path)
+    compare.add_argument("-t", "--threshold", type=float, default=0.25, help="Povolené zhoršení (výchozí: 0.25)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        return _report_comparison(_load(args.baseline), _load(args.current), args.threshold)
+
+    files = args.files or sorted(p for p in TEST_FILES_DIR.iterdir() if p.suffix.lower() == ".pdf")
+    if not files:
+        print("Chyba: Nenalezeny žádné PDF soubory", file=sys.stderr)
+        return 2
+    result = run_benchmark(files, repeat=max(1, args.repeat), workers=args.workers, synthetic=not args.no_synthetic)
+
+    if args.output:
+        output = args.output
+    elif args.baseline:
+        output = BENCHMARK_DIR / "baseline.json"
+    else:
+        output = RUNS_DIR / f"run-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    _save(result, output)
+
+    if args.compare:
+        return _report_comparison(_load(args.compare), result, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
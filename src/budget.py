@@ -0,0 +1,197 @@
+"""Rozpočty nákladů na Gemini: na požadavek, na uživatele a den, na den.
+
+Před voláním Gemini se odhad ceny (`CostEstimator`) porovná se zbývajícími
+rozpočty a odhad se zarezervuje; po extrakci se rezervace nahradí skutečnou
+cenou. Útrata je v SQLite (`COST_BUDGET_DB`), takže ji sdílí všechny procesy.
+
+Když se odhad nevejde:
+- `COST_BUDGET_ACTION=reject`: `BudgetExceededError` (API vrátí 413 / 429),
+- `COST_BUDGET_ACTION=downgrade`: nejdražší levnější model, který se vejde,
+  a když žádný, deterministická extrakce bez AI (výsledek je degradovaný).
+
+Limit 0 znamená bez omezení. Když SQLite selže, rozpočty se nevynucují.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import (
+    COST_BUDGET_ACTION,
+    COST_BUDGET_DB,
+    COST_BUDGET_PER_DAY_USD,
+    COST_BUDGET_PER_REQUEST_USD,
+    COST_BUDGET_PER_USER_DAY_USD,
+)
+
+ACTION_REJECT = "reject"
+ACTION_DOWNGRADE = "downgrade"
+
+SCOPE_REQUEST = "request"
+SCOPE_USER_DAY = "user_day"
+SCOPE_DAY = "day"
+
+# Uživatel pro extrakce mimo API (CLI, dávky)
+LOCAL_USER = "local"
+
+
+class BudgetExceededError(RuntimeError):
+    """Odhad ceny extrakce překračuje rozpočet (a akce je `reject`)."""
+
+    def __init__(self, scope: str, estimate_usd: float, remaining_usd: float):
+        super().__init__(
+            f"Odhad ceny {estimate_usd:.4f} USD překračuje rozpočet ({scope}, zbývá {remaining_usd:.4f} USD)"
+        )
+        self.scope = scope
+        self.estimate_usd = estimate_usd
+        self.remaining_usd = remaining_usd
+
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d")
+
+
+class CostBudget:
+    """Kontrola a evidence útraty podle rozpočtů."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        per_request: float = COST_BUDGET_PER_REQUEST_USD,
+        per_user_day: float = COST_BUDGET_PER_USER_DAY_USD,
+        per_day: float = COST_BUDGET_PER_DAY_USD,
+        action: str = COST_BUDGET_ACTION,
+    ):
+        """
+        Args:
+            db_path: SQLite soubor s útratou
+            per_request: Limit jedné extrakce v USD (0 = bez limitu)
+            per_user_day: Denní limit jednoho uživatele v USD (0 = bez limitu)
+            per_day: Denní limit všech uživatelů v USD (0 = bez limitu)
+            action: `reject` nebo `downgrade`
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.per_request = per_request
+        self.per_user_day = per_user_day
+        self.per_day = per_day
+        self.action = action if action in (ACTION_REJECT, ACTION_DOWNGRADE) else ACTION_DOWNGRADE
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS spend (day TEXT, user TEXT, usd REAL, PRIMARY KEY (day, user))")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Zapisovací transakce (`BEGIN IMMEDIATE`: kontrola a rezervace jsou atomické napříč procesy)."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _remaining(self, conn: sqlite3.Connection, user: str, day: str) -> Tuple[Optional[float], Optional[str]]:
+        """Nejmenší zbývající rozpočet a jeho rozsah (None = bez limitů)."""
+        limits: List[Tuple[float, str]] = []
+        if self.per_request > 0:
+            limits.append((self.per_request, SCOPE_REQUEST))
+        if self.per_user_day > 0:
+            row = conn.execute("SELECT usd FROM spend WHERE day = ? AND user = ?", (day, user)).fetchone()
+            limits.append((self.per_user_day - (row[0] if row else 0.0), SCOPE_USER_DAY))
+        if self.per_day > 0:
+            spent = conn.execute("SELECT COALESCE(SUM(usd), 0) FROM spend WHERE day = ?", (day,)).fetchone()[0]
+            limits.append((self.per_day - spent, SCOPE_DAY))
+        if not limits:
+            return None, None
+        return min(limits)
+
+    def _add(self, conn: sqlite3.Connection, user: str, day: str, usd: float) -> None:
+        conn.execute(
+            "INSERT INTO spend (day, user, usd) VALUES (?, ?, ?) "
+            "ON CONFLICT (day, user) DO UPDATE SET usd = MAX(0, usd + excluded.usd)",
+            (day, user, usd),
+        )
+
+    def admit(self, user: Optional[str], estimates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Rozhodne o extrakci podle odhadů a zarezervuje odhad vybraného modelu.
+
+        Args:
+            user: Uživatel (None = `LOCAL_USER`)
+            estimates: Odhady `CostEstimator.estimate`; první je požadovaný model,
+                další jsou levnější alternativy seřazené od nejdražší
+
+        Returns:
+            {"action": allow | downgrade | deterministic, "model", "reserved_usd", "remaining_usd", "scope", "day"}
+
+        Raises:
+            BudgetExceededError: Odhad se nevejde a akce je `reject`
+        """
+        user = user or LOCAL_USER
+        day = _today()
+        requested = estimates[0]
+        try:
+            with self._transaction() as conn:
+                remaining, scope = self._remaining(conn, user, day)
+                decision = {"action": "allow", "model": requested["model"], "reserved_usd": 0.0,
+                            "remaining_usd": remaining, "scope": scope, "day": day, "user": user}
+                if remaining is None:
+                    return decision
+                remaining = decision["remaining_usd"] = round(remaining, 6)
+                fitting = [e for e in estimates if e["cost_usd"] <= remaining]
+                if fitting and fitting[0] is requested:
+                    chosen = requested
+                elif self.action == ACTION_REJECT:
+                    raise BudgetExceededError(scope, requested["cost_usd"], max(remaining, 0.0))
+                elif fitting:
+                    chosen = fitting[0]
+                    decision["action"] = "downgrade"
+                    decision["model"] = chosen["model"]
+                else:
+                    decision["action"] = "deterministic"
+                    decision["model"] = None
+                    return decision
+                decision["reserved_usd"] = chosen["cost_usd"]
+                self._add(conn, user, day, chosen["cost_usd"])
+                return decision
+        except sqlite3.Error as e:
+            print(f"Varování: Rozpočty nákladů nejsou dostupné, nevynucují se: {e}")
+            return {"action": "allow", "model": requested["model"], "reserved_usd": 0.0,
+                    "remaining_usd": None, "scope": None, "day": day, "user": user}
+
+    def settle(self, decision: Dict[str, Any], actual_usd: float) -> None:
+        """Nahradí rezervaci skutečnou cenou extrakce (i nulovou po chybě)."""
+        delta = actual_usd - decision.get("reserved_usd", 0.0)
+        if not delta:
+            return
+        try:
+            with self._transaction() as conn:
+                self._add(conn, decision["user"], decision["day"], delta)
+        except sqlite3.Error as e:
+            print(f"Varování: Nepodařilo se zapsat útratu: {e}")
+
+
+def create_cost_budget() -> Optional[CostBudget]:
+    """Vytvoří rozpočty podle konfigurace (None = žádný limit nebo nelze založit)."""
+    if not (COST_BUDGET_PER_REQUEST_USD > 0 or COST_BUDGET_PER_USER_DAY_USD > 0 or COST_BUDGET_PER_DAY_USD > 0):
+        return None
+    try:
+        return CostBudget(COST_BUDGET_DB)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Varování: Rozpočty nákladů nejsou dostupné: {e}")
+        return None
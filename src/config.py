@@ -26,3 +26,131 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 # Podporované modely: gemini-2.5-flash, gemini-2.5-flash-lite, gemini-1.5-pro
 AI_MODEL = os.getenv("AI_MODEL", "gemini-2.5-flash")  # Google Gemini 2.5 Flash (výchozí) - podporuje až 1M tokenů
 
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    """Načte booleovský přepínač z env proměnné ("0"/"false" = vypnuto)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip() not in {"0", "false", "False", "no", ""}
+
+
+# Cache výsledků extrakce (klíč = SHA-256 PDF + hash promptu a modelu)
+# Opakovaně nahraný stejný soubor se vrátí z cache bez volání Gemini.
+RESULT_CACHE_ENABLED = _env_flag("RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", PROJECT_ROOT / "cache" / "extraction_results"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "500"))
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "100"))
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", str(24 * 30)))  # 30 dní
+
+# Segmentovaná AI extrakce velkých balíků (rozdělení na hranicích Consignment Note
+# a souběžné zpracování segmentů v Gemini)
+SEGMENTED_EXTRACTION = _env_flag("SEGMENTED_EXTRACTION", True)
+SEGMENT_MIN_PAGES = int(os.getenv("SEGMENT_MIN_PAGES", "60"))  # od kolika stránek segmentovat
+SEGMENT_MAX_PAGES = int(os.getenv("SEGMENT_MAX_PAGES", "30"))  # cílová velikost segmentu
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "4"))  # max. souběžných Gemini volání
+
+# Do Gemini posílat jen relevantní stránky (Consignment Note + kandidáti na MRN
+# podle lokální klasifikace); Commercial Invoice a ostatní stránky se vynechají.
+PAGE_PREFILTER = _env_flag("PAGE_PREFILTER", True)
+
+# Gemini File API: deadline pro čekání na zpracování nahraného PDF (sekundy)
+GEMINI_FILE_READY_TIMEOUT = float(os.getenv("GEMINI_FILE_READY_TIMEOUT", "120"))
+
+# Paralelní extrakce textu stránek v process poolu (PyPDF2 je CPU-bound).
+# PAGE_TEXT_WORKERS=0 => podle počtu jader (max 4); 1 => vždy sériově.
+PAGE_TEXT_WORKERS = int(os.getenv("PAGE_TEXT_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+PAGE_TEXT_PARALLEL_MIN_PAGES = int(os.getenv("PAGE_TEXT_PARALLEL_MIN_PAGES", "40"))
+
+# Hybridní extrakce: nejdřív deterministická (regex) extrakce, do Gemini jen bloky
+# s nízkou jistotou; deterministickému výsledku se věří jen u layoutů z registru.
+HYBRID_EXTRACTION = _env_flag("HYBRID_EXTRACTION", False)
+HYBRID_MIN_CONFIDENCE = float(os.getenv("HYBRID_MIN_CONFIDENCE", "0.85"))
+HYBRID_TRUST_AFTER = int(os.getenv("HYBRID_TRUST_AFTER", "3"))  # shod s AI v řadě
+LAYOUT_REGISTRY_FILE = Path(os.getenv("LAYOUT_REGISTRY_FILE", PROJECT_ROOT / "cache" / "layout_registry.json"))
+
+# Další výstupní formáty záznamů vedle CSV (čárkou oddělené: jsonl, parquet, arrow, xlsx)
+OUTPUT_EXTRA_FORMATS = [f.strip().lower() for f in os.getenv("OUTPUT_EXTRA_FORMATS", "").split(",") if f.strip()]
+
+# Paměťový governor: odhad paměti jobu -> režim zpracování (full / page_streaming /
+# segmented); gc.collect() jen když RSS překročí práh
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "400"))
+GC_THRESHOLD_MB = float(os.getenv("GC_THRESHOLD_MB", "300"))
+
+# Kontextová cache Gemini: extrakční prompt jako system_instruction v cached content
+# (prompt pod minimem tokenů modelu pro cached content se necachuje, viz prompt_cache.py)
+GEMINI_PROMPT_CACHE = _env_flag("GEMINI_PROMPT_CACHE", True)
+GEMINI_PROMPT_CACHE_TTL = float(os.getenv("GEMINI_PROMPT_CACHE_TTL", "3600"))  # sekundy
+
+# Sdílený governor kvót Gemini (RPM/TPM token buckety a AIMD limit souběhu,
+# stav v SQLite sdílený procesy na jednom stroji). GEMINI_QUOTAS přepisuje limity
+# pro jednotlivé modely, např. {"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}
+GEMINI_QUOTA_ENABLED = _env_flag("GEMINI_QUOTA_ENABLED", True)
+GEMINI_QUOTA_DB = Path(os.getenv("GEMINI_QUOTA_DB", PROJECT_ROOT / "cache" / "gemini_quota.sqlite"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_QUOTAS = os.getenv("GEMINI_QUOTAS", "")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_QUOTA_MAX_WAIT = float(os.getenv("GEMINI_QUOTA_MAX_WAIT", "300"))  # sekundy
+
+# Odolnost volání Gemini: retry přechodných chyb (exponenciální backoff s jitterem)
+# a circuit breaker pro každý model; při otevřeném breakeru deterministická extrakce
+GEMINI_RETRY_ATTEMPTS = int(os.getenv("GEMINI_RETRY_ATTEMPTS", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))  # sekundy
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))  # sekundy
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "60"))  # sekundy
+
+# Hedging async volání Gemini: po percentilu nedávných latencí (pro danou velikost
+# dokumentu) se spustí duplicitní volání, použije se rychlejší
+GEMINI_HEDGING = _env_flag("GEMINI_HEDGING", False)
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_MAX_FRACTION = float(os.getenv("GEMINI_HEDGE_MAX_FRACTION", "0.1"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+# Router modelů: model pro každý dokument podle odhadu ceny, historie latence
+# a úspěšnosti; silnější model jen při neprošlé validaci výstupu levnějšího.
+# MODEL_ROUTER_MODELS = čárkou oddělené modely od nejslabšího po nejsilnější.
+MODEL_ROUTING = _env_flag("MODEL_ROUTING", False)
+MODEL_ROUTER_MODELS = [
+    m.strip() for m in os.getenv("MODEL_ROUTER_MODELS", "gemini-2.5-flash-lite,gemini-2.5-flash,gemini-1.5-pro").split(",")
+    if m.strip()
+]
+MODEL_ROUTER_POLICY = os.getenv("MODEL_ROUTER_POLICY", "cheapest_within_sla")  # | cheapest | fastest
+MODEL_ROUTER_SLA_SECONDS = float(os.getenv("MODEL_ROUTER_SLA_SECONDS", "120"))
+MODEL_ROUTER_MIN_SUCCESS_RATE = float(os.getenv("MODEL_ROUTER_MIN_SUCCESS_RATE", "0.8"))
+MODEL_ROUTER_MIN_SCORE = float(os.getenv("MODEL_ROUTER_MIN_SCORE", "0.6"))  # průměrné skóre záznamů
+MODEL_ROUTER_MAX_ESCALATIONS = int(os.getenv("MODEL_ROUTER_MAX_ESCALATIONS", "1"))
+
+# Rozpočty nákladů na Gemini (USD, 0 = bez limitu). Před extrakcí se porovnají
+# s odhadem ceny; COST_BUDGET_ACTION: reject (chyba) | downgrade (levnější model,
+# případně extrakce bez AI). Útrata je v SQLite sdíleném procesy.
+COST_BUDGET_PER_REQUEST_USD = float(os.getenv("COST_BUDGET_PER_REQUEST_USD", "0"))
+COST_BUDGET_PER_USER_DAY_USD = float(os.getenv("COST_BUDGET_PER_USER_DAY_USD", "0"))
+COST_BUDGET_PER_DAY_USD = float(os.getenv("COST_BUDGET_PER_DAY_USD", "0"))
+COST_BUDGET_ACTION = os.getenv("COST_BUDGET_ACTION", "downgrade")
+COST_BUDGET_DB = Path(os.getenv("COST_BUDGET_DB", PROJECT_ROOT / "cache" / "cost_budget.sqlite"))
+# Počet posledních záznamů logu extrakcí pro kalibraci odhadu tokenů a doby
+COST_ESTIMATOR_HISTORY = int(os.getenv("COST_ESTIMATOR_HISTORY", "2000"))
+
+# Poskytovatel LLM: gemini | fake (lokální fake Gemini bez sítě pro benchmarky a zátěžové testy)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").strip().lower()
+LLM_CASSETTE_DIR = Path(os.getenv("LLM_CASSETTE_DIR", PROJECT_ROOT / "cache" / "llm_cassettes"))
+LLM_RECORD_CASSETTES = _env_flag("LLM_RECORD_CASSETTES", False)  # ukládat odpovědi Gemini jako kazety
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:1.5:0.5")  # fixed:S | uniform:A:B | lognormal:MEDIAN:SIGMA
+FAKE_LLM_ERRORS = os.getenv("FAKE_LLM_ERRORS", "")  # např. 429=0.05,500=0.02,truncated=0.05
+FAKE_LLM_FILE_READY = float(os.getenv("FAKE_LLM_FILE_READY", "0.3"))  # sekundy ve stavu PROCESSING
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED")) if os.getenv("FAKE_LLM_SEED") else None
+
+# Benchmark kroků zpracování (`python -m src.benchmark`): složka s JSON baseline
+BENCHMARK_DIR = Path(os.getenv("BENCHMARK_DIR", PROJECT_ROOT / "benchmarks"))
+
+# Trasování kroků extrakce (spany v extraction logu, `timings` ve výsledku, hlavička Server-Timing)
+TRACING_ENABLED = _env_flag("TRACING_ENABLED", True)
+
+# Metriky Prometheus (`/metrics` v backend/app.py); stav workerů se sdílí přes soubory v METRICS_DIR
+METRICS_ENABLED = _env_flag("METRICS_ENABLED", True)
+METRICS_DIR = Path(os.getenv("METRICS_DIR", PROJECT_ROOT / "cache" / "metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # volitelný Bearer token pro scrape
@@ -0,0 +1,108 @@
+"""Odhad tokenů, ceny a doby extrakce ještě před voláním Gemini.
+
+Odhad se počítá z počtu stránek, které půjdou do Gemini (po předfiltru
+a segmentaci):
+
+- vstupní tokeny ≈ a + b · stránky, výstupní ≈ c · stránky, doba ≈ d + e · stránky,
+- koeficienty se kalibrují lineární regresí z historických záznamů
+  `extraction_success` v logu (pole `ai_input.pages_sent`, `tokens`,
+  `processing_time_seconds`); dokud jich není `_MIN_SAMPLES`, platí výchozí
+  koeficienty (prompt / 4 znaky na token, 258 tokenů na stránku PDF).
+
+`count_tokens` z Gemini API se nepoužívá: u PDF vyžaduje nahraný soubor,
+tedy právě to, čemu má odhad předejít.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .model_router import OUTPUT_TOKENS_PER_PAGE
+from .rate_governor import TOKENS_PER_PDF_PAGE
+
+# Minimální počet záznamů z logu pro kalibraci
+_MIN_SAMPLES = 10
+# Výchozí doba extrakce: režie + sekundy na odeslanou stránku
+_DEFAULT_BASE_SECONDS = 8.0
+_DEFAULT_SECONDS_PER_PAGE = 1.5
+
+
+def _linear_fit(points: List[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+    """Metoda nejmenších čtverců pro y = a + b·x; None, když x nemá rozptyl."""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return mean_y - slope * mean_x, slope
+
+
+class CostEstimator:
+    """Lineární model stránky → tokeny a doba; cena podle ceníku procesoru."""
+
+    def __init__(self, cost_fn: Callable[[str, int, int], float], prompt_chars: int):
+        """
+        Args:
+            cost_fn: Cena v USD pro (model, vstupní tokeny, výstupní tokeny)
+            prompt_chars: Délka extrakčního promptu (výchozí fixní část vstupu)
+        """
+        self.cost_fn = cost_fn
+        self.prompt_tokens = (prompt_chars // 4, float(TOKENS_PER_PDF_PAGE))
+        self.completion_tokens = (0.0, float(OUTPUT_TOKENS_PER_PAGE))
+        self.seconds = (_DEFAULT_BASE_SECONDS, _DEFAULT_SECONDS_PER_PAGE)
+        self.samples = 0
+
+    def calibrate(self, log_entries: Iterable[Dict[str, Any]]) -> int:
+        """
+        Přepočítá koeficienty ze záznamů `extraction_success` (bez zásahů cache).
+
+        Returns:
+            Počet použitých záznamů (0 = koeficienty zůstaly výchozí)
+        """
+        samples = []
+        for entry in log_entries:
+            if entry.get("event") != "extraction_success" or entry.get("cache_hit"):
+                continue
+            pages = ((entry.get("ai_input") or {}).get("pages_sent")) or 0
+            tokens = entry.get("tokens") or {}
+            if pages <= 0 or not tokens.get("input"):
+                continue
+            samples.append((pages, tokens["input"], tokens.get("output") or 0, entry.get("processing_time_seconds") or 0))
+        if len(samples) < _MIN_SAMPLES:
+            return 0
+
+        for attr, column in (("prompt_tokens", 1), ("completion_tokens", 2), ("seconds", 3)):
+            fit = _linear_fit([(s[0], s[column]) for s in samples])
+            if fit is not None and fit[1] >= 0:
+                setattr(self, attr, (max(fit[0], 0.0), fit[1]))
+        self.samples = len(samples)
+        return self.samples
+
+    def estimate(self, model: str, pages_sent: int, requests: int = 1, size_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Odhad jedné extrakce.
+
+        Args:
+            model: Model pro ceník
+            pages_sent: Počet stránek odeslaných do Gemini
+            requests: Počet volání (segmentů); fixní část vstupu se platí v každém
+            size_bytes: Velikost dokumentu (jen informativně do výsledku)
+        """
+        prompt_tokens = int(self.prompt_tokens[0] * requests + self.prompt_tokens[1] * pages_sent)
+        completion_tokens = int(self.completion_tokens[0] * requests + self.completion_tokens[1] * pages_sent)
+        return {
+            "model": model,
+            "pages_sent": pages_sent,
+            "requests": requests,
+            "size_bytes": size_bytes,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost_usd": round(self.cost_fn(model, prompt_tokens, completion_tokens), 6),
+            # Segmenty běží souběžně, doba odpovídá největšímu z nich
+            "seconds": round(self.seconds[0] + self.seconds[1] * pages_sent / max(requests, 1), 1),
+            "calibrated": self.samples > 0,
+            "samples": self.samples,
+        }
@@ -0,0 +1,234 @@
+"""Zdroj bajtů PDF dokumentu sdílený všemi kroky zpracování.
+
+`DocumentSource` drží dokument v jednom bufferu (memoryview nad bytes, nebo mmap
+nad souborem) a PyPDF2, hash pro cache i ostatní kroky čtou přímo z něj.
+
+Soubor na disku je potřeba jen pro upload celého PDF přes Gemini File API;
+u zdroje bez cesty se buffer zapíše do dočasného souboru až tehdy a jen jednou
+(`file_path`). Sub-PDF pro segmenty a výběr stránek se zapisují z readeru zvlášť.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+
+DEFAULT_DOCUMENT_NAME = "document.pdf"
+
+
+class _BufferStream(io.RawIOBase):
+    """Read-only stream nad memoryview (bez kopie celého bufferu) pro PyPDF2."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Neplatné whence: {whence}")
+        if pos < 0:
+            raise ValueError("Záporná pozice ve streamu")
+        self._pos = pos
+        return pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = bytes(self._view[self._pos:end]) if end > self._pos else b""
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._view = memoryview(b"")
+        super().close()
+
+
+def _spooled_buffer(fileobj: tempfile.SpooledTemporaryFile) -> Optional[Any]:
+    """
+    Vnitřní BytesIO spooled souboru, který je ještě v paměti (jinak None).
+
+    `_rolled` a `_file` nejsou veřejné API; odpovídají CPython 3.8–3.13. Když chybí,
+    vrací se None a `from_fileobj` obsah přečte obecnou cestou.
+    """
+    if getattr(fileobj, "_rolled", True):
+        return None
+    inner = getattr(fileobj, "_file", None)
+    return inner if hasattr(inner, "getbuffer") else None
+
+
+class DocumentSource:
+    """Jeden buffer s bajty PDF (bytes / memoryview / mmap) a volitelně cesta k souboru."""
+
+    def __init__(self, buffer: Any, name: str = DEFAULT_DOCUMENT_NAME, path: Optional[Path] = None, owner: Any = None):
+        """
+        Args:
+            buffer: Objekt podporující buffer protokol (bytes, bytearray, memoryview, mmap)
+            name: Název dokumentu (určuje názvy výstupů)
+            path: Cesta k souboru se stejným obsahem, pokud existuje
+            owner: Objekt, který se zavře spolu se zdrojem (např. mmap)
+        """
+        view = memoryview(buffer)
+        self._view = view if view.format == "B" and view.ndim == 1 else view.cast("B")
+        self.name = name
+        self.path = Path(path) if path is not None else None
+        self._owner = owner
+        self._temp_path: Optional[Path] = None
+        self._sha256: Optional[str] = None
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> "DocumentSource":
+        """Namapuje soubor do paměti (mmap); data se načítají líně podle potřeby."""
+        path = Path(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"", name=path.name, path=path)
+            # mmap zůstává platný i po zavření souboru
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, name=path.name, path=path, owner=mapped)
+
+    @classmethod
+    def from_fileobj(cls, fileobj: Any, name: str = DEFAULT_DOCUMENT_NAME, owned: bool = False) -> "DocumentSource":
+        """
+        Zdroj z otevřeného uploadu (Werkzeug `FileStorage.stream`, Starlette `UploadFile.file`).
+
+        BytesIO se použije přes `getbuffer()` bez kopie, stejně jako SpooledTemporaryFile
+        držený v paměti (`fileno()` by ho přesunul na disk). Soubor na disku (i spooled
+        po rolloveru) se namapuje přes mmap; jinak se obsah přečte.
+
+        Args:
+            fileobj: Otevřený binární soubor s PDF
+            name: Název dokumentu
+            owned: Zdroj soubor převezme a zavře ho sám (upload, který framework
+                zavře dřív, než zpracování skončí)
+        """
+        spooled = isinstance(fileobj, tempfile.SpooledTemporaryFile)
+        buffered = _spooled_buffer(fileobj) if spooled else fileobj
+        if hasattr(buffered, "getbuffer"):
+            return cls(buffered.getbuffer(), name=name, owner=fileobj if owned else None)
+        if spooled and getattr(fileobj, "_rolled", None) is not True:
+            # Stav spooled souboru neznáme; `fileno()` by ho mohl přesunout na disk
+            return cls._read_fileobj(fileobj, name, owned)
+        try:
+            fileobj.flush()
+            fileno = fileobj.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return cls._read_fileobj(fileobj, name, owned)
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) if os.fstat(fileno).st_size else None
+        if owned:
+            # mmap zůstává platný i po zavření souboru
+            fileobj.close()
+        if mapped is None:
+            return cls(b"", name=name)
+        return cls(mapped, name=name, owner=mapped)
+
+    @classmethod
+    def _read_fileobj(cls, fileobj: Any, name: str, owned: bool) -> "DocumentSource":
+        """Zdroj z kopie obsahu souboru (soubor bez `fileno()` nebo s neznámým stavem)."""
+        fileobj.seek(0)
+        data = fileobj.read()
+        if owned:
+            fileobj.close()
+        return cls(data, name=name)
+
+    @property
+    def size(self) -> int:
+        return len(self._view)
+
+    @property
+    def stem(self) -> str:
+        return Path(self.name).stem
+
+    def open_stream(self) -> io.RawIOBase:
+        """Vrátí nový seekovatelný stream nad bufferem (např. pro `PdfReader`)."""
+        return _BufferStream(self._view)
+
+    def sha256(self) -> str:
+        """Vrátí SHA-256 (hex) obsahu; počítá se jen jednou, přímo z bufferu."""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self._view).hexdigest()
+        return self._sha256
+
+    def file_path(self) -> Path:
+        """
+        Vrátí cestu k souboru s obsahem dokumentu.
+
+        Zdroj bez cesty (upload v paměti) se zapíše do dočasného souboru,
+        který se smaže při `close()`.
+        """
+        if self.path is None:
+            fd, tmp_name = tempfile.mkstemp(prefix="dsv_source_", suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._view)
+            self._temp_path = self.path = Path(tmp_name)
+        return self.path
+
+    def close(self) -> None:
+        """Uvolní buffer (a mmap) a smaže případný dočasný soubor."""
+        try:
+            self._view.release()
+        except BufferError:
+            # Nějaký stream ještě drží řez bufferu; mmap pak zavře až garbage collector
+            pass
+        if self._owner is not None:
+            try:
+                self._owner.close()
+            except (BufferError, ValueError):
+                pass
+            self._owner = None
+        if self._temp_path is not None:
+            try:
+                self._temp_path.unlink()
+            except OSError:
+                pass
+            self._temp_path = self.path = None
+
+    def __enter__(self) -> "DocumentSource":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+DocumentInput = Union[str, Path, bytes, bytearray, memoryview, mmap.mmap, DocumentSource]
+
+
+def as_document_source(document: DocumentInput, name: Optional[str] = None) -> Tuple[DocumentSource, bool]:
+    """
+    Převede vstup (cesta, bytes, memoryview, mmap, DocumentSource) na `DocumentSource`.
+
+    Args:
+        document: Vstupní dokument
+        name: Název dokumentu pro vstupy bez cesty
+
+    Returns:
+        Tuple (zdroj, True pokud byl zdroj vytvořen zde a volající ho má zavřít)
+    """
+    if isinstance(document, DocumentSource):
+        return document, False
+    if isinstance(document, (str, Path)):
+        return DocumentSource.from_path(document), True
+    return DocumentSource(document, name=name or DEFAULT_DOCUMENT_NAME), True
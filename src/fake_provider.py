@@ -0,0 +1,366 @@
+"""Lokální fake Gemini pro benchmarky a zátěžové testy bez sítě (`LLM_PROVIDER=fake`).
+
+Odpověď na dokument se vybírá takto:
+1. kazeta: uložená skutečná odpověď Gemini pro stejný obsah (SHA-256 PDF,
+   u textových požadavků SHA-256 promptu) v `LLM_CASSETTE_DIR`,
+2. jinak JSON složený z deterministické extrakce PDF (`extract_data_without_ai`).
+
+Chování se nastavuje z env:
+- `FAKE_LLM_LATENCY`: rozdělení doby generování, `fixed:S`, `uniform:A:B`
+  nebo `lognormal:MEDIAN:SIGMA` (sekundy),
+- `FAKE_LLM_ERRORS`: pravděpodobnosti chyb, např. `429=0.05,500=0.02,truncated=0.05`
+  (429 a 500 jako výjimky, které `resilience.classify_error` pozná jako
+  přechodné; `truncated` vrátí useknutý JSON),
+- `FAKE_LLM_FILE_READY`: jak dlouho je nahraný soubor ve stavu PROCESSING,
+- `FAKE_LLM_SEED`: seed generátoru (opakovatelné běhy).
+
+Kazety nahrává `CassetteRecorder` (`LLM_RECORD_CASSETTES=1` se skutečným Gemini).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import (
+    FAKE_LLM_ERRORS,
+    FAKE_LLM_FILE_READY,
+    FAKE_LLM_LATENCY,
+    FAKE_LLM_SEED,
+    LLM_CASSETTE_DIR,
+)
+from .llm_provider import LLMProvider
+from .rate_governor import TOKENS_PER_PDF_PAGE
+
+# Velikost části streamované odpovědi (znaky)
+_STREAM_CHUNK_CHARS = 256
+
+
+class ResourceExhausted(Exception):
+    """Simulovaná 429 (stejný název třídy jako výjimka google.api_core)."""
+
+    code = 429
+
+
+class InternalServerError(Exception):
+    """Simulovaná 500 (stejný název třídy jako výjimka google.api_core)."""
+
+    code = 500
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Převede `fixed:S`, `uniform:A:B` nebo `lognormal:MEDIAN:SIGMA` na vzorkovací funkci."""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Neplatné FAKE_LLM_LATENCY: {spec!r}")
+
+
+def parse_error_rates(spec: str) -> Dict[str, float]:
+    """`429=0.05,500=0.02,truncated=0.05` -> {"429": 0.05, ...}."""
+    rates: Dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, rate = item.partition("=")
+        if kind not in ("429", "500", "truncated"):
+            raise ValueError(f"Neznámý typ chyby ve FAKE_LLM_ERRORS: {kind!r}")
+        rates[kind] = float(rate)
+    return rates
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=completion_tokens,
+        cached_content_token_count=cached_tokens,
+        total_token_count=prompt_tokens + completion_tokens,
+    )
+
+
+class CassetteStore:
+    """Kazety odpovědí: jeden JSON soubor na obsah požadavku."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key[:32]}.json"
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.path(key).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, key: str, model: str, response: Any) -> None:
+        metadata = getattr(response, "usage_metadata", None)
+        entry = {
+            "model": model,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "text": response.text,
+            "usage": {
+                field: int(getattr(metadata, field, 0) or 0)
+                for field in ("prompt_token_count", "candidates_token_count", "cached_content_token_count")
+            },
+        }
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.path(key).with_suffix(".tmp")
+            tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.path(key))
+        except OSError as e:
+            print(f"Varování: Kazetu se nepodařilo uložit: {e}")
+
+
+def _request_key(contents: Any, path_for: Callable[[Any], Optional[Path]]) -> Tuple[str, Optional[Path], str]:
+    """Klíč kazety, cesta k PDF (nebo None) a textová část požadavku."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    texts = [part for part in parts if isinstance(part, str)]
+    for part in parts:
+        path = path_for(part)
+        if path is not None:
+            return _sha256_file(path), path, "\n".join(texts)
+    text = "\n".join(texts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest(), None, text
+
+
+class FakeProvider(LLMProvider):
+    """Fake Gemini: kazety nebo odpovědi z deterministické extrakce, simulovaná latence a chyby."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        derive_records: Optional[Callable[[Path], List[Dict[str, Any]]]] = None,
+        latency: str = FAKE_LLM_LATENCY,
+        errors: str = FAKE_LLM_ERRORS,
+        file_ready_seconds: float = FAKE_LLM_FILE_READY,
+        cassette_dir: Path = LLM_CASSETTE_DIR,
+        seed: Optional[int] = FAKE_LLM_SEED,
+    ):
+        """
+        Args:
+            derive_records: Deterministická extrakce z PDF pro požadavky bez kazety
+            latency: Rozdělení doby generování (viz `parse_latency`)
+            errors: Pravděpodobnosti chyb (viz `parse_error_rates`)
+            file_ready_seconds: Doba ve stavu PROCESSING po nahrání
+            cassette_dir: Složka s kazetami
+            seed: Seed generátoru náhodných čísel (None = náhodný)
+        """
+        self.derive_records = derive_records
+        self.sample_latency = parse_latency(latency)
+        self.error_rates = parse_error_rates(errors)
+        self.file_ready_seconds = file_ready_seconds
+        self.cassettes = CassetteStore(cassette_dir)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files: Dict[str, SimpleNamespace] = {}
+        self.stats = {"requests": 0, "cassette_hits": 0, "errors_429": 0, "errors_500": 0, "truncated": 0}
+
+    def model(self, model_name: str) -> "FakeModel":
+        return FakeModel(self, model_name)
+
+    def upload_file(self, path: str, mime_type: str) -> Any:
+        name = f"files/fake-{uuid.uuid4().hex[:12]}"
+        uploaded = SimpleNamespace(
+            name=name,
+            mime_type=mime_type,
+            path=Path(path),
+            ready_at=time.monotonic() + self.file_ready_seconds,
+            state=SimpleNamespace(name="PROCESSING"),
+        )
+        with self._lock:
+            self._files[name] = uploaded
+        return uploaded
+
+    def get_file(self, name: str) -> Any:
+        with self._lock:
+            uploaded = self._files.get(name)
+        if uploaded is None:
+            raise ValueError(f"Soubor {name} neexistuje")
+        if time.monotonic() >= uploaded.ready_at:
+            uploaded.state = SimpleNamespace(name="ACTIVE")
+        return uploaded
+
+    def delete_file(self, name: str) -> None:
+        with self._lock:
+            self._files.pop(name, None)
+
+    def _path_for(self, part: Any) -> Optional[Path]:
+        name = getattr(part, "name", None)
+        with self._lock:
+            uploaded = self._files.get(name) if isinstance(name, str) else None
+        return uploaded.path if uploaded is not None else None
+
+    def _plan_response(self) -> Tuple[float, Optional[str]]:
+        """Vylosuje latenci a případnou chybu (429 | 500 | truncated | None)."""
+        with self._lock:
+            self.stats["requests"] += 1
+            latency = max(0.0, self.sample_latency(self._rng))
+            roll = self._rng.random()
+        for kind, rate in self.error_rates.items():
+            if roll < rate:
+                return latency, kind
+            roll -= rate
+        return latency, None
+
+    def _respond(self, model_name: str, contents: Any, failure: Optional[str]) -> SimpleNamespace:
+        """Sestaví odpověď (kazeta, jinak deterministická extrakce), případně vyhodí chybu."""
+        if failure in ("429", "500"):
+            with self._lock:
+                self.stats[f"errors_{failure}"] += 1
+            if failure == "429":
+                raise ResourceExhausted("429 Resource has been exhausted (fake)")
+            raise InternalServerError("500 An internal error has occurred (fake)")
+
+        key, path, prompt = _request_key(contents, self._path_for)
+        cassette = self.cassettes.load(key)
+        if cassette is not None:
+            with self._lock:
+                self.stats["cassette_hits"] += 1
+            text = cassette["text"]
+            usage = cassette.get("usage") or {}
+            metadata = _usage(
+                usage.get("prompt_token_count", 0),
+                usage.get("candidates_token_count", 0),
+                usage.get("cached_content_token_count", 0),
+            )
+        else:
+            records = self.derive_records(path) if path is not None and self.derive_records else []
+            text = json.dumps(records, ensure_ascii=False)
+            prompt_tokens = len(prompt) // 4 + (self._page_count(path) * TOKENS_PER_PDF_PAGE if path else 0)
+            metadata = _usage(prompt_tokens, len(text) // 4)
+
+        if failure == "truncated":
+            with self._lock:
+                self.stats["truncated"] += 1
+            text = text[: max(1, len(text) * 2 // 3)]
+        return SimpleNamespace(text=text, usage_metadata=metadata, model=model_name)
+
+    @staticmethod
+    def _page_count(path: Path) -> int:
+        from PyPDF2 import PdfReader
+
+        try:
+            return len(PdfReader(str(path)).pages)
+        except Exception:
+            return 1
+
+
+class FakeModel:
+    """Klient fake modelu (rozhraní `genai.GenerativeModel`)."""
+
+    def __init__(self, provider: FakeProvider, model_name: str):
+        self.provider = provider
+        self.model_name = model_name
+
+    def generate_content(self, contents: Any, generation_config: Any = None, stream: bool = False) -> Any:
+        latency, failure = self.provider._plan_response()
+        time.sleep(latency)
+        response = self.provider._respond(self.model_name, contents, failure)
+        return FakeStreamResponse(response) if stream else response
+
+    async def generate_content_async(self, contents: Any, generation_config: Any = None, stream: bool = False) -> Any:
+        latency, failure = self.provider._plan_response()
+        await asyncio.sleep(latency)
+        # Deterministická extrakce čte PDF, neblokuje event loop
+        response = await asyncio.to_thread(self.provider._respond, self.model_name, contents, failure)
+        return FakeStreamResponse(response) if stream else response
+
+
+class FakeStreamResponse:
+    """Streamovaná odpověď: text po částech, `usage_metadata` jako u Gemini."""
+
+    def __init__(self, response: SimpleNamespace):
+        self.text = response.text
+        self.usage_metadata = response.usage_metadata
+
+    def __iter__(self):
+        for start in range(0, len(self.text), _STREAM_CHUNK_CHARS):
+            yield SimpleNamespace(text=self.text[start:start + _STREAM_CHUNK_CHARS])
+
+
+class CassetteRecorder(LLMProvider):
+    """Obal skutečného poskytovatele, který ukládá odpovědi jako kazety pro `FakeProvider`."""
+
+    name = "recorder"
+    # Model z kontextové cache by šel mimo obal a odpověď by se nenahrála
+    supports_prompt_cache = False
+
+    def __init__(self, inner: LLMProvider, cassette_dir: Path):
+        self.inner = inner
+        self.cassettes = CassetteStore(cassette_dir)
+        self._lock = threading.Lock()
+        self._paths: Dict[str, Path] = {}
+
+    def model(self, model_name: str) -> "_RecordingModel":
+        return _RecordingModel(self, model_name, self.inner.model(model_name))
+
+    def upload_file(self, path: str, mime_type: str) -> Any:
+        uploaded = self.inner.upload_file(path, mime_type)
+        with self._lock:
+            self._paths[uploaded.name] = Path(path)
+        return uploaded
+
+    def get_file(self, name: str) -> Any:
+        return self.inner.get_file(name)
+
+    def delete_file(self, name: str) -> None:
+        self.inner.delete_file(name)
+        with self._lock:
+            self._paths.pop(name, None)
+
+    def _path_for(self, part: Any) -> Optional[Path]:
+        name = getattr(part, "name", None)
+        with self._lock:
+            return self._paths.get(name) if isinstance(name, str) else None
+
+    def record(self, model_name: str, contents: Any, response: Any) -> None:
+        try:
+            key, _, _ = _request_key(contents, self._path_for)
+            self.cassettes.save(key, model_name, response)
+        except Exception as e:
+            print(f"Varování: Kazetu se nepodařilo uložit: {e}")
+
+
+class _RecordingModel:
+    """Klient modelu, který po každé nestreamované odpovědi uloží kazetu."""
+
+    def __init__(self, recorder: CassetteRecorder, model_name: str, inner: Any):
+        self.recorder = recorder
+        self.model_name = model_name
+        self.inner = inner
+
+    def generate_content(self, contents: Any, generation_config: Any = None, stream: bool = False) -> Any:
+        response = self.inner.generate_content(contents, generation_config=generation_config, stream=stream)
+        # Stream se čte až u volajícího; nahrávají se jen celé odpovědi
+        if not stream:
+            self.recorder.record(self.model_name, contents, response)
+        return response
+
+    async def generate_content_async(self, contents: Any, generation_config: Any = None, stream: bool = False) -> Any:
+        response = await self.inner.generate_content_async(contents, generation_config=generation_config, stream=stream)
+        if not stream:
+            self.recorder.record(self.model_name, contents, response)
+        return response
@@ -0,0 +1,136 @@
+"""Čekání na zpracování souboru nahraného přes Gemini File API.
+
+Po `genai.upload_file` je soubor ve stavu PROCESSING; generovat nad ním lze až
+ve stavu ACTIVE. Interval dotazů je adaptivní (výchozí prodleva podle velikosti
+souboru, exponenciální backoff se stropem) a celé čekání má deadline.
+
+Počet dotazů a doba čekání se zapisují do `ai_diagnostics`, aby bylo vidět,
+kolik latence připadá na File API a kolik na samotné generování.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .config import GEMINI_FILE_READY_TIMEOUT
+
+
+class FileNotReadyError(TimeoutError):
+    """Soubor nebyl do deadline ve stavu ACTIVE."""
+
+
+# Parametry backoffu (sekundy)
+_MIN_DELAY = 0.2
+_MAX_DELAY = 5.0
+_BACKOFF_FACTOR = 1.5
+
+
+def poll_delays(size_bytes: int) -> Tuple[float, float]:
+    """
+    Vrátí (první prodleva, strop prodlevy) podle velikosti souboru.
+
+    Malé soubory bývají zpracované skoro hned, velké skeny potřebují sekundy,
+    takže u nich nemá smysl zatěžovat API častými dotazy.
+    """
+    size_mb = max(0.0, size_bytes / (1024 * 1024))
+    first = min(_MIN_DELAY + 0.05 * size_mb, 2.0)
+    ceiling = min(1.0 + 0.25 * size_mb, _MAX_DELAY)
+    return first, max(first, ceiling)
+
+
+def _state_name(uploaded_file: Any) -> str:
+    state = getattr(uploaded_file, "state", None)
+    return getattr(state, "name", None) or str(state or "")
+
+
+def _check_final_state(uploaded_file: Any) -> None:
+    if _state_name(uploaded_file) == "FAILED":
+        raise ValueError(f"Nahrání souboru selhalo: {_state_name(uploaded_file)}")
+
+
+def wait_for_file_active(
+    uploaded_file: Any,
+    get_file: Callable[[str], Any],
+    size_bytes: int,
+    timeout: float = GEMINI_FILE_READY_TIMEOUT,
+    diagnostics: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Blokující čekání, dokud soubor neopustí stav PROCESSING.
+
+    Args:
+        uploaded_file: Objekt vrácený `genai.upload_file`
+        get_file: Funkce pro načtení aktuálního stavu (typicky `genai.get_file`)
+        size_bytes: Velikost nahraného souboru (určuje interval dotazů)
+        timeout: Deadline celého čekání v sekundách
+        diagnostics: Slovník, do kterého se zapíše `file_wait_polls` a `file_wait_seconds`
+
+    Returns:
+        Aktuální objekt souboru (stav ACTIVE)
+
+    Raises:
+        FileNotReadyError: Soubor nebyl hotový do deadline
+        ValueError: Zpracování souboru selhalo (stav FAILED)
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    delay, ceiling = poll_delays(size_bytes)
+    polls = 0
+
+    try:
+        while _state_name(uploaded_file) == "PROCESSING":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FileNotReadyError(
+                    f"Soubor {getattr(uploaded_file, 'name', '?')} není zpracovaný ani po {timeout:.0f} s"
+                )
+            time.sleep(min(delay, remaining))
+            uploaded_file = get_file(uploaded_file.name)
+            polls += 1
+            delay = min(delay * _BACKOFF_FACTOR, ceiling)
+    finally:
+        if diagnostics is not None:
+            diagnostics["file_wait_polls"] = polls
+            diagnostics["file_wait_seconds"] = round(time.monotonic() - start, 3)
+
+    _check_final_state(uploaded_file)
+    return uploaded_file
+
+
+async def await_file_active(
+    uploaded_file: Any,
+    get_file: Callable[[str], Any],
+    size_bytes: int,
+    timeout: float = GEMINI_FILE_READY_TIMEOUT,
+    diagnostics: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Neblokující varianta `wait_for_file_active` pro event loop.
+
+    `get_file` je synchronní funkce SDK; volá se přes `asyncio.to_thread`.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    delay, ceiling = poll_delays(size_bytes)
+    polls = 0
+
+    try:
+        while _state_name(uploaded_file) == "PROCESSING":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FileNotReadyError(
+                    f"Soubor {getattr(uploaded_file, 'name', '?')} není zpracovaný ani po {timeout:.0f} s"
+                )
+            await asyncio.sleep(min(delay, remaining))
+            uploaded_file = await asyncio.to_thread(get_file, uploaded_file.name)
+            polls += 1
+            delay = min(delay * _BACKOFF_FACTOR, ceiling)
+    finally:
+        if diagnostics is not None:
+            diagnostics["file_wait_polls"] = polls
+            diagnostics["file_wait_seconds"] = round(time.monotonic() - start, 3)
+
+    _check_final_state(uploaded_file)
+    return uploaded_file
@@ -0,0 +1,108 @@
+"""Hedging volání Gemini proti dlouhému chvostu latence.
+
+Když volání Gemini nedoběhne do zvoleného percentilu nedávných latencí
+pro stejnou velikost dokumentu, spustí se duplicitní volání a použije se to,
+které doběhne dřív; druhé se zruší (a jeho nahraný soubor smaže).
+
+- latence se sledují po skupinách podle počtu stránek (`PAGE_BUCKETS`),
+- hedge se nespouští, dokud skupina nemá `GEMINI_HEDGE_MIN_SAMPLES` měření,
+- podíl hedgů k voláním v okně posledních `_WINDOW` záznamů je omezen
+  `GEMINI_HEDGE_MAX_FRACTION`.
+
+Stav je lokální pro proces.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from .config import (
+    GEMINI_HEDGE_MAX_FRACTION,
+    GEMINI_HEDGE_MIN_SAMPLES,
+    GEMINI_HEDGE_PERCENTILE,
+    GEMINI_HEDGING,
+)
+
+# Horní hranice skupin podle počtu stránek (poslední skupina je bez omezení)
+PAGE_BUCKETS: Tuple[int, ...] = (5, 20, 60)
+# Počet uchovávaných latencí na skupinu a délka okna pro limit podílu hedge
+_SAMPLES_PER_BUCKET = 200
+_WINDOW = 200
+
+
+def page_bucket(page_count: int) -> str:
+    """Název skupiny pro počet stránek, např. "6-20" nebo "61+"."""
+    lower = 1
+    for upper in PAGE_BUCKETS:
+        if page_count <= upper:
+            return f"{lower}-{upper}"
+        lower = upper + 1
+    return f"{lower}+"
+
+
+class HedgingPolicy:
+    """Percentil latencí po skupinách stránek a limit podílu hedgovaných volání."""
+
+    def __init__(
+        self,
+        percentile: float = GEMINI_HEDGE_PERCENTILE,
+        max_fraction: float = GEMINI_HEDGE_MAX_FRACTION,
+        min_samples: int = GEMINI_HEDGE_MIN_SAMPLES,
+    ):
+        """
+        Args:
+            percentile: Percentil latence (0–100), po kterém se spustí hedge
+            max_fraction: Nejvyšší podíl hedgovaných volání v posledním okně
+            min_samples: Minimální počet měření skupiny, než se začne hedgovat
+        """
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = max(1, min_samples)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._recent: Deque[bool] = deque(maxlen=_WINDOW)
+
+    def record_latency(self, page_count: int, seconds: float) -> None:
+        """Zapíše dobu úspěšného volání."""
+        with self._lock:
+            bucket = self._latencies.setdefault(page_bucket(page_count), deque(maxlen=_SAMPLES_PER_BUCKET))
+            bucket.append(seconds)
+
+    def hedge_delay(self, page_count: int) -> Optional[float]:
+        """Za kolik sekund spustit hedge (None = pro tuto skupinu zatím ne)."""
+        with self._lock:
+            samples = sorted(self._latencies.get(page_bucket(page_count)) or ())
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(self.percentile / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def start_request(self) -> None:
+        """Započítá volání do okna pro limit podílu."""
+        with self._lock:
+            self._recent.append(False)
+
+    def try_reserve_hedge(self) -> bool:
+        """
+        Povolí hedge, pokud podíl hedgů k voláním v okně nepřekročí limit.
+
+        Dokud okno nemá `min_samples` volání, počítá se s `min_samples`
+        (po startu se tak nehedguje každé z prvních volání).
+        """
+        with self._lock:
+            hedges = sum(self._recent)
+            calls = len(self._recent) - hedges
+            if (hedges + 1) / max(calls, self.min_samples) > self.max_fraction:
+                return False
+            self._recent.append(True)
+            return True
+
+
+def create_hedging_policy() -> Optional[HedgingPolicy]:
+    """Vytvoří hedging podle konfigurace (None = vypnuto)."""
+    if not GEMINI_HEDGING:
+        return None
+    return HedgingPolicy()
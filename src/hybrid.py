@@ -0,0 +1,185 @@
+"""Hybridní extrakce: nejdřív deterministicky, Gemini jen tam, kde si nejsme jistí.
+
+Řada balíků má stabilní layout, ze kterého regex extrakce (`extract_data_without_ai`)
+vytáhne všechno. Každý záznam se proto ohodnotí podle úplnosti a konzistence polí
+a do Gemini jdou jen bloky (CN stránka + její MRN stránky) s nízkou jistotou.
+
+Deterministickému výsledku se věří jen u layoutů z registru (`LayoutRegistry`).
+Layout se do registru dostane sám: kdykoli běží AI i deterministická extrakce,
+výsledky se porovnají a po `HYBRID_TRUST_AFTER` shodách v řadě je layout důvěryhodný;
+jakákoli neshoda důvěru odebere. Záznam lze v JSON souboru i ručně připnout (`"pinned": true`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import HYBRID_TRUST_AFTER, LAYOUT_REGISTRY_FILE
+
+_CN_NUMBER_RE = re.compile(r"^\d{6,12}$")
+_HS_CODE_RE = re.compile(r"^\d{8}$")
+_NUMBER_RE = re.compile(r"^\d+(?:\.\d+)?$")
+
+# Váhy polí pro skóre záznamu (součet 1.0)
+FIELD_WEIGHTS = {
+    "consignment_note": 0.25,
+    "gross_weight_kg": 0.15,
+    "packages": 0.15,
+    "volume_m3": 0.15,
+    "mrn_pages": 0.15,
+    "hs_codes": 0.15,
+}
+
+
+def score_record(record: Dict[str, Any]) -> float:
+    """
+    Ohodnotí úplnost a formát polí deterministického záznamu.
+
+    Returns:
+        Skóre 0.0–1.0 (součet vah polí, která jsou vyplněná a mají očekávaný formát)
+    """
+    checks = {
+        "consignment_note": bool(_CN_NUMBER_RE.match(str(record.get("consignment_note") or ""))),
+        "gross_weight_kg": bool(_NUMBER_RE.match(str(record.get("gross_weight_kg") or ""))),
+        "packages": str(record.get("packages") or "").isdigit(),
+        "volume_m3": bool(_NUMBER_RE.match(str(record.get("volume_m3") or ""))),
+        "mrn_pages": bool(record.get("mrn_pages")),
+        "hs_codes": bool(record.get("hs_codes")) and all(_HS_CODE_RE.match(str(c)) for c in record["hs_codes"]),
+    }
+    return round(sum(FIELD_WEIGHTS[field] for field, ok in checks.items() if ok), 3)
+
+
+def block_confidence(records: List[Dict[str, Any]]) -> float:
+    """
+    Jistota deterministického výsledku jednoho bloku (jedna CN stránka).
+
+    Blok musí dát právě jeden záznam; jinak je výsledek nekonzistentní a skóre je 0.
+    """
+    if len(records) != 1:
+        return 0.0
+    return score_record(records[0])
+
+
+def layout_fingerprint(reader: Any, cn_page: int, sample_record: Optional[Dict[str, Any]]) -> str:
+    """
+    Otisk layoutu dokumentu: generátor PDF, rozměr CN stránky a pole, která regex extrakce našla.
+
+    Args:
+        reader: PyPDF2 `PdfReader`
+        cn_page: Číslo první Consignment Note stránky (1-based)
+        sample_record: Deterministický záznam této CN stránky (nebo None)
+
+    Returns:
+        Krátký hex otisk
+    """
+    try:
+        metadata = reader.metadata or {}
+        producer = str(metadata.get("/Producer") or "")
+        creator = str(metadata.get("/Creator") or "")
+    except Exception:
+        producer = creator = ""
+    try:
+        box = reader.pages[cn_page - 1].mediabox
+        size = f"{round(float(box.width))}x{round(float(box.height))}"
+    except Exception:
+        size = "?"
+    fields = sorted(k for k, v in (sample_record or {}).items() if v not in (None, "", []))
+    raw = "\n".join([producer, creator, size, ",".join(fields)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_number(value: Any) -> str:
+    text = str(value or "").strip().replace(" ", "").replace(",", ".")
+    try:
+        return f"{float(text):.3f}"
+    except ValueError:
+        return text
+
+
+def records_agree(deterministic: List[Dict[str, Any]], ai_records: List[Dict[str, Any]]) -> bool:
+    """Porovná deterministické a AI záznamy podle CN čísla, kusů, hmotnosti a objemu."""
+    def _key(record: Dict[str, Any]):
+        return (
+            str(record.get("consignment_note") or "").strip(),
+            str(record.get("packages") or "").strip(),
+            _normalize_number(record.get("gross_weight_kg")),
+            _normalize_number(record.get("volume_m3")),
+        )
+
+    if not deterministic or not ai_records:
+        return False
+    return sorted(map(_key, deterministic)) == sorted(map(_key, ai_records))
+
+
+class LayoutRegistry:
+    """Registr otisků layoutů, kterým se věří pro deterministickou extrakci (JSON soubor)."""
+
+    def __init__(self, path: Path, trust_after: int = 3):
+        """
+        Args:
+            path: Cesta k JSON souboru registru
+            trust_after: Počet shod AI a deterministické extrakce v řadě, po kterém je layout důvěryhodný
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.trust_after = trust_after
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Varování: Registr layoutů nelze načíst: {e}")
+            return {}
+
+    def _save(self, data: Dict[str, Dict[str, Any]]) -> None:
+        # Atomický zápis; souběžné procesy si mohou přepsat poslední aktualizaci,
+        # což u počítadla shod nevadí.
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Varování: Registr layoutů nelze uložit: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def is_trusted(self, fingerprint: str) -> bool:
+        entry = self._load().get(fingerprint) or {}
+        return bool(entry.get("pinned") or entry.get("trusted"))
+
+    def record_comparison(self, fingerprint: str, agreed: bool) -> Dict[str, Any]:
+        """Zapíše výsledek porovnání AI a deterministické extrakce a vrátí aktualizovaný záznam."""
+        data = self._load()
+        entry = data.setdefault(fingerprint, {"agreements": 0, "disagreements": 0, "trusted": False})
+        if agreed:
+            entry["agreements"] = entry.get("agreements", 0) + 1
+            entry["trusted"] = entry["agreements"] >= self.trust_after
+        else:
+            entry["disagreements"] = entry.get("disagreements", 0) + 1
+            entry["agreements"] = 0
+            entry["trusted"] = False
+        entry["last_seen"] = time.time()
+        self._save(data)
+        return entry
+
+
+def create_layout_registry() -> Optional[LayoutRegistry]:
+    """Vytvoří registr layoutů podle konfigurace (None, pokud nejde založit)."""
+    try:
+        return LayoutRegistry(LAYOUT_REGISTRY_FILE, trust_after=HYBRID_TRUST_AFTER)
+    except OSError as e:
+        print(f"Varování: Registr layoutů není dostupný: {e}")
+        return None
@@ -0,0 +1,174 @@
+"""Parsování JSON z odpovědi modelu: inkrementálně při streamování a obnova z poškozeného textu.
+
+Při `generate_content(stream=True)` přichází odpověď po částech. Parser drží
+jen rozpracovaný text aktuálního prvku pole a každý dokončený objekt (záznam
+Consignment Note) vrátí hned, jak se uzavře jeho poslední závorka. Sleduje
+řetězce a escape sekvence, takže závorky uvnitř hodnot hranice nerozbijí.
+Text před polem (markdown ```json, úvodní věta) se přeskočí.
+
+`scan_json_regions` slouží pro obnovu nevalidní odpovědi (text před/za JSON,
+useknutý výstup): najde vyvážené JSON bloky a u useknutých bloků připraví
+opravenou verzi uzavřenou za posledním kompletním objektem.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+_CLOSING = {"[": "]", "{": "}"}
+
+
+class IncrementalJSONArrayParser:
+    """Vrací objekty z JSON pole, jakmile jsou kompletní."""
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0  # pozice v `_buf`, odkud pokračuje skenování
+        self._depth = 0  # 0 = mimo pole, 1 = uvnitř pole, >1 = uvnitř prvku
+        self._in_string = False
+        self._escape = False
+        self._elem_start: Optional[int] = None
+        self.records_count = 0
+        self.closed = False  # pole se záznamy bylo uzavřeno (zbytek odpovědi se ignoruje)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Zpracuje další část odpovědi.
+
+        Args:
+            chunk: Text další části odpovědi
+
+        Returns:
+            Seznam objektů, které se v této části dokončily (v pořadí pole)
+        """
+        if self.closed or not chunk:
+            return []
+
+        buf = self._buf + chunk
+        records: List[Dict[str, Any]] = []
+        i = self._pos
+        length = len(buf)
+        while i < length:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "[" or ch == "{":
+                if self._depth == 1:
+                    self._elem_start = i
+                self._depth += 1
+            elif ch == "]" or ch == "}":
+                self._depth -= 1
+                if self._depth == 1 and self._elem_start is not None:
+                    record = self._decode(buf[self._elem_start:i + 1])
+                    if record is not None:
+                        records.append(record)
+                    self._elem_start = None
+                elif self._depth == 0 and self.records_count + len(records) > 0:
+                    # Konec pole se záznamy; pole bez objektů (např. "[1]" v úvodním textu)
+                    # přeskočíme a hledáme další.
+                    self.closed = True
+                    i += 1
+                    break
+            i += 1
+
+        # V bufferu necháme jen rozpracovaný prvek
+        keep_from = self._elem_start if self._elem_start is not None else i
+        self._buf = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._elem_start is not None:
+            self._elem_start = 0
+        self.records_count += len(records)
+        return records
+
+    @staticmethod
+    def _decode(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return obj if isinstance(obj, dict) else None
+
+
+def scan_json_regions(text: str) -> Tuple[List[Tuple[int, int]], List[str]]:
+    """
+    Najde kandidátní JSON bloky v textu.
+
+    Sleduje zásobník závorek a řetězce (včetně escape sekvencí) jen uvnitř bloku,
+    takže uvozovky v okolním textu nevadí. Blok, který se neuzavře (nesouhlasná
+    závorka nebo konec textu), se zahodí a hledání pokračuje hned za jeho
+    otevírací závorkou – osamocená `{` v úvodním textu tak nespolkne JSON za ní.
+    Bez takových bloků je to jeden průchod.
+
+    Args:
+        text: Odpověď modelu
+
+    Returns:
+        Tuple (seznam (start, end) vyvážených bloků v pořadí výskytu,
+        opravené texty useknutých bloků od vnějšího po vnitřní)
+    """
+    regions: List[Tuple[int, int]] = []
+    repairs: List[str] = []
+    pos = 0
+    while pos < len(text):
+        unclosed = _scan_from(text, pos, regions, repairs)
+        if unclosed is None:
+            break
+        pos = unclosed + 1
+    return regions, repairs
+
+
+def _scan_from(text: str, pos: int, regions: List[Tuple[int, int]], repairs: List[str]) -> Optional[int]:
+    """Skenuje od `pos`; vrací začátek bloku, který se neuzavřel (None = text dočten)."""
+    stack: List[str] = []
+    start = pos
+    in_string = False
+    escape = False
+    # Poslední místo, kde se uvnitř pole uzavřel kompletní objekt: (konec, zásobník v tu chvíli)
+    last_complete: Optional[Tuple[int, str]] = None
+
+    for i in range(pos, len(text)):
+        ch = text[i]
+        if not stack:
+            if ch == "[" or ch == "{":
+                stack.append(ch)
+                start = i
+                in_string = False
+                last_complete = None
+            continue
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "[" or ch == "{":
+            stack.append(ch)
+        elif ch == "]" or ch == "}":
+            if _CLOSING[stack[-1]] != ch:
+                return start
+            stack.pop()
+            if not stack:
+                regions.append((start, i + 1))
+            elif ch == "}" and stack[-1] == "[":
+                last_complete = (i + 1, "".join(stack))
+
+    if not stack:
+        return None
+    if last_complete is not None:
+        end, open_stack = last_complete
+        repairs.append(text[start:end] + "".join(_CLOSING[c] for c in reversed(open_stack)))
+    return start
@@ -0,0 +1,106 @@
+"""Poskytovatelé LLM pro extrakci: Gemini a lokální fake pro zátěžové testy.
+
+Procesor volá model přes `LLMProvider`:
+
+- `upload_file` / `get_file` / `delete_file`: práce se soubory (File API),
+- `model(name)`: klient s `generate_content(contents, generation_config, stream)`
+  a `generate_content_async(...)`; odpověď má `.text` a `.usage_metadata`
+  (stejné rozhraní jako `genai.GenerativeModel`).
+
+`LLM_PROVIDER` vybírá implementaci: `gemini` (výchozí) nebo `fake`
+(`FakeProvider`, bez sítě, viz `fake_provider.py`). S `LLM_RECORD_CASSETTES`
+se odpovědi Gemini ukládají jako kazety pro pozdější přehrání ve fake.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import GOOGLE_API_KEY, LLM_CASSETTE_DIR, LLM_PROVIDER, LLM_RECORD_CASSETTES
+
+
+class LLMProvider:
+    """Rozhraní poskytovatele: soubory a generování."""
+
+    name = "base"
+    # Podporuje kontextovou cache promptu (`prompt_cache.py`, jen Gemini)
+    supports_prompt_cache = False
+
+    def model(self, model_name: str) -> Any:
+        """Klient modelu s `generate_content` a `generate_content_async`."""
+        raise NotImplementedError
+
+    def upload_file(self, path: str, mime_type: str) -> Any:
+        """Nahraje soubor; vrací objekt s `.name` a `.state`."""
+        raise NotImplementedError
+
+    def get_file(self, name: str) -> Any:
+        """Aktuální stav nahraného souboru."""
+        raise NotImplementedError
+
+    def delete_file(self, name: str) -> None:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini přes `google.generativeai`."""
+
+    name = "gemini"
+    supports_prompt_cache = True
+
+    def __init__(self, api_key: Optional[str] = GOOGLE_API_KEY):
+        if not api_key:
+            raise ValueError(
+                "GOOGLE_API_KEY není nastaven!\n"
+                "Zkontrolujte soubor .env a ujistěte se, že obsahuje:\n"
+                "GOOGLE_API_KEY=vas_api_klic\n\n"
+                "API klíč získáte na: https://aistudio.google.com/apikey\n"
+                "Podrobnosti najdete v souboru INSTALACE.txt (Krok 1 a Krok 4).\n"
+                "Bez sítě lze pipeline spustit s LLM_PROVIDER=fake."
+            )
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+
+    def model(self, model_name: str) -> Any:
+        return self._genai.GenerativeModel(model_name)
+
+    def upload_file(self, path: str, mime_type: str) -> Any:
+        return self._genai.upload_file(path=path, mime_type=mime_type)
+
+    def get_file(self, name: str) -> Any:
+        return self._genai.get_file(name)
+
+    def delete_file(self, name: str) -> None:
+        self._genai.delete_file(name)
+
+
+def create_provider(
+    name: str = LLM_PROVIDER,
+    derive_records: Optional[Callable[[Path], List[Dict[str, Any]]]] = None,
+) -> LLMProvider:
+    """
+    Vytvoří poskytovatele podle konfigurace.
+
+    Args:
+        name: `gemini` nebo `fake`
+        derive_records: Deterministická extrakce z PDF (fake z ní skládá odpovědi bez kazety)
+
+    Raises:
+        ValueError: Neznámý poskytovatel nebo chybějící API klíč Gemini
+    """
+    if name == "fake":
+        from .fake_provider import FakeProvider
+
+        return FakeProvider(derive_records=derive_records)
+    if name != "gemini":
+        raise ValueError(f"Neznámý LLM_PROVIDER: {name!r} (podporováno: gemini, fake)")
+
+    provider: LLMProvider = GeminiProvider()
+    if LLM_RECORD_CASSETTES:
+        from .fake_provider import CassetteRecorder
+
+        provider = CassetteRecorder(provider, LLM_CASSETTE_DIR)
+    return provider
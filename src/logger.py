@@ -97,7 +97,8 @@ class ExtractionLogger:
         usage_info: Dict[str, Any],
         extracted_records_count: int,
         processing_time: float,
-        output_files: Dict[str, Optional[str]]
+        output_files: Dict[str, Optional[str]],
+        timings: Optional[Dict[str, Any]] = None,
     ):
         """
         Zaloguje úspěšné dokončení vytěžení.
@@ -109,6 +110,7 @@ class ExtractionLogger:
             extracted_records_count: Počet extrahovaných záznamů
             processing_time: Čas zpracování v sekundách
             output_files: Slovník s cestami k výstupním souborům
+            timings: Strom spanů kroků extrakce (`tracing.current_timings`, volitelné)
         """
         # Převod z USD na CZK
         USD_TO_CZK = 23.5
@@ -129,8 +131,15 @@ class ExtractionLogger:
                     "input": usage_info.get("prompt_tokens", 0),
                     "output": usage_info.get("completion_tokens", 0),
                     "total": usage_info.get("total_tokens", 0),
+                    "cached": usage_info.get("cached_tokens", 0),
                 },
                 "model": usage_info.get("model", "unknown"),
+                "routing": usage_info.get("routing"),
+                "ai_input": usage_info.get("ai_input"),
+                "preflight": usage_info.get("preflight"),
+                "cache_hit": bool((usage_info.get("cache") or {}).get("hit")),
+                "memory": usage_info.get("memory"),
+                "timings": timings,
                 "extracted_records_count": extracted_records_count,
                 "output_files": output_files,
             },
@@ -49,6 +49,12 @@ def set_request_context(
     _client_var.set(client)
 
 
+def get_request_id() -> Optional[str]:
+    """Vrátí request_id aktuálního requestu (None mimo request)."""
+
+    return _request_id_var.get()
+
+
 def clear_request_context() -> None:
     """Vyčistí request metadata z contextvars."""
 
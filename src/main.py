@@ -2,14 +2,14 @@
 """Hlavní skript pro zpracování PDF souborů."""
 import argparse
 import sys
-import time
 from pathlib import Path
-import pdfplumber
 
 # Umožní spouštění jak přes `python3 -m src.main`, tak i `python3 src/main.py`
 if __package__ in (None, ""):
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+from src.batch_pipeline import BatchPipeline
+from src.pdf_document import PDFDocumentSession
 from src.pdf_processor import PDFProcessor
 from src.config import INPUT_DIR, OUTPUT_DIR, PROJECT_ROOT
 from src.logger import ExtractionLogger
@@ -32,6 +32,17 @@ def main():
         default=str(OUTPUT_DIR),
         help=f"Složka pro výstupní soubory (výchozí: {OUTPUT_DIR})"
     )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Počet procesů pro přípravu PDF a souběžných AI extrakcí (výchozí: 1)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Jen odhadne tokeny, cenu a dobu extrakce složky (Gemini se nevolá, nic se nezapisuje)"
+    )
     
     args = parser.parse_args()
     
@@ -65,65 +76,26 @@ def main():
     logger = ExtractionLogger(log_file=PROJECT_ROOT / "logs" / "extraction_log.jsonl")
     
     try:
-        processor = PDFProcessor(logger=logger)
+        # Odhad (--dry-run) Gemini nevolá, klient ani API klíč nejsou potřeba
+        processor = PDFProcessor(logger=logger, with_llm=not args.dry_run)
     except ValueError as e:
         print(f"Chyba inicializace: {e}", file=sys.stderr)
         sys.exit(1)
     
-    results = []
-    processed_count = 0
-    error_count = 0
-    total_cost_usd = 0.0
-    total_tokens = 0
-    session_start_time = time.time()
+    if args.dry_run:
+        dry_run(processor, pdf_files)
+        return
     
-    for pdf_file in pdf_files:
-        extraction_id = None
-        extraction_start_time = time.time()
-        
-        try:
-            # Logování začátku vytěžení
-            extraction_id = logger.log_extraction_start(pdf_file.name, pdf_file)
-            
-            print(f"\n{'='*60}")
-            print(f"Zpracovávám: {pdf_file.name}")
-            print(f"{'='*60}")
-            
-            # Kontrola počtu stránek (max 150)
-            with pdfplumber.open(pdf_file) as pdf:
-                page_count = len(pdf.pages)
-                if page_count > 150:
-                    print(f"⚠ Varování: PDF má {page_count} stránek, což překračuje limit 150 stránek.")
-                    print(f"  Soubor bude zpracován, ale může dojít k problémům.\n")
-            
-            result = processor.process_pdf(pdf_file, output_dir, extraction_id=extraction_id)
-            results.append(result)
-            
-            # Aktualizace statistik
-            if result.get('usage_info'):
-                usage_info = result['usage_info']
-                total_cost_usd += usage_info.get('total_cost_usd', 0)
-                total_tokens += usage_info.get('total_tokens', 0)
-            
-            print(f"✓ Hotovo: {pdf_file.name} (soubor zachován pro testování)\n")
-            
-            processed_count += 1
-            
-        except Exception as e:
-            processing_time = time.time() - extraction_start_time
-            logger.log_extraction_error(
-                extraction_id=extraction_id or "unknown",
-                pdf_filename=pdf_file.name,
-                error_message=str(e),
-                error_type=type(e).__name__,
-                processing_time=processing_time
-            )
-            print(f"✗ Chyba při zpracování {pdf_file.name}: {e}\n", file=sys.stderr)
-            error_count += 1
-            continue
+    # Pipeline: příprava (process pool) → AI (async, max N souběžně) → zápis výstupů
+    pipeline = BatchPipeline(processor, logger, output_dir, workers=args.workers)
+    summary = pipeline.run(pdf_files)
+    processed_count = summary["processed_count"]
+    error_count = summary["error_count"]
+    total_cost_usd = summary["total_cost_usd"]
+    total_tokens = summary["total_tokens"]
     
     # Shrnutí
-    total_processing_time = time.time() - session_start_time
+    total_processing_time = summary["total_processing_time"]
     total_cost_czk = total_cost_usd * 23.5  # Převod USD na CZK
     
     print("\n" + "="*60)
@@ -148,6 +120,35 @@ def main():
     )
 
 
+def dry_run(processor: PDFProcessor, pdf_files: list):
+    """Vypíše odhad tokenů, ceny a doby extrakce pro každý soubor a celkem."""
+    total_tokens = 0
+    total_cost_usd = 0.0
+    total_seconds = 0.0
+    calibrated = processor.cost_estimator.samples
+    print(f"Odhad pro model {processor.model} "
+          f"({'kalibrováno z ' + str(calibrated) + ' extrakcí' if calibrated else 'výchozí koeficienty'}):\n")
+    print(f"{'Soubor':<40} {'Stran':>6} {'Do AI':>6} {'Tokeny':>10} {'USD':>10} {'Sekundy':>8}")
+    for pdf_file in sorted(pdf_files):
+        try:
+            with PDFDocumentSession(pdf_file) as session:
+                estimate = processor.estimate_extraction(session)
+                page_count = session.page_count
+        except Exception as e:
+            print(f"{pdf_file.name:<40} chyba: {e}", file=sys.stderr)
+            continue
+        total_tokens += estimate["total_tokens"]
+        total_cost_usd += estimate["cost_usd"]
+        total_seconds += estimate["seconds"]
+        print(f"{pdf_file.name[:40]:<40} {page_count:>6} {estimate['pages_sent']:>6} "
+              f"{estimate['total_tokens']:>10,} {estimate['cost_usd']:>10.4f} {estimate['seconds']:>8.0f}")
+    
+    print("\n" + "="*60)
+    print(f"Odhad celkem: {total_tokens:,} tokenů, {total_cost_usd * 23.5:.2f} Kč ({total_cost_usd:.6f} USD)")
+    print(f"Odhad doby (sekvenčně): {total_seconds:.0f} sekund")
+    print("="*60)
+
+
 if __name__ == "__main__":
     main()
 
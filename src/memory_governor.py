@@ -0,0 +1,147 @@
+"""Řízení paměti při zpracování PDF.
+
+Governor:
+- před zpracováním odhadne paměťovou náročnost jobu z velikosti souboru a počtu stránek,
+- podle rozpočtu `MEMORY_BUDGET_MB` zvolí režim zpracování
+  (`full` = vše v paměti, `page_streaming` = texty stránek se necachují,
+  `segmented` = navíc segmentovaná AI extrakce menších sub-PDF),
+- měří RSS po krocích (do extraction logu jde špička každého kroku),
+- plný `gc.collect()` spouští jen nad prahem `GC_THRESHOLD_MB`.
+
+Měří se RSS celého procesu; při souběžných jobech v jednom procesu jsou hodnoty
+kroků přibližné.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .config import GC_THRESHOLD_MB, MEMORY_BUDGET_MB
+from .tracing import span
+
+MODE_FULL = "full"
+MODE_PAGE_STREAMING = "page_streaming"
+MODE_SEGMENTED = "segmented"
+
+_MB = 1024 * 1024
+
+# Koeficienty odhadu (PyPDF2 drží naparsované objekty ~2.5× velikosti souboru,
+# texty a klasifikace stránek ~0.5 MB na stránku během extrakce)
+_BASE_MB = 60.0
+_FILE_FACTOR = 2.5
+_PAGE_MB = 0.5
+
+
+def current_rss_bytes() -> int:
+    """Aktuální RSS procesu v bajtech (0, pokud nejde zjistit)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Dosavadní maximum RSS procesu v bajtech (0, pokud nejde zjistit)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux vrací KB, macOS bajty
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def estimate_footprint_mb(size_bytes: int, page_count: int) -> float:
+    """Odhad paměti (MB), kterou zpracování dokumentu potřebuje v režimu `full`."""
+    return round(_BASE_MB + _FILE_FACTOR * size_bytes / _MB + _PAGE_MB * page_count, 1)
+
+
+def choose_mode(estimated_mb: float, budget_mb: float = MEMORY_BUDGET_MB) -> str:
+    """Zvolí režim zpracování podle odhadu a rozpočtu."""
+    if estimated_mb <= budget_mb * 0.5:
+        return MODE_FULL
+    if estimated_mb <= budget_mb:
+        return MODE_PAGE_STREAMING
+    return MODE_SEGMENTED
+
+
+def maybe_collect(threshold_mb: float = GC_THRESHOLD_MB) -> bool:
+    """Spustí `gc.collect()` jen pokud RSS překročí práh; vrací, zda se sbíralo."""
+    if current_rss_bytes() < threshold_mb * _MB:
+        return False
+    gc.collect()
+    return True
+
+
+class MemoryGovernor:
+    """Paměťový plán a měření jednoho jobu."""
+
+    def __init__(self, budget_mb: float = MEMORY_BUDGET_MB, gc_threshold_mb: float = GC_THRESHOLD_MB):
+        self.budget_mb = budget_mb
+        self.gc_threshold_mb = gc_threshold_mb
+        self.mode = MODE_FULL
+        self.estimated_mb: Optional[float] = None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.gc_collections = 0
+
+    def plan(self, size_bytes: int, page_count: int) -> str:
+        """Odhadne náročnost dokumentu a zvolí režim zpracování."""
+        self.estimated_mb = estimate_footprint_mb(size_bytes, page_count)
+        self.mode = choose_mode(self.estimated_mb, self.budget_mb)
+        if self.mode != MODE_FULL:
+            print(
+                f"  → Paměť: odhad {self.estimated_mb:.0f} MB při rozpočtu {self.budget_mb:.0f} MB, "
+                f"režim {self.mode}"
+            )
+        return self.mode
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Any]:
+        """
+        Změří RSS kroku: na začátku, na konci a špičku; krok je zároveň span trasování.
+
+        Špička je nové maximum procesu, pokud ho krok posunul, jinak větší z hodnot začátek/konec.
+        Vrací span kroku (viz `tracing.span`).
+        """
+        start_rss = current_rss_bytes()
+        start_peak = peak_rss_bytes()
+        start = time.perf_counter()
+        with span(name) as stage_span:
+            try:
+                yield stage_span
+            finally:
+                end_rss = current_rss_bytes()
+                end_peak = peak_rss_bytes()
+                peak = end_peak if end_peak > start_peak else max(start_rss, end_rss)
+                self.stages[name] = {
+                    "rss_start_mb": round(start_rss / _MB, 1),
+                    "rss_end_mb": round(end_rss / _MB, 1),
+                    "rss_peak_mb": round(peak / _MB, 1),
+                    "seconds": round(time.perf_counter() - start, 3),
+                }
+                stage_span.set(rss_peak_mb=self.stages[name]["rss_peak_mb"])
+
+    def collect_if_needed(self) -> bool:
+        """`gc.collect()` jen nad prahem; počet sběrů se zapíše do souhrnu."""
+        collected = maybe_collect(self.gc_threshold_mb)
+        if collected:
+            self.gc_collections += 1
+        return collected
+
+    def summary(self) -> Dict[str, Any]:
+        """Souhrn pro extraction log / usage_info."""
+        return {
+            "mode": self.mode,
+            "estimated_mb": self.estimated_mb,
+            "budget_mb": self.budget_mb,
+            "gc_threshold_mb": self.gc_threshold_mb,
+            "gc_collections": self.gc_collections,
+            "peak_rss_mb": max((s["rss_peak_mb"] for s in self.stages.values()), default=None),
+            "stages": self.stages,
+        }
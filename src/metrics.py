@@ -0,0 +1,395 @@
+"""Metriky ve formátu Prometheus pro endpoint `/metrics`.
+
+Modul drží čítače, gauge a histogramy:
+
+- zápis je bez zámků: každé vlákno píše do vlastního slovníku (`threading.local`),
+  zámek se bere jen při prvním zápisu vlákna do metriky,
+- procesy (uvicorn workery) si stav periodicky ukládají do `METRICS_DIR`
+  (`metrics-<host>-<pid>-<boot>.json`, každých `METRICS_FLUSH_SECONDS`;
+  náhodné `boot` odliší proces se znovu použitým PID i workery různých
+  strojů se sdíleným adresářem) a `/metrics` sečte soubory všech workerů,
+- čítače a histogramy ukončených procesů se přičtou do trvalého agregátu
+  (`aggregate.json`) a jejich soubory se smažou; gauge se počítají jen
+  u běžících procesů.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import METRICS_DIR, METRICS_FLUSH_SECONDS
+from .hedging import page_bucket
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REGISTRY: List["_Metric"] = []
+
+
+class _Metric:
+    """Společný základ: hodnoty po vláknech, klíčem je n-tice hodnot labelů."""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+        self._shards_lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _merge(self, total: Any, value: Any) -> Any:
+        return total + value
+
+    def collect(self) -> Dict[str, Any]:
+        """Součet přes vlákna; klíč je JSON seznam hodnot labelů."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[str, Any] = {}
+        for shard in shards:
+            # dict(...) je pod GIL atomická kopie, vlákno mezitím může dál zapisovat
+            for key, value in dict(shard).items():
+                key = json.dumps(key)
+                merged[key] = self._merge(merged[key], value) if key in merged else self._copy(value)
+        return merged
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value
+
+
+class Counter(_Metric):
+    """Monotónní čítač."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    """Okamžitá hodnota (součet přírůstků a úbytků přes vlákna)."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Histogram s pevnými hranicemi; hodnota je [počty po intervalech..., +Inf, součet]."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def _merge(self, total: Any, value: Any) -> Any:
+        return [a + b for a, b in zip(total, value)]
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return list(value)
+
+
+# -------- Metriky aplikace --------
+HTTP_REQUEST_SECONDS = Histogram(
+    "dsv_pdf_http_request_duration_seconds", "Doba HTTP požadavku podle routy",
+    ("method", "route", "status"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+EXTRACTION_SECONDS = Histogram(
+    "dsv_pdf_extraction_duration_seconds", "Doba extrakce dokumentu podle počtu stránek",
+    ("pages",),
+    (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+EXTRACTIONS = Counter(
+    "dsv_pdf_extractions_total", "Dokončené extrakce podle výsledku (ai, fallback, degraded, cache_hit, failure)",
+    ("outcome",),
+)
+GEMINI_REQUEST_SECONDS = Histogram(
+    "dsv_pdf_gemini_request_duration_seconds", "Doba generování Gemini podle modelu",
+    ("model", "method"),
+    (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+GEMINI_TOKENS = Counter("dsv_pdf_gemini_tokens_total", "Tokeny Gemini podle modelu", ("model", "kind"))
+GEMINI_COST_USD = Counter("dsv_pdf_gemini_cost_usd_total", "Cena volání Gemini v USD podle modelu", ("model",))
+JOBS_IN_FLIGHT = Gauge("dsv_pdf_jobs_in_flight", "Právě zpracovávané extrakce")
+UPLOAD_BYTES = Counter("dsv_pdf_upload_bytes_total", "Nahrané bajty PDF")
+UPLOAD_SIZE_BYTES = Histogram(
+    "dsv_pdf_upload_size_bytes", "Velikost nahraného PDF", (),
+    (100_000, 1_000_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000, 100_000_000),
+)
+
+
+def record_gemini_usage(usage_info: Optional[Dict[str, Any]]) -> None:
+    """Tokeny a cena jedné odpovědi Gemini (`PDFProcessor.calculate_cost`)."""
+    if not usage_info:
+        return
+    model = usage_info.get("model") or "unknown"
+    for kind, field in (("input", "prompt_tokens"), ("output", "completion_tokens"), ("cached", "cached_tokens")):
+        if usage_info.get(field):
+            GEMINI_TOKENS.inc(usage_info[field], model=model, kind=kind)
+    if usage_info.get("total_cost_usd"):
+        GEMINI_COST_USD.inc(usage_info["total_cost_usd"], model=model)
+
+
+def record_extraction(seconds: float, pages: int, outcome: str) -> None:
+    """Dokončená extrakce: doba podle skupiny stránek a výsledek."""
+    EXTRACTION_SECONDS.observe(seconds, pages=page_bucket(pages))
+    EXTRACTIONS.inc(outcome=outcome)
+
+
+# -------- Agregace přes procesy --------
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+
+
+_identity: Dict[str, Any] = {}
+# Snapshot z jiného stroje je mrtvý, když se dlouho neaktualizoval (PID tam ověřit nejde)
+_STALE_SECONDS = max(60.0, 12 * METRICS_FLUSH_SECONDS)
+_AGGREGATE_FILE = "aggregate.json"
+_AGGREGATE_LOCK = "aggregate.lock"
+_LOCK_STALE_SECONDS = 60.0
+
+
+def _process_start(pid: int) -> Optional[int]:
+    """Čas startu procesu v tikách od bootu (Linux `/proc`), jinde None."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # Název procesu v závorkách může obsahovat mezery
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_identity() -> Dict[str, Any]:
+    """Identita procesu pro snapshot; po forku se vytvoří nová."""
+    pid = os.getpid()
+    if _identity.get("pid") != pid:
+        _identity.clear()
+        _identity.update(
+            host=socket.gethostname(),
+            pid=pid,
+            started=_process_start(pid),
+            boot_id=uuid.uuid4().hex[:12],
+        )
+    return _identity
+
+
+def _snapshot_path(identity: Dict[str, Any]) -> Path:
+    host = re.sub(r"[^A-Za-z0-9_.-]", "_", identity["host"])
+    return METRICS_DIR / f"metrics-{host}-{identity['pid']}-{identity['boot_id']}.json"
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    tmp = path.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    tmp.replace(path)
+
+
+def flush() -> None:
+    """Uloží stav procesu do `METRICS_DIR` (atomicky přes dočasný soubor)."""
+    identity = _process_identity()
+    snapshot = {**identity, "written_at": time.time(), "metrics": {m.name: m.collect() for m in _REGISTRY}}
+    path = _snapshot_path(identity)
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        _write_json(path, snapshot)
+    except OSError as e:
+        print(f"Varování: Metriky se nepodařilo uložit: {e}")
+
+
+def start_exporter() -> None:
+    """Spustí periodické ukládání stavu procesu (jednou za proces, volá se při startu API)."""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is not None:
+            return
+
+        def _run() -> None:
+            while True:
+                time.sleep(METRICS_FLUSH_SECONDS)
+                flush()
+
+        _flusher = threading.Thread(target=_run, name="metrics-flush", daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _is_alive(snapshot: Dict[str, Any]) -> bool:
+    """Běží proces snapshotu? Na stejném stroji podle PID a času startu, jinak podle stáří snapshotu."""
+    if snapshot.get("host") != _process_identity()["host"]:
+        return time.time() - snapshot.get("written_at", 0) < _STALE_SECONDS
+    pid = snapshot.get("pid") or 0
+    if not _pid_alive(pid):
+        return False
+    # Stejné PID s jiným časem startu = PID znovu použil jiný proces
+    started = snapshot.get("started")
+    return started is None or _process_start(pid) in (None, started)
+
+
+def _load_snapshots() -> List[Tuple[Path, Dict[str, Any]]]:
+    snapshots = []
+    for path in METRICS_DIR.glob("metrics-*.json"):
+        try:
+            snapshots.append((path, json.loads(path.read_text(encoding="utf-8"))))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return snapshots
+
+
+def _load_aggregate() -> Dict[str, Any]:
+    try:
+        return json.loads((METRICS_DIR / _AGGREGATE_FILE).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {"metrics": {}, "folded": []}
+
+
+def _merge_into(metric: "_Metric", merged: Dict[str, Any], values: Dict[str, Any]) -> None:
+    for key, value in values.items():
+        merged[key] = metric._merge(merged[key], value) if key in merged else metric._copy(value)
+
+
+def _fold_dead(snapshots: List[Tuple[Path, Dict[str, Any]]], alive: Dict[Path, bool]) -> None:
+    """
+    Přičte čítače a histogramy ukončených procesů do agregátu a smaže jejich snapshoty.
+
+    Agregát se zapíše dřív, než se snapshoty smažou, a pamatuje si jejich soubory
+    (`folded`), takže souběžný scrape nic nezapočítá dvakrát. Slučování běží pod
+    zámkem (adresář `aggregate.lock`); je-li zámek obsazený, snapshoty počkají na další scrape.
+    """
+    dead = [(path, snapshot) for path, snapshot in snapshots if not alive[path]]
+    if not dead:
+        return
+    lock = METRICS_DIR / _AGGREGATE_LOCK
+    try:
+        if time.time() - lock.stat().st_mtime > _LOCK_STALE_SECONDS:
+            # Zámek po procesu, který skončil uprostřed slučování
+            shutil.rmtree(lock, ignore_errors=True)
+    except OSError:
+        pass
+    try:
+        lock.mkdir()
+    except OSError:
+        return
+    try:
+        aggregate = _load_aggregate()
+        # Smazané snapshoty už v `folded` být nemusí
+        folded = [name for name in aggregate.get("folded", []) if (METRICS_DIR / name).exists()]
+        metrics = aggregate.get("metrics", {})
+        fresh = [(path, snapshot) for path, snapshot in dead if path.name not in folded]
+        for metric in _REGISTRY:
+            if metric.kind == "gauge":
+                continue
+            for _, snapshot in fresh:
+                _merge_into(metric, metrics.setdefault(metric.name, {}), snapshot.get("metrics", {}).get(metric.name) or {})
+        _write_json(METRICS_DIR / _AGGREGATE_FILE, {"metrics": metrics, "folded": folded + [p.name for p, _ in fresh]})
+        for path, _ in dead:
+            path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Varování: Metriky ukončených procesů se nepodařilo sloučit: {e}")
+    finally:
+        shutil.rmtree(lock, ignore_errors=True)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = [(n, v) for n, v in zip(names, values)] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_metrics() -> str:
+    """Text pro `/metrics`: stav všech workerů (včetně aktuálního) sečtený po metrikách."""
+    flush()
+    # Snapshoty se čtou před agregátem: co v něm už je, má zapsané ve `folded`
+    snapshots = _load_snapshots()
+    aggregate = _load_aggregate()
+    folded = set(aggregate.get("folded", []))
+    snapshots = [(path, snapshot) for path, snapshot in snapshots if path.name not in folded]
+    alive = {path: _is_alive(snapshot) for path, snapshot in snapshots}
+
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        merged: Dict[str, Any] = {}
+        if metric.kind != "gauge":
+            _merge_into(metric, merged, aggregate.get("metrics", {}).get(metric.name) or {})
+        for path, snapshot in snapshots:
+            if metric.kind == "gauge" and not alive[path]:
+                continue
+            _merge_into(metric, merged, snapshot.get("metrics", {}).get(metric.name) or {})
+
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if not merged and not metric.labelnames and metric.kind != "histogram":
+            lines.append(f"{metric.name} 0")
+        for key in sorted(merged):
+            label_values = json.loads(key)
+            value = merged[key]
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(metric.labelnames, label_values)} {_format(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric.buckets) + [float("inf")], value[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format(bound)
+                lines.append(f"{metric.name}_bucket{_labels(metric.labelnames, label_values, [('le', le)])} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labelnames, label_values)} {_format(value[-1])}")
+            lines.append(f"{metric.name}_count{_labels(metric.labelnames, label_values)} {cumulative}")
+
+    _fold_dead(snapshots, alive)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,207 @@
+"""Výběr modelu Gemini pro dokument podle ceny, latence a úspěšnosti.
+
+Router vybírá model pro každý dokument:
+
+- kandidáti jsou `MODEL_ROUTER_MODELS` (seřazené od nejslabšího po nejsilnější);
+  vyřadí se modely s otevřeným circuit breakerem, s úspěšností pod
+  `MODEL_ROUTER_MIN_SUCCESS_RATE` a ty, do jejichž kontextu se požadavek nevejde,
+- cena se odhadne z počtu stránek a tokenů promptu podle ceníku procesoru,
+  latence z nedávných volání modelu (sekundy na stránku, 90. percentil),
+- politika `MODEL_ROUTER_POLICY`: `cheapest_within_sla` (nejlevnější model,
+  který podle historie stihne `MODEL_ROUTER_SLA_SECONDS`), `cheapest`, `fastest`.
+
+Silnější model se volá jen tehdy, když výstup levnějšího neprojde validací
+(`validate_extraction`). Rozhodnutí i důvod se ukládají do `usage_info["routing"]`.
+
+Historie je lokální pro proces.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import (
+    MODEL_ROUTER_MIN_SCORE,
+    MODEL_ROUTER_MIN_SUCCESS_RATE,
+    MODEL_ROUTER_MODELS,
+    MODEL_ROUTER_POLICY,
+    MODEL_ROUTER_SLA_SECONDS,
+    MODEL_ROUTING,
+)
+from .hybrid import score_record
+from .rate_governor import TOKENS_PER_PDF_PAGE
+from .resilience import circuit_breaker_for
+
+POLICY_CHEAPEST_WITHIN_SLA = "cheapest_within_sla"
+POLICY_CHEAPEST = "cheapest"
+POLICY_FASTEST = "fastest"
+POLICIES = (POLICY_CHEAPEST_WITHIN_SLA, POLICY_CHEAPEST, POLICY_FASTEST)
+
+# Velikost kontextového okna modelů (vstupní tokeny)
+CONTEXT_TOKENS = {
+    "gemini-2.5-flash": 1_048_576,
+    "gemini-2.5-flash-lite": 1_048_576,
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+}
+_DEFAULT_CONTEXT_TOKENS = 1_048_576
+# Odhad výstupních tokenů na odeslanou stránku (JSON záznamy CN + HS kódy)
+OUTPUT_TOKENS_PER_PAGE = 60
+# Počet uchovávaných volání na model a minimum pro odhad latence / úspěšnosti
+_HISTORY = 100
+_MIN_SAMPLES = 5
+_LATENCY_PERCENTILE = 90
+
+
+def estimate_document_tokens(prompt_chars: int, pages: int) -> Tuple[int, int]:
+    """Odhad (vstupní, výstupní) tokeny extrakce dokumentu s `pages` odeslanými stránkami."""
+    return prompt_chars // 4 + pages * TOKENS_PER_PDF_PAGE, pages * OUTPUT_TOKENS_PER_PAGE
+
+
+def validate_extraction(records: List[Dict[str, Any]], usage_info: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Ověří výstup modelu pro rozhodnutí o eskalaci.
+
+    Returns:
+        None, pokud výstup prošel, jinak důvod (no_records, invalid_json, low_score)
+    """
+    ai_diag = (usage_info or {}).get("ai_diagnostics") or {}
+    if not ai_diag.get("ai_json_parsed"):
+        return "invalid_json"
+    if not records:
+        return "no_records"
+    score = sum(score_record(record) for record in records) / len(records)
+    if score < MODEL_ROUTER_MIN_SCORE:
+        return "low_score"
+    return None
+
+
+class ModelRouter:
+    """Volba modelu pro dokument a historie latence / úspěšnosti jednotlivých modelů."""
+
+    def __init__(
+        self,
+        cost_fn: Callable[[str, int, int], float],
+        models: Optional[List[str]] = None,
+        policy: str = MODEL_ROUTER_POLICY,
+        sla_seconds: float = MODEL_ROUTER_SLA_SECONDS,
+        min_success_rate: float = MODEL_ROUTER_MIN_SUCCESS_RATE,
+    ):
+        """
+        Args:
+            cost_fn: Cena v USD pro (model, vstupní tokeny, výstupní tokeny)
+            models: Modely od nejslabšího po nejsilnější (výchozí `MODEL_ROUTER_MODELS`)
+            policy: Jedna z `POLICIES`
+            sla_seconds: Cílová doba extrakce dokumentu
+            min_success_rate: Minimální podíl úspěšných volání modelu
+        """
+        if policy not in POLICIES:
+            print(f"Varování: Neznámá politika routeru {policy!r}, použije se {POLICY_CHEAPEST_WITHIN_SLA}")
+            policy = POLICY_CHEAPEST_WITHIN_SLA
+        self.cost_fn = cost_fn
+        self.models = list(models or MODEL_ROUTER_MODELS)
+        self.policy = policy
+        self.sla_seconds = sla_seconds
+        self.min_success_rate = min_success_rate
+        self._lock = threading.Lock()
+        # model -> deque (sekundy na stránku nebo None pro neúspěch)
+        self._history: Dict[str, Deque[Optional[float]]] = {model: deque(maxlen=_HISTORY) for model in self.models}
+
+    def record(self, model: str, pages: int, seconds: float, success: bool) -> None:
+        """Zapíše výsledek extrakce modelem (neúspěch = chyba nebo neprošlá validace)."""
+        with self._lock:
+            history = self._history.setdefault(model, deque(maxlen=_HISTORY))
+            history.append(seconds / max(pages, 1) if success else None)
+
+    def model_stats(self, model: str, pages: int) -> Dict[str, Any]:
+        """Úspěšnost a předpokládaná doba extrakce `pages` stránek (None = málo dat)."""
+        with self._lock:
+            history = list(self._history.get(model) or ())
+        latencies = sorted(s for s in history if s is not None)
+        success_rate = len(latencies) / len(history) if len(history) >= _MIN_SAMPLES else None
+        predicted = None
+        if len(latencies) >= _MIN_SAMPLES:
+            index = min(len(latencies) - 1, math.ceil(_LATENCY_PERCENTILE / 100 * len(latencies)) - 1)
+            predicted = round(latencies[index] * pages, 2)
+        return {"success_rate": success_rate, "predicted_seconds": predicted, "samples": len(history)}
+
+    def route(self, pages: int, input_tokens: int, output_tokens: int, request_tokens: int) -> Dict[str, Any]:
+        """
+        Vybere model pro dokument.
+
+        Args:
+            pages: Počet stránek odeslaných do Gemini
+            input_tokens: Odhad vstupních tokenů celé extrakce
+            output_tokens: Odhad výstupních tokenů celé extrakce
+            request_tokens: Odhad vstupních tokenů největšího jednotlivého požadavku (segmentu)
+
+        Returns:
+            Rozhodnutí: model, důvod, politika, odhady a posouzení kandidátů
+        """
+        candidates = []
+        for model in self.models:
+            stats = self.model_stats(model, pages)
+            candidate = {
+                "model": model,
+                "estimated_cost_usd": round(self.cost_fn(model, input_tokens, output_tokens), 6),
+                **stats,
+            }
+            if request_tokens > CONTEXT_TOKENS.get(model, _DEFAULT_CONTEXT_TOKENS):
+                candidate["excluded"] = "context"
+            elif circuit_breaker_for(model).state == "open":
+                candidate["excluded"] = "circuit_open"
+            elif stats["success_rate"] is not None and stats["success_rate"] < self.min_success_rate:
+                candidate["excluded"] = "success_rate"
+            candidates.append(candidate)
+
+        model, reason = self._choose([c for c in candidates if "excluded" not in c])
+        return {
+            "model": model,
+            "reason": reason,
+            "policy": self.policy,
+            "sla_seconds": self.sla_seconds,
+            "pages": pages,
+            "estimated_input_tokens": input_tokens,
+            "estimated_output_tokens": output_tokens,
+            "candidates": candidates,
+            "escalations": [],
+        }
+
+    def _choose(self, eligible: List[Dict[str, Any]]) -> Tuple[Optional[str], str]:
+        """Model podle politiky z vyhovujících kandidátů (None = žádný)."""
+        if not eligible:
+            return None, "no_eligible_model"
+        by_cost = sorted(eligible, key=lambda c: c["estimated_cost_usd"])
+        # Model bez historie se bere jako rychlý, jinak by se nikdy nezkusil
+        by_latency = sorted(
+            eligible,
+            key=lambda c: (c["predicted_seconds"] if c["predicted_seconds"] is not None else 0.0, c["estimated_cost_usd"]),
+        )
+        if self.policy == POLICY_CHEAPEST:
+            return by_cost[0]["model"], "cheapest"
+        if self.policy == POLICY_FASTEST:
+            return by_latency[0]["model"], "fastest"
+        for candidate in by_cost:
+            predicted = candidate["predicted_seconds"]
+            if predicted is None:
+                return candidate["model"], "cheapest_no_latency_history"
+            if predicted <= self.sla_seconds:
+                return candidate["model"], "cheapest_within_sla"
+        return by_latency[0]["model"], "sla_unreachable_fastest"
+
+    def escalation_for(self, model: str) -> Optional[str]:
+        """Nejbližší silnější model (None = žádný není)."""
+        if model not in self.models:
+            return None
+        index = self.models.index(model)
+        return self.models[index + 1] if index + 1 < len(self.models) else None
+
+
+def create_model_router(cost_fn: Callable[[str, int, int], float]) -> Optional[ModelRouter]:
+    """Vytvoří router podle konfigurace (None = vypnuto, používá se `AI_MODEL`)."""
+    if not MODEL_ROUTING or not MODEL_ROUTER_MODELS:
+        return None
+    return ModelRouter(cost_fn)
@@ -0,0 +1,120 @@
+"""Klasifikace stránek DSV balíku podle typu.
+
+Pravidla pro všechny typy jsou deklarovaná na jednom místě a zkompilovaná
+jednou za proces, takže výsledek (příznaky i skóre) je pro všechny volající stejný.
+
+Pravidlo typu stránky:
+- `required`: vzory, které musí být na stránce všechny, aby byla daného typu
+- `signals`: další vzory s vahou, které zvyšují skóre (jistotu) klasifikace
+- `base`: skóre za splnění `required`
+
+Vzor je regulární výraz (bez ohledu na velikost písmen), nebo funkce `text -> bool`
+pro podmínky, které se regexem vyjadřují špatně. Každý vzor se hledá v textu
+samostatně, takže se shody různých vzorů mohou překrývat. Stránka, která nesplní
+žádné pravidlo, je typu "Other".
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, List, Tuple, Union
+
+OTHER_PAGE_TYPE = "Other"
+
+Pattern = Union[str, Callable[[str], bool]]
+
+_NON_ALNUM = re.compile(r"[^A-Za-z0-9]")
+
+
+def has_long_code(text: str) -> bool:
+    """Obsahuje text slovo, které má po odstranění interpunkce aspoň 15 alfanumerických znaků (MRN/ID)?"""
+    return any(len(_NON_ALNUM.sub("", word)) >= 15 for word in text.split())
+
+
+PAGE_TYPE_RULES: Dict[str, Dict] = {
+    "Consignment Note": {
+        "required": [r"consignment\s+note"],
+        "base": 0.6,
+        "signals": {
+            r"shipment\s+total": 0.2,
+            r"\d+\s*colli": 0.2,
+        },
+    },
+    "MRN": {
+        # Klíčové slovo + dlouhý alfanumerický kód (např. "25CZ3O000OO1DAGMB8")
+        "required": [r"mrn", has_long_code],
+        "base": 0.7,
+        "signals": {
+            r"[0-9A-Z]*BP\d+\s+CZ\s+\d{8}": 0.3,
+        },
+    },
+    "Commercial Invoice": {
+        "required": [r"commercial\s+invoice"],
+        "base": 0.6,
+        "signals": {
+            r"\bvat\b": 0.2,
+            r"incoterms?": 0.2,
+        },
+    },
+}
+
+
+class PageClassifier:
+    """Zkompilovaná sada pravidel; `classify` vyhodnotí každý vzor jednou pro všechny typy."""
+
+    def __init__(self, rules: Dict[str, Dict] = PAGE_TYPE_RULES):
+        """
+        Args:
+            rules: Pravidla typů stránek (viz `PAGE_TYPE_RULES`)
+        """
+        self.rules = rules
+        self.page_types: List[str] = list(rules) + [OTHER_PAGE_TYPE]
+
+        # Vzor sdílený více pravidly se kompiluje i vyhodnocuje jen jednou
+        self._matchers: Dict[Pattern, Callable[[str], bool]] = {}
+        for rule in rules.values():
+            for pattern in list(rule.get("required", [])) + list(rule.get("signals", {})):
+                if pattern not in self._matchers:
+                    self._matchers[pattern] = self._compile(pattern)
+
+    @staticmethod
+    def _compile(pattern: Pattern) -> Callable[[str], bool]:
+        if callable(pattern):
+            return pattern
+        regex = re.compile(pattern, re.IGNORECASE)
+        return lambda text: regex.search(text) is not None
+
+    def _matched_patterns(self, text: str) -> set:
+        """Vrátí vzory, které se v textu vyskytují (každý se hledá samostatně)."""
+        return {pattern for pattern, matches in self._matchers.items() if matches(text)}
+
+    def classify(self, text: str) -> Tuple[Dict[str, bool], Dict[str, float]]:
+        """
+        Klasifikuje text stránky pro všechny typy najednou.
+
+        Args:
+            text: Text stránky
+
+        Returns:
+            Tuple (příznaky {typ: bool}, skóre {typ: 0.0–1.0})
+        """
+        matched = self._matched_patterns(text or "")
+        flags: Dict[str, bool] = {}
+        scores: Dict[str, float] = {}
+        for page_type, rule in self.rules.items():
+            is_type = all(p in matched for p in rule.get("required", []))
+            score = 0.0
+            if is_type:
+                score = rule.get("base", 1.0) + sum(
+                    weight for p, weight in rule.get("signals", {}).items() if p in matched
+                )
+            flags[page_type] = is_type
+            scores[page_type] = round(min(score, 1.0), 3)
+
+        flags[OTHER_PAGE_TYPE] = not any(flags.values())
+        scores[OTHER_PAGE_TYPE] = 1.0 if flags[OTHER_PAGE_TYPE] else 0.0
+        return flags, scores
+
+
+# Sdílená instance (pravidla se kompilují jednou za proces)
+default_classifier = PageClassifier()
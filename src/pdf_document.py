@@ -0,0 +1,276 @@
+"""Sdílená relace nad jedním PDF dokumentem.
+
+`PDFDocumentSession` soubor naparsuje jednou pro všechny kroky `PDFProcessor`
+a text i klasifikaci stránek počítá líně až ve chvíli, kdy je některý krok
+potřebuje. Bajty dokumentu čte z jednoho bufferu (`DocumentSource`: mmap
+souboru, bytes, memoryview).
+"""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import PAGE_TEXT_PARALLEL_MIN_PAGES, PAGE_TEXT_WORKERS
+from .document_source import DocumentInput, as_document_source
+from .page_classifier import default_classifier
+
+
+# Sdílený process pool pro extrakci textu (zakládá se líně, jednou za proces)
+_POOL = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _get_text_pool(workers: int):
+    """Vrátí sdílený ProcessPoolExecutor s alespoň `workers` procesy."""
+    global _POOL, _POOL_WORKERS
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS < workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            # "spawn": fork z vícevláknového procesu (uvicorn, executor) není bezpečný
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _POOL_WORKERS = workers
+        return _POOL
+
+
+def _reset_text_pool() -> None:
+    """Zahodí rozbitý pool (např. po pádu workeru); příště se založí nový."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False)
+        _POOL = None
+        _POOL_WORKERS = 0
+
+
+def _extract_page_range(pdf_path: str, pages: List[int]) -> List[str]:
+    """Worker: otevře PDF a extrahuje text zadaných stránek (1-based)."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(pdf_path)
+    texts = []
+    for page_num in pages:
+        try:
+            texts.append(reader.pages[page_num - 1].extract_text() or "")
+        except Exception as e:
+            print(f"Warning: Could not extract text from page {page_num}: {e}")
+            texts.append("")
+    return texts
+
+
+class PDFDocumentSession:
+    """Jednou naparsovaný PDF dokument sdílený všemi kroky zpracování."""
+
+    def __init__(self, pdf_path: DocumentInput, name: Optional[str] = None):
+        """
+        Otevře PDF a vytvoří PyPDF2 reader nad bufferem dokumentu.
+
+        Args:
+            pdf_path: Cesta k PDF souboru, bytes / memoryview / mmap nebo `DocumentSource`
+            name: Název dokumentu pro vstupy bez cesty (určuje názvy výstupů)
+        """
+        from PyPDF2 import PdfReader
+
+        self.source, self._owns_source = as_document_source(pdf_path, name)
+        # U zdroje bez souboru je pdf_path jen "virtuální" (název pro výstupy)
+        self.pdf_path = self.source.path or Path(self.source.name)
+        self._stream = self.source.open_stream()
+        try:
+            self.reader = PdfReader(self._stream)
+        except Exception:
+            self._release_source()
+            raise
+
+        # Cache: číslo stránky (1-based) -> text / klasifikace
+        self._page_texts: Dict[int, str] = {}
+        self._page_flags: Dict[int, Dict[str, bool]] = {}
+        self._page_scores: Dict[int, Dict[str, float]] = {}
+        # Režim paměťového governoru; mimo "full" se texty stránek necachují
+        self.processing_mode = "full"
+        self.cache_texts = True
+        # Průběžný zápis záznamů v pořadí dokumentu (`RecordOutputs.write_many`), nastavuje procesor
+        self.record_sink: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+
+    def __enter__(self) -> "PDFDocumentSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def name(self) -> str:
+        return self.pdf_path.name
+
+    @property
+    def stem(self) -> str:
+        return self.pdf_path.stem
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    @property
+    def size(self) -> int:
+        """Velikost dokumentu v bajtech."""
+        return self.source.size
+
+    def sha256(self) -> str:
+        """Vrátí SHA-256 (hex) bajtů PDF; počítá se jen jednou."""
+        return self.source.sha256()
+
+    def file_path(self) -> Path:
+        """Cesta k souboru s dokumentem (pro Gemini File API); buffer se případně zapíše jednou do temp souboru."""
+        return self.source.file_path()
+
+    def set_processing_mode(self, mode: str) -> None:
+        """
+        Nastaví režim zpracování zvolený paměťovým governorem.
+
+        V režimech `page_streaming` a `segmented` se text stránky po klasifikaci
+        zahodí (drží se jen příznaky a skóre) a neprobíhá paralelní předčtení všech stránek.
+        """
+        self.processing_mode = mode
+        self.cache_texts = mode == "full"
+        if not self.cache_texts:
+            self._page_texts.clear()
+
+    def preload(
+        self,
+        page_texts: Dict[int, str],
+        page_flags: Dict[int, Dict[str, bool]],
+        page_scores: Dict[int, Dict[str, float]],
+    ) -> None:
+        """Naplní cache texty a klasifikací spočítanými jinde (např. workerem dávkového zpracování)."""
+        if self.cache_texts:
+            self._page_texts.update(page_texts)
+        self._page_flags.update(page_flags)
+        self._page_scores.update(page_scores)
+
+    def page_text(self, page_num: int) -> str:
+        """
+        Vrátí text stránky; PyPDF2 extrakce proběhne jen při prvním dotazu.
+
+        Args:
+            page_num: Číslo stránky (1-based)
+
+        Returns:
+            Text stránky (prázdný řetězec, pokud extrakce selže)
+        """
+        text = self._page_texts.get(page_num)
+        if text is None:
+            try:
+                text = self.reader.pages[page_num - 1].extract_text() or ""
+            except Exception as e:
+                print(f"Warning: Could not extract text from page {page_num}: {e}")
+                text = ""
+            if self.cache_texts:
+                self._page_texts[page_num] = text
+        return text
+
+    def prefetch_texts(self, workers: Optional[int] = None) -> None:
+        """
+        Extrahuje text všech dosud nenačtených stránek, u větších dokumentů paralelně.
+
+        Stránky se rozdělí na souvislé úseky; každý worker v process poolu si PDF
+        otevře sám a vrátí texty svého úseku. Výsledky se uloží do cache v pořadí
+        stránek. Malé dokumenty (a jednojádrové stroje) zůstávají u sériové extrakce.
+
+        Args:
+            workers: Počet procesů (výchozí `PAGE_TEXT_WORKERS`)
+        """
+        if not self.cache_texts:
+            return
+        workers = PAGE_TEXT_WORKERS if workers is None else workers
+        missing = [p for p in range(1, self.page_count + 1) if p not in self._page_texts]
+        # Workery si PDF otevírají samy, potřebují tedy soubor (buffer v paměti zůstává u sériové extrakce)
+        if workers <= 1 or len(missing) < PAGE_TEXT_PARALLEL_MIN_PAGES or self.source.path is None:
+            return
+
+        chunk_size = -(-len(missing) // workers)  # zaokrouhlení nahoru
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        try:
+            pool = _get_text_pool(workers)
+            futures = [pool.submit(_extract_page_range, str(self.source.path), chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for page_num, text in zip(chunk, future.result()):
+                    self._page_texts[page_num] = text
+        except Exception as e:
+            # Sériový fallback: zbylé stránky se dočtou líně přes page_text()
+            print(f"Warning: Parallel text extraction failed, falling back to serial: {e}")
+            _reset_text_pool()
+
+    def iter_page_texts(self) -> Iterator[Tuple[int, str]]:
+        """Postupně vrací dvojice (číslo stránky, text) pro celý dokument."""
+        self.prefetch_texts()
+        for page_num in range(1, self.page_count + 1):
+            yield page_num, self.page_text(page_num)
+
+    def page_flags(self, page_num: int) -> Dict[str, bool]:
+        """
+        Klasifikuje stránku (všechny typy jedním průchodem) a výsledek si zapamatuje.
+
+        Args:
+            page_num: Číslo stránky (1-based)
+
+        Returns:
+            Slovník {"Consignment Note": bool, "MRN": bool, "Commercial Invoice": bool, "Other": bool}
+        """
+        flags = self._page_flags.get(page_num)
+        if flags is None:
+            flags, scores = default_classifier.classify(self.page_text(page_num))
+            self._page_flags[page_num] = flags
+            self._page_scores[page_num] = scores
+        return flags
+
+    def page_scores(self, page_num: int) -> Dict[str, float]:
+        """Vrátí skóre (0.0–1.0) klasifikace stránky pro všechny typy."""
+        self.page_flags(page_num)
+        return self._page_scores[page_num]
+
+    def pages_of_type(self, page_type: str) -> List[int]:
+        """Vrátí seřazená čísla stránek daného typu."""
+        self.prefetch_texts()
+        return [
+            page_num
+            for page_num in range(1, self.page_count + 1)
+            if self.page_flags(page_num).get(page_type)
+        ]
+
+    def close(self) -> None:
+        """Uzavře podkladový soubor a uvolní cache."""
+        self._page_texts.clear()
+        self._page_flags.clear()
+        self._page_scores.clear()
+        self._release_source()
+
+    def _release_source(self) -> None:
+        try:
+            self._stream.close()
+        except Exception:
+            pass
+        if self._owns_source:
+            self.source.close()
+
+
+def open_session(pdf_path: DocumentInput, session: Optional[PDFDocumentSession] = None):
+    """
+    Vrátí context manager nad relací: existující relaci nezavírá, novou po použití zavře.
+
+    Args:
+        pdf_path: Cesta k PDF souboru nebo buffer (použije se jen pokud `session` chybí)
+        session: Již otevřená relace (volitelné)
+    """
+    from contextlib import nullcontext
+
+    if session is not None:
+        return nullcontext(session)
+    return PDFDocumentSession(pdf_path)
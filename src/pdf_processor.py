@@ -1,39 +1,91 @@
 """Modul pro zpracování PDF souborů."""
 import json
-import csv
 import re
-import base64
 import time
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
-import google.generativeai as genai
-from .config import GOOGLE_API_KEY, AI_MODEL
+from typing import List, Dict, Any, Tuple, Optional, Generator, Iterator
+from .config import (
+    AI_MODEL,
+    SEGMENTED_EXTRACTION,
+    SEGMENT_MIN_PAGES,
+    SEGMENT_MAX_PAGES,
+    SEGMENT_WORKERS,
+    PAGE_PREFILTER,
+    HYBRID_EXTRACTION,
+    HYBRID_MIN_CONFIDENCE,
+    OUTPUT_EXTRA_FORMATS,
+    MODEL_ROUTER_MAX_ESCALATIONS,
+    MODEL_ROUTER_MODELS,
+    COST_ESTIMATOR_HISTORY,
+)
 from .extract_prompt import EXTRACTION_PROMPT
+from .gemini_files import await_file_active, wait_for_file_active
+from .hedging import create_hedging_policy, page_bucket
+from .hybrid import block_confidence, create_layout_registry, layout_fingerprint, records_agree
+from .json_stream import IncrementalJSONArrayParser, scan_json_regions
+from .llm_provider import create_provider
+from .memory_governor import MODE_SEGMENTED, MemoryGovernor, maybe_collect
+from .metrics import GEMINI_REQUEST_SECONDS, record_extraction, record_gemini_usage
+from .model_router import create_model_router, estimate_document_tokens, validate_extraction
+from .budget import create_cost_budget
+from .cost_estimator import CostEstimator
+from .document_source import DocumentInput
+from .pdf_document import PDFDocumentSession, open_session
+from .prompt_cache import create_prompt_cache
+from .rate_governor import QuotaLease, create_quota_governor, estimate_request_tokens
+from .resilience import ERROR_CIRCUIT_OPEN, RETRYABLE_ERRORS, RetryPolicy, circuit_breaker_for, classify_error
+from .record_writers import RecordOutputs, write_records
+from .result_cache import create_result_cache
+from .segmentation import merge_usage_infos, plan_segments, remap_mrn_pages, write_subset_pdf
+from .tracing import current_timings, in_context, resume, span, trace
+
+# Cena vstupních tokenů z kontextové cache jako podíl běžné vstupní ceny
+CACHED_INPUT_PRICE_RATIO = 0.25
 
 
 class PDFProcessor:
     """Třída pro zpracování PDF souborů s využitím AI."""
     
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, with_llm: bool = True):
         """
         Inicializace procesoru - vždy používá Google Gemini.
         
         Args:
             logger: Instance ExtractionLogger pro logování (volitelné)
+            with_llm: False = bez klienta LLM (nepotřebuje API klíč); procesor pak slouží
+                jen pro odhady a deterministické kroky (`--dry-run`)
         """
         self.model = AI_MODEL
         self.logger = logger
+        # Perzistentní cache výsledků (None = vypnuto)
+        self.result_cache = create_result_cache()
+        # Registr důvěryhodných layoutů pro hybridní režim (None = hybridní režim vypnut)
+        self.layout_registry = create_layout_registry() if HYBRID_EXTRACTION else None
         
-        if not GOOGLE_API_KEY:
-            raise ValueError(
-                "GOOGLE_API_KEY není nastaven!\n"
-                "Zkontrolujte soubor .env a ujistěte se, že obsahuje:\n"
-                "GOOGLE_API_KEY=vas_api_klic\n\n"
-                "API klíč získáte na: https://aistudio.google.com/apikey\n"
-                "Podrobnosti najdete v souboru INSTALACE.txt (Krok 1 a Krok 4)."
-            )
-        genai.configure(api_key=GOOGLE_API_KEY)
-        self.google_client = genai.GenerativeModel(self.model)
+        # Poskytovatel LLM (Gemini nebo lokální fake podle LLM_PROVIDER); bez API klíče Gemini vyhodí ValueError
+        self.provider = create_provider(derive_records=self.extract_data_without_ai) if with_llm else None
+        self.google_client = self.provider.model(self.model) if with_llm else None
+        # Extrakční prompt v kontextové cache Gemini (None = prompt se posílá v každém požadavku)
+        self.prompt_cache = create_prompt_cache(self.model) if with_llm and self.provider.supports_prompt_cache else None
+        # Sdílené kvóty Gemini (RPM/TPM, AIMD souběh) napříč procesy (None = bez omezení)
+        self.quota_governor = create_quota_governor()
+        # Retry přechodných chyb a circuit breaker modelu (sdílený v procesu)
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = circuit_breaker_for(self.model)
+        # Hedging async volání proti chvostu latence (None = vypnuto)
+        self.hedging = create_hedging_policy()
+        
+        def cost_fn(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+            return self.calculate_cost(prompt_tokens, completion_tokens, model=model)[0]
+        
+        # Výběr modelu pro dokument (None = vždy AI_MODEL); procesory dalších modelů se vytváří líně
+        self.model_router = create_model_router(cost_fn)
+        # Předběžný odhad ceny (kalibrovaný z logu extrakcí) a rozpočty (None = bez limitů)
+        self.cost_estimator = CostEstimator(cost_fn, len(self._system_prompt()))
+        if logger is not None:
+            self.cost_estimator.calibrate(logger.get_extraction_history(limit=COST_ESTIMATOR_HISTORY))
+        self.cost_budget = create_cost_budget()
+        self._model_processors: Dict[str, "PDFProcessor"] = {}
         
         # Ceník Gemini modelů (ceny za milion tokenů v USD)
         # Zdroj: https://ai.google.dev/pricing
@@ -58,18 +110,27 @@ class PDFProcessor:
             }
         }
     
-    def calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> Tuple[float, Dict[str, Any]]:
+    def calculate_cost(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+        model: Optional[str] = None,
+    ) -> Tuple[float, Dict[str, Any]]:
         """
         Vypočítá náklady na základě počtu tokenů.
         
         Args:
-            prompt_tokens: Počet vstupních tokenů
+            prompt_tokens: Počet vstupních tokenů (včetně tokenů z kontextové cache)
             completion_tokens: Počet výstupních tokenů
+            cached_tokens: Z toho vstupních tokenů načtených z kontextové cache (levnější sazba)
+            model: Model pro ceník (výchozí model procesoru)
             
         Returns:
             Tuple obsahující celkové náklady v USD a slovník s detailními informacemi
         """
-        model_key = self.model.lower()
+        model = model or self.model
+        model_key = model.lower()
         
         # Najdeme ceník pro model (podporujeme varianty názvů)
         pricing_info = None
@@ -89,9 +150,12 @@ class PDFProcessor:
         else:
             input_price = pricing_info["input"]
             output_price = pricing_info["output"]
+        cached_price = pricing_info.get("cached_input", input_price * CACHED_INPUT_PRICE_RATIO)
+        cached_tokens = min(cached_tokens, prompt_tokens)
         
-        # Výpočet nákladů
-        input_cost = (prompt_tokens / 1_000_000) * input_price
+        # Výpočet nákladů (vstupní cena = necachované tokeny + tokeny z cache za nižší sazbu)
+        cached_cost = (cached_tokens / 1_000_000) * cached_price
+        input_cost = ((prompt_tokens - cached_tokens) / 1_000_000) * input_price + cached_cost
         output_cost = (completion_tokens / 1_000_000) * output_price
         total_cost = input_cost + output_cost
         
@@ -99,12 +163,15 @@ class PDFProcessor:
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens,
             "total_tokens": prompt_tokens + completion_tokens,
+            "cached_tokens": cached_tokens,
             "input_cost_usd": input_cost,
+            "cached_input_cost_usd": cached_cost,
             "output_cost_usd": output_cost,
             "total_cost_usd": total_cost,
             "input_price_per_million": input_price,
             "output_price_per_million": output_price,
-            "model": self.model
+            "cached_input_price_per_million": cached_price,
+            "model": model
         }
     
     def print_token_usage(self, usage_info: Dict[str, Any]):
@@ -121,161 +188,505 @@ class PDFProcessor:
         # Zaokrouhlení na 2 desetinná místa
         total_cost_czk_rounded = round(total_cost_czk, 2)
         
-        print(f"\n💰 Tokeny: {usage_info['total_tokens']:,} | Cena: ~{total_cost_czk_rounded:.2f} Kč\n")
+        cached_tokens = usage_info.get('cached_tokens') or 0
+        cached_note = f" (z cache: {cached_tokens:,})" if cached_tokens else ""
+        print(f"\n💰 Tokeny: {usage_info['total_tokens']:,}{cached_note} | Cena: ~{total_cost_czk_rounded:.2f} Kč\n")
     
-    def extract_text_from_pdf(self, pdf_path: Path) -> str:
+    def extract_text_from_pdf(self, pdf_path: Path, session: Optional[PDFDocumentSession] = None) -> str:
         """
         Extrahuje text z PDF souboru.
         Používá PyPDF2 místo pdfplumber pro úsporu paměti.
         
         Args:
             pdf_path: Cesta k PDF souboru
+            session: Sdílená relace dokumentu (volitelné, jinak se PDF otevře znovu)
             
         Returns:
             Text z PDF jako string
         """
-        import gc
-        from PyPDF2 import PdfReader
-        
         text_parts = []
         
         try:
-            with open(pdf_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page_num, page in enumerate(reader.pages, start=1):
-                    try:
-                        text = page.extract_text()
-                        if text:
-                            text_parts.append(f"--- PAGE {page_num} ---\n{text}\n")
-                    except Exception as e:
-                        print(f"Warning: Could not extract text from page {page_num}: {e}")
-            
-            # Explicit cleanup
-            del reader
-            gc.collect()
-            
+            with open_session(pdf_path, session) as doc:
+                for page_num, text in doc.iter_page_texts():
+                    if text:
+                        text_parts.append(f"--- PAGE {page_num} ---\n{text}\n")
         except Exception as e:
             print(f"Error reading PDF for text extraction: {e}")
             return ""
         
         return "\n".join(text_parts)
     
-    def extract_data_with_ai(self, pdf_path: Path) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    def extract_data_with_ai(
+        self,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
         """
         Extrahuje strukturovaná data z PDF pomocí Google Gemini Vision API.
         
         Args:
             pdf_path: Cesta k PDF souboru
+            session: Sdílená relace dokumentu (volitelné, využije ji textový fallback)
+            
+        Returns:
+            Tuple obsahující seznam slovníků s extrahovanými daty a informace o použití tokenů
+        """
+        ai_diag = self._new_ai_diagnostics()
+
+        try:
+            if not pdf_path:
+                raise ValueError("pdf_path je povinný parametr")
+            
+            # Vždy používáme Google Gemini Vision API s PDF souborem
+            content, usage_info = self._call_google_gemini(
+                self._system_prompt(), pdf_path, session=session, ai_diag=ai_diag
+            )
+            with span("ai.parse_json"):
+                return self._parse_ai_response(content, usage_info, ai_diag)
+                
+        except Exception as e:
+            print(f"Chyba při komunikaci s AI modelem: {e}")
+            ai_diag["ai_error"] = {"message": str(e), "type": type(e).__name__}
+            return [], {"ai_diagnostics": ai_diag}
+
+    async def aextract_data_with_ai(
+        self,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Asynchronní varianta `extract_data_with_ai` (neblokuje event loop).
+        
+        Args:
+            pdf_path: Cesta k PDF souboru
+            session: Sdílená relace dokumentu (volitelné, využije ji textový fallback)
             
         Returns:
             Tuple obsahující seznam slovníků s extrahovanými daty a informace o použití tokenů
         """
-        ai_diag: Dict[str, Any] = {
+        ai_diag = self._new_ai_diagnostics()
+
+        try:
+            if not pdf_path:
+                raise ValueError("pdf_path je povinný parametr")
+            
+            content, usage_info = await self._acall_google_gemini(
+                self._system_prompt(), pdf_path, session=session, ai_diag=ai_diag
+            )
+            with span("ai.parse_json"):
+                return self._parse_ai_response(content, usage_info, ai_diag)
+                
+        except Exception as e:
+            print(f"Chyba při komunikaci s AI modelem: {e}")
+            ai_diag["ai_error"] = {"message": str(e), "type": type(e).__name__}
+            return [], {"ai_diagnostics": ai_diag}
+
+    def stream_data_with_ai(
+        self,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+    ) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        Streamovaná varianta `extract_data_with_ai`: záznamy vrací průběžně.
+        
+        Odpověď Gemini se čte po částech (`stream=True`) a každý Consignment Note
+        záznam se vydá, jakmile je v JSON poli kompletní. Posílají se jen relevantní
+        stránky (viz `_select_ai_pages`), `mrn_pages` se přemapují na stránky originálu.
+        Pokud streamování selže dřív, než přijde první záznam, použije se textový fallback.
+        
+        Args:
+            pdf_path: Cesta k PDF souboru
+            session: Sdílená relace dokumentu (volitelné, jinak se PDF otevře znovu)
+            
+        Yields:
+            Záznamy (slovníky) v pořadí, v jakém je model vrací
+            
+        Returns:
+            usage_info s `ai_diagnostics` (hodnota `StopIteration.value`, resp. výsledek `yield from`)
+        """
+        import tempfile
+        
+        ai_diag = self._new_ai_diagnostics()
+        ai_diag["streamed"] = True
+        parser = IncrementalJSONArrayParser()
+        text_parts: List[str] = []
+        usage_info: Optional[Dict[str, Any]] = None
+        stream_start = time.perf_counter()
+        
+        with open_session(pdf_path, session) as doc, tempfile.TemporaryDirectory(prefix="dsv_stream_") as tmp_dir:
+            pages = self._select_ai_pages(doc)
+            page_map: Optional[List[int]] = None
+            if len(pages) < doc.page_count:
+                upload_path = Path(tmp_dir) / f"{doc.stem}_ai.pdf"
+                write_subset_pdf(doc.reader, pages, upload_path)
+                page_map = pages
+            else:
+                upload_path = doc.file_path()
+            ai_input = {"pages_sent": len(pages), "bytes_sent": upload_path.stat().st_size}
+            
+            try:
+                chunks = self._stream_google_gemini(self._system_prompt(), upload_path, ai_diag)
+                while True:
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration as stop:
+                        usage_info = stop.value
+                        break
+                    text_parts.append(chunk)
+                    for record in parser.feed(chunk):
+                        if page_map is not None:
+                            remap_mrn_pages([record], page_map)
+                        if parser.records_count == 1 and "first_record_seconds" not in ai_diag:
+                            ai_diag["first_record_seconds"] = round(time.perf_counter() - stream_start, 3)
+                        yield record
+            except Exception as e:
+                if parser.records_count:
+                    # Část záznamů už odešla, nový pokus by je zduplikoval
+                    print(f"Chyba při streamování odpovědi AI: {e}")
+                    ai_diag["ai_error"] = {"message": str(e), "type": type(e).__name__}
+                elif not self._text_fallback_allowed(e, ai_diag):
+                    ai_diag["file_api_error"] = {"message": str(e), "type": type(e).__name__}
+                    ai_diag["ai_error"] = {"message": str(e), "type": type(e).__name__}
+                else:
+                    print(f"Varování: Streamování selhalo, zkouším base64 fallback: {e}")
+                    ai_diag["file_api_error"] = {"message": str(e), "type": type(e).__name__}
+                    try:
+                        content, usage_info = self._call_google_gemini_base64(
+                            self._system_prompt(), doc.pdf_path, session=doc, ai_diag=ai_diag
+                        )
+                        # Textový fallback pracuje s celým originálem, přemapování není potřeba
+                        with span("ai.parse_json"):
+                            records, usage_info = self._parse_ai_response(content, usage_info, ai_diag)
+                        ai_input = {"pages_sent": doc.page_count, "bytes_sent": doc.size}
+                        yield from records
+                        usage_info["ai_input"] = ai_input
+                        return usage_info
+                    except Exception as fallback_error:
+                        print(f"Chyba při komunikaci s AI modelem: {fallback_error}")
+                        ai_diag["ai_error"] = {"message": str(fallback_error), "type": type(fallback_error).__name__}
+                        return {"ai_diagnostics": ai_diag, "ai_input": ai_input}
+            
+            if not parser.records_count and text_parts:
+                # Odpověď bez JSON pole na nejvyšší úrovni (např. {"data": [...]}) – parsujeme celou
+                with span("ai.parse_json"):
+                    records, usage_info = self._parse_ai_response("".join(text_parts).strip(), usage_info, ai_diag)
+                if page_map is not None:
+                    remap_mrn_pages(records, page_map)
+                yield from records
+            elif parser.records_count:
+                ai_diag["ai_json_parsed"] = True
+                ai_diag["ai_response_chars"] = sum(len(part) for part in text_parts)
+        
+        if usage_info is None:
+            usage_info = {}
+        usage_info.setdefault("ai_diagnostics", ai_diag)
+        usage_info["ai_input"] = ai_input
+        return usage_info
+
+    @staticmethod
+    def _system_prompt() -> str:
+        """Extrakční prompt doplněný o požadavek na čisté JSON pole."""
+        return EXTRACTION_PROMPT + "\n\nReturn ONLY a JSON array, starting with '[' and ending with ']'."
+
+    @staticmethod
+    def _new_ai_diagnostics() -> Dict[str, Any]:
+        return {
             "ai_used": True,
-            "ai_method": None,  # file_api | base64 | unknown
+            "ai_method": None,  # file_api | file_api_stream | base64 | unknown
             "ai_response_chars": None,
             "ai_json_parsed": False,
             "ai_error": None,
         }
 
-        try:
-            if not pdf_path:
-                raise ValueError("pdf_path je povinný parametr")
-            
-            # Upravený prompt pro zajištění správného JSON formátu
-            system_prompt = EXTRACTION_PROMPT + "\n\nReturn ONLY a JSON array, starting with '[' and ending with ']'."
+    def _parse_ai_response(
+        self,
+        content: str,
+        usage_info: Optional[Dict[str, Any]],
+        ai_diag: Dict[str, Any],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Převede textovou odpověď modelu na seznam záznamů.
+        
+        Args:
+            content: Textová odpověď modelu
+            usage_info: Informace o použití tokenů z volání (může být None)
+            ai_diag: Diagnostika AI volání (doplní se a vloží do usage_info)
             
-            # Vždy používáme Google Gemini Vision API s PDF souborem
-            content, usage_info = self._call_google_gemini(system_prompt, pdf_path)
-            # _call_google_gemini může vrátit usage_info=None při chybě; doplníme diagnostiku
+        Returns:
+            Tuple obsahující záznamy (prázdný seznam při nevalidním JSON) a usage_info
+        """
+        # _call_google_gemini může vrátit usage_info=None při chybě; doplníme diagnostiku
+        if not ai_diag.get("ai_method"):
             ai_diag["ai_method"] = "unknown"
-            ai_diag["ai_response_chars"] = len(content or "")
-            
-            # Odstranění markdown code bloků pokud jsou přítomny
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            content = content.strip()
-
-            # Parsování JSON:
-            # - nejdřív zkusíme přímý json.loads (nejrychlejší)
-            # - pokud selže, zkusíme z textu vytáhnout první validní JSON pomocí raw_decode
-            def _normalize_to_records(obj: Any) -> List[Dict[str, Any]]:
-                """Převede objekt na seznam záznamů (dictů), pokud to dává smysl."""
-                if obj is None:
-                    return []
-                if isinstance(obj, list):
-                    # Odfiltrujeme ne-dict položky, ale necháme je pokud by byly dict-like
-                    return [x for x in obj if isinstance(x, dict)]
-                if isinstance(obj, dict):
-                    # Hledání pole v hodnotách (častý tvar: {"data": [...]})
-                    for value in obj.values():
-                        if isinstance(value, list):
-                            return [x for x in value if isinstance(x, dict)]
-                    # Fallback: jeden záznam
-                    return [obj]
+        ai_diag["ai_response_chars"] = len(content or "")
+        
+        # Odstranění markdown code bloků pokud jsou přítomny
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.startswith("```"):
+            content = content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        
+        content = content.strip()
+
+        # Parsování JSON:
+        # - nejdřív zkusíme přímý json.loads (nejrychlejší)
+        # - pokud selže, jedním průchodem najdeme vyvážené JSON bloky a zkusíme je postupně
+        # - nakonec zkusíme opravit useknuté pole (uzavření za posledním kompletním objektem)
+        def _normalize_to_records(obj: Any) -> List[Dict[str, Any]]:
+            """Převede objekt na seznam záznamů (dictů), pokud to dává smysl."""
+            if obj is None:
                 return []
+            if isinstance(obj, list):
+                # Odfiltrujeme ne-dict položky, ale necháme je pokud by byly dict-like
+                return [x for x in obj if isinstance(x, dict)]
+            if isinstance(obj, dict):
+                # Hledání pole v hodnotách (častý tvar: {"data": [...]})
+                for value in obj.values():
+                    if isinstance(value, list):
+                        return [x for x in value if isinstance(x, dict)]
+                # Fallback: jeden záznam
+                return [obj]
+            return []
 
+        def _parsed(records: List[Dict[str, Any]], strategy: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+            ai_diag["ai_json_parsed"] = True
+            ai_diag["ai_json_strategy"] = strategy
+            result_usage = usage_info if usage_info is not None else {}
+            result_usage.setdefault("ai_diagnostics", ai_diag)
+            return records, result_usage
+
+        try:
+            records = _normalize_to_records(json.loads(content))
+            if records:
+                return _parsed(records, "direct")
+        except json.JSONDecodeError:
+            pass
+
+        # Gemini někdy přidá text před/za JSON, případně více bloků nebo odpověď usekne
+        regions, repairs = scan_json_regions(content)
+        ai_diag["ai_json_candidates"] = len(regions)
+        # U useknutého pole jsou jeho kompletní objekty i samostatné bloky; oprava s více záznamy má přednost
+        repaired: List[Dict[str, Any]] = []
+        for text in repairs:
+            try:
+                records = _normalize_to_records(json.loads(text))
+            except json.JSONDecodeError:
+                continue
+            if len(records) > len(repaired):
+                repaired = records
+        for start, end in regions:
             try:
-                direct = json.loads(content)
-                records = _normalize_to_records(direct)
-                if records:
-                    ai_diag["ai_json_parsed"] = True
-                    if usage_info is None:
-                        usage_info = {}
-                    usage_info.setdefault("ai_diagnostics", ai_diag)
-                    return records, usage_info
+                records = _normalize_to_records(json.loads(content[start:end]))
             except json.JSONDecodeError:
-                pass
+                continue
+            if records and len(records) >= len(repaired):
+                return _parsed(records, "scan")
 
-            decoder = json.JSONDecoder()
-            # Najdeme všechny možné starty JSON (array nebo objekt) a zkusíme raw_decode
-            # (Gemini někdy přidá text před/za JSON, případně více bloků).
-            candidates = [m.start() for m in re.finditer(r'[\[\{]', content)]
-            for start in candidates[:2000]:  # bezpečnostní limit
-                try:
-                    obj, _end = decoder.raw_decode(content, idx=start)
-                except json.JSONDecodeError:
-                    continue
+        if repaired:
+            print(f"Varování: Odpověď modelu byla useknutá, obnoveno {len(repaired)} kompletních záznamů.")
+            return _parsed(repaired, "truncated_repair")
 
-                records = _normalize_to_records(obj)
-                if records:
-                    ai_diag["ai_json_parsed"] = True
-                    if usage_info is None:
-                        usage_info = {}
-                    usage_info.setdefault("ai_diagnostics", ai_diag)
-                    return records, usage_info
-
-            print("Chyba: Nepodařilo se najít validní JSON v odpovědi modelu.")
-            print(f"Obsah odpovědi (začátek): {content[:500]}...")
-            ai_diag["ai_error"] = "invalid_json_from_model"
-            if usage_info is None:
-                usage_info = {}
-            usage_info.setdefault("ai_diagnostics", ai_diag)
-            return [], usage_info
-                
-        except Exception as e:
-            print(f"Chyba při komunikaci s AI modelem: {e}")
-            ai_diag["ai_error"] = {"message": str(e), "type": type(e).__name__}
-            return [], {"ai_diagnostics": ai_diag}
+        print("Chyba: Nepodařilo se najít validní JSON v odpovědi modelu.")
+        print(f"Obsah odpovědi (začátek): {content[:500]}...")
+        ai_diag["ai_error"] = "invalid_json_from_model"
+        ai_diag["ai_json_strategy"] = None
+        if usage_info is None:
+            usage_info = {}
+        usage_info.setdefault("ai_diagnostics", ai_diag)
+        return [], usage_info
 
-    def extract_data_without_ai(self, pdf_path: Path) -> List[Dict[str, Any]]:
+    def extract_data_with_ai_segmented(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        max_workers: int = SEGMENT_WORKERS,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Extrahuje data po segmentech (sub-PDF) souběžně a výsledky sloučí.
+        
+        Doba zpracování velkého balíku tak odpovídá nejpomalejšímu segmentu,
+        ne součtu všech stránek. Jeden segment s vybranými stránkami slouží
+        i pro upload jen relevantních stránek (viz `_select_ai_pages`).
+        
+        Args:
+            session: Relace dokumentu
+            segments: Segmenty z `plan_segments` (čísla stránek originálu)
+            max_workers: Maximální počet souběžných Gemini volání
+            
+        Returns:
+            Tuple obsahující záznamy (v pořadí segmentů) a souhrnné informace o použití tokenů
+        """
+        results, bytes_sent = self._run_segment_extractions(session, segments, max_workers)
+        return self._merge_segment_results(session, segments, results, bytes_sent)
+    
+    def _run_segment_extractions(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        max_workers: int = SEGMENT_WORKERS,
+    ) -> Tuple[List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]], int]:
+        """Zapíše sub-PDF segmentů a souběžně je extrahuje; vrací výsledky v pořadí segmentů a odeslané bajty."""
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with tempfile.TemporaryDirectory(prefix="dsv_segments_") as tmp_dir:
+            segment_paths, bytes_sent = self._write_segment_pdfs(session, segments, Path(tmp_dir))
+            
+            workers = max(1, min(max_workers, len(segments)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-segment") as pool:
+                # Každý segment dostane kopii kontextu (spany volání Gemini patří pod krok extrakce)
+                tasks = [in_context(self.extract_data_with_ai) for _ in segment_paths]
+                results = list(pool.map(lambda task, path: task(pdf_path=path), tasks, segment_paths))
+        
+        return results, bytes_sent
+    
+    async def aextract_data_with_ai_segmented(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        max_workers: int = SEGMENT_WORKERS,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Asynchronní varianta `extract_data_with_ai_segmented`.
+        
+        Zápis sub-PDF běží v executoru, Gemini volání souběžně v event loopu
+        (nejvýše `max_workers` najednou).
+        """
+        import asyncio
+        
+        results, bytes_sent = await self._arun_segment_extractions(session, segments, max_workers)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._merge_segment_results, session, segments, results, bytes_sent
+        )
+    
+    async def _arun_segment_extractions(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        max_workers: int = SEGMENT_WORKERS,
+    ) -> Tuple[List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]], int]:
+        """Asynchronní varianta `_run_segment_extractions`."""
+        import asyncio
+        import tempfile
+        
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+        
+        async def _extract_segment(path: Path):
+            async with semaphore:
+                return await self.aextract_data_with_ai(pdf_path=path)
+        
+        with tempfile.TemporaryDirectory(prefix="dsv_segments_") as tmp_dir:
+            segment_paths, bytes_sent = await loop.run_in_executor(
+                None, self._write_segment_pdfs, session, segments, Path(tmp_dir)
+            )
+            results = await asyncio.gather(*(_extract_segment(path) for path in segment_paths))
+        return list(results), bytes_sent
+    
+    def _write_segment_pdfs(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        target_dir: Path,
+    ) -> Tuple[List[Path], int]:
+        """Zapíše sub-PDF pro každý segment; vrací cesty a celkovou velikost v bajtech."""
+        # Sub-PDF zapisujeme sekvenčně v jednom vlákně (PdfReader není thread-safe)
+        segment_paths = []
+        bytes_sent = 0
+        for index, pages in enumerate(segments, start=1):
+            segment_path = target_dir / f"{session.stem}_seg{index:03d}.pdf"
+            write_subset_pdf(session.reader, pages, segment_path)
+            segment_paths.append(segment_path)
+            bytes_sent += segment_path.stat().st_size
+        return segment_paths, bytes_sent
+    
+    def _merge_segment_results(
+        self,
+        session: PDFDocumentSession,
+        segments: List[List[int]],
+        results: List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]],
+        bytes_sent: int,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Přemapuje stránky, doplní fallback pro neúspěšné segmenty a sloučí usage_info.
+        
+        Záznamy každého segmentu hned odejdou do výstupů relace (`record_sink`).
+        """
+        extracted_data: List[Dict[str, Any]] = []
+        segment_diags: List[Dict[str, Any]] = []
+        for pages, result in zip(segments, results):
+            records, diag = self._merge_segment(session, pages, result)
+            self._emit_records(session, records)
+            extracted_data.extend(records)
+            segment_diags.append(diag)
+        
+        all_parsed = all(d.get("ai_json_parsed") for d in segment_diags)
+        usage_info = merge_usage_infos([u for _, u in results]) or {}
+        usage_info["ai_diagnostics"] = {
+            "ai_used": True,
+            "ai_method": "segmented" if len(segments) > 1 else "page_subset",
+            "ai_json_parsed": all_parsed,
+            "ai_error": None if all_parsed else "segment_failed",
+            "segments": segment_diags,
+        }
+        usage_info["ai_input"] = {
+            "pages_sent": sum(len(pages) for pages in segments),
+            "bytes_sent": bytes_sent,
+        }
+        return extracted_data, usage_info
+    
+    def _merge_segment(
+        self,
+        session: PDFDocumentSession,
+        pages: List[int],
+        result: Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Záznamy jednoho segmentu se stránkami originálu (při neúspěchu AI z fallbacku) a jeho diagnostika."""
+        records, segment_usage = result
+        diag = dict((segment_usage or {}).get("ai_diagnostics") or {})
+        diag["pages"] = [pages[0], pages[-1]]
+        diag["page_count"] = len(pages)
+        if records:
+            # Čísla stránek od modelu jsou relativní k sub-PDF
+            remap_mrn_pages(records, pages)
+        else:
+            # Segment bez AI výsledku doplníme deterministickou extrakcí jen z jeho stránek
+            try:
+                records = self.extract_data_without_ai(session.pdf_path, session=session, pages=pages)
+            except Exception as e:
+                print(f"  → Fallback extrakce segmentu {pages[0]}–{pages[-1]} selhala: {e}")
+                records = []
+            diag["fallback_records"] = len(records)
+        return records, diag
+    
+    @staticmethod
+    def _emit_records(session: PDFDocumentSession, records: List[Dict[str, Any]]) -> None:
+        """Předá záznamy v pořadí dokumentu průběžným výstupům relace (pokud jsou otevřené)."""
+        if session.record_sink is not None:
+            session.record_sink(records)
+    
+    def extract_data_without_ai(
+        self,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+        pages: Optional[List[int]] = None,
+    ) -> List[Dict[str, Any]]:
         """
         Deterministická (regex/textová) extrakce pro případ, že AI selže.
 
         Z dokumentu:
         - najde Consignment Note stránky
         - z nich vytáhne CN číslo a řádek "Shipment total: {N}colli {gross} {volume}"
-        - najde MRN stránky (stejná heuristika jako `extract_pages_by_type`)
+        - najde MRN stránky (stejná klasifikace jako `extract_pages_by_type`, viz `page_classifier`)
         - přiřadí MRN stránky ke CN podle pořadí v dokumentu
         - z MRN stránek vytáhne 8místné HS kódy (ponechává duplicity)
-        """
-        from PyPDF2 import PdfReader
 
+        Pokud je předána `session`, použije se její cache textů stránek.
+        Parametr `pages` omezí extrakci jen na dané stránky (např. jeden segment).
+        """
         def _to_float_str(val: str) -> str:
             # Převod "1478,0" -> "1478.0", "6,432" -> "6.432"
             return val.strip().replace(" ", "").replace(",", ".")
@@ -303,17 +714,6 @@ class PDFProcessor:
             volume = _to_float_str(m.group(3))
             return packages, gross, volume
 
-        def _is_mrn_page(text: str) -> bool:
-            tl = (text or "").lower()
-            if "mrn" not in tl:
-                return False
-            # Heuristika: stránka obsahuje alfanumerický kód délky >= 15 (MRN/ID)
-            for word in (text or "").split():
-                w = re.sub(r'[^A-Za-z0-9]', '', word)
-                if len(w) >= 15 and w.isalnum():
-                    return True
-            return False
-
         def _extract_hs_codes(text: str) -> List[str]:
             """
             HS kódy: 8místné numerické řetězce typicky uvedené za českým identifikátorem
@@ -329,19 +729,22 @@ class PDFProcessor:
 
         extracted: List[Dict[str, Any]] = []
 
-        with open(pdf_path, "rb") as f:
-            reader = PdfReader(f)
+        with open_session(pdf_path, session) as doc:
             page_texts: Dict[int, str] = {}
             cn_pages: List[int] = []
             mrn_pages: List[int] = []
 
-            for page_num, page in enumerate(reader.pages, start=1):
-                text = page.extract_text() or ""
+            if pages is None:
+                page_iter = doc.iter_page_texts()
+            else:
+                page_iter = ((page_num, doc.page_text(page_num)) for page_num in pages)
+
+            for page_num, text in page_iter:
                 page_texts[page_num] = text
-                tl = text.lower()
-                if "consignment note" in tl:
+                flags = doc.page_flags(page_num)
+                if flags.get("Consignment Note"):
                     cn_pages.append(page_num)
-                if _is_mrn_page(text):
+                if flags.get("MRN"):
                     mrn_pages.append(page_num)
 
         cn_pages = sorted(cn_pages)
@@ -374,156 +777,627 @@ class PDFProcessor:
 
         return extracted
     
-    def _call_google_gemini(self, system_prompt: str, pdf_path: Path) -> Tuple[str, Optional[Dict[str, Any]]]:
+    def _call_google_gemini(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+        ai_diag: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
         """
         Volá Google Gemini API s PDF souborem pomocí File API.
         
+        Args:
+            system_prompt: Extrakční prompt
+            pdf_path: Cesta k PDF souboru
+            session: Sdílená relace dokumentu (volitelné, využije ji textový fallback)
+            ai_diag: Diagnostika volání (doplní se metoda a časy uploadu/čekání/generování)
+        
         Returns:
             Tuple obsahující textovou odpověď a informace o použití tokenů
         """
+        diag = ai_diag if ai_diag is not None else {}
         try:
+            # Při otevřeném breakeru se soubor ani nenahrává
+            self.circuit_breaker.check()
+            
             # Upload PDF souboru přes Gemini File API
-            uploaded_file = genai.upload_file(path=str(pdf_path), mime_type="application/pdf")
+            upload_start = time.perf_counter()
+            with span("gemini.upload", size_bytes=pdf_path.stat().st_size):
+                uploaded_file = self.provider.upload_file(str(pdf_path), "application/pdf")
+            diag["upload_seconds"] = round(time.perf_counter() - upload_start, 3)
             
-            # Počkej, až se soubor nahraje
-            while uploaded_file.state.name == "PROCESSING":
-                time.sleep(0.5)
-                uploaded_file = genai.get_file(uploaded_file.name)
+            try:
+                # Počkej, až se soubor zpracuje (adaptivní interval + deadline)
+                with span("gemini.file_processing"):
+                    uploaded_file = wait_for_file_active(
+                        uploaded_file,
+                        self.provider.get_file,
+                        size_bytes=pdf_path.stat().st_size,
+                        diagnostics=diag,
+                    )
+                
+                # Příprava promptu
+                user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
+                client, request_prompt = self._prompt_request(system_prompt, user_prompt, diag)
+                
+                # Volání modelu s nahráným souborem (přes slot sdílené kvóty, přechodné chyby se opakují)
+                estimated = estimate_request_tokens(len(request_prompt), pdf_bytes=pdf_path.stat().st_size)
+                
+                def _generate():
+                    with self._quota_slot(estimated, diag) as lease:
+                        response = client.generate_content(
+                            [request_prompt, uploaded_file],
+                            generation_config={
+                                "temperature": 0.1,  # Nízká teplota pro konzistentní výsledky
+                            }
+                        )
+                        lease.record_response(response)
+                    return response
+                
+                generate_start = time.perf_counter()
+                with span("gemini.generate", model=self.model) as generate_span:
+                    response = self.retry_policy.call(_generate, self.circuit_breaker, diag)
+                    generate_span.set(attempts=diag.get("attempts"))
+                diag["generate_seconds"] = round(time.perf_counter() - generate_start, 3)
+                GEMINI_REQUEST_SECONDS.observe(diag["generate_seconds"], model=self.model, method="file_api")
+            finally:
+                # Vyčištění - smazání nahráného souboru (i po timeoutu nebo chybě generování)
+                try:
+                    self.provider.delete_file(uploaded_file.name)
+                except Exception as e:
+                    print(f"Varování: Nepodařilo se smazat nahráný soubor: {e}")
             
-            if uploaded_file.state.name == "FAILED":
-                raise ValueError(f"Nahrání souboru selhalo: {uploaded_file.state.name}")
+            usage_info = self._usage_from_response(response)
+            diag["ai_method"] = "file_api"
             
-            # Příprava promptu
-            user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            
-            # Volání modelu s nahráným souborem
-            response = self.google_client.generate_content(
-                [full_prompt, uploaded_file],
-                generation_config={
-                    "temperature": 0.1,  # Nízká teplota pro konzistentní výsledky
-                }
-            )
+            return response.text.strip(), usage_info
             
-            usage_info = None
-            # Získání informací o tokenech z response
-            if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                prompt_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0) or 0
-                completion_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0) or 0
-                
-                # Výpočet nákladů a zobrazení informací pouze pokud máme alespoň nějaké tokeny
-                if prompt_tokens > 0 or completion_tokens > 0:
-                    _, usage_info = self.calculate_cost(prompt_tokens, completion_tokens)
-                    self.print_token_usage(usage_info)
+        except Exception as e:
+            # Pokud File API selže, zkusíme base64 fallback (ne při výpadku Gemini)
+            diag["file_api_error"] = {"message": str(e), "type": type(e).__name__}
+            if not self._text_fallback_allowed(e, diag):
+                raise
+            print(f"Varování: File API selhalo, zkouším base64 fallback: {e}")
+            return self._call_google_gemini_base64(system_prompt, pdf_path, session=session, ai_diag=diag)
+    
+    def _stream_google_gemini(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        ai_diag: Dict[str, Any],
+    ) -> Generator[str, None, Optional[Dict[str, Any]]]:
+        """
+        Volá Google Gemini přes File API se `stream=True` a vrací části odpovědi.
+        
+        Yields:
+            Textové části odpovědi v pořadí, jak přicházejí
             
-            # Vyčištění - smazání nahráného souboru
+        Returns:
+            Informace o použití tokenů (dostupné až po přečtení celé odpovědi)
+        """
+        self.circuit_breaker.check()
+        upload_start = time.perf_counter()
+        with span("gemini.upload", size_bytes=pdf_path.stat().st_size):
+            uploaded_file = self.provider.upload_file(str(pdf_path), "application/pdf")
+        ai_diag["upload_seconds"] = round(time.perf_counter() - upload_start, 3)
+        
+        try:
+            with span("gemini.file_processing"):
+                uploaded_file = wait_for_file_active(
+                    uploaded_file,
+                    self.provider.get_file,
+                    size_bytes=pdf_path.stat().st_size,
+                    diagnostics=ai_diag,
+                )
+            
+            user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
+            client, request_prompt = self._prompt_request(system_prompt, user_prompt, ai_diag)
+            
+            estimated = estimate_request_tokens(len(request_prompt), pdf_bytes=pdf_path.stat().st_size)
+            # Slot kvóty se drží po celou dobu streamu
+            with self._quota_slot(estimated, ai_diag) as lease:
+                generate_start = time.perf_counter()
+                # Opakuje se jen otevření streamu; po první části by opakování duplikovalo výstup
+                response = self.retry_policy.call(
+                    lambda: client.generate_content(
+                        [request_prompt, uploaded_file],
+                        generation_config={
+                            "temperature": 0.1,
+                        },
+                        stream=True,
+                    ),
+                    self.circuit_breaker,
+                    ai_diag,
+                )
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Část bez textu (např. jen metadata / finish_reason)
+                        continue
+                    if text:
+                        yield text
+                lease.record_response(response)
+            ai_diag["generate_seconds"] = round(time.perf_counter() - generate_start, 3)
+            GEMINI_REQUEST_SECONDS.observe(ai_diag["generate_seconds"], model=self.model, method="file_api_stream")
+        finally:
             try:
-                genai.delete_file(uploaded_file.name)
+                self.provider.delete_file(uploaded_file.name)
             except Exception as e:
                 print(f"Varování: Nepodařilo se smazat nahráný soubor: {e}")
+        
+        ai_diag["ai_method"] = "file_api_stream"
+        return self._usage_from_response(response)
+    
+    def _call_google_gemini_base64(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+        ai_diag: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Fallback metoda pro Gemini API, když File API selže.
+        
+        Gemini API nepodporuje base64 PDF přímo, proto se posílá extrahovaný text
+        (název metody zůstal z dřívější implementace).
+        
+        Returns:
+            Tuple obsahující textovou odpověď a informace o použití tokenů
+        """
+        # Příprava promptu
+        user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
+        
+        # Textová extrakce ze sdílené relace (PDF se znovu nenačítá ani nekóduje)
+        pdf_text = self.extract_text_from_pdf(pdf_path, session=session)
+        user_prompt_with_text = f"{user_prompt}\n\nPDF obsah:\n{pdf_text}"
+        client, request_prompt = self._prompt_request(system_prompt, user_prompt_with_text, ai_diag)
+        
+        def _generate():
+            with self._quota_slot(estimate_request_tokens(len(request_prompt)), ai_diag) as lease:
+                response = client.generate_content(
+                    request_prompt,
+                    generation_config={
+                        "temperature": 0.1,
+                    }
+                )
+                lease.record_response(response)
+            return response
+        
+        generate_start = time.perf_counter()
+        with span("gemini.generate", model=self.model, method="base64"):
+            response = self.retry_policy.call(_generate, self.circuit_breaker, ai_diag)
+        
+        usage_info = self._usage_from_response(response)
+        GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - generate_start, model=self.model, method="base64")
+        if ai_diag is not None:
+            ai_diag["ai_method"] = "base64"
+            ai_diag["generate_seconds"] = round(time.perf_counter() - generate_start, 3)
+        
+        return response.text.strip(), usage_info
+    
+    async def _acall_google_gemini(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+        ai_diag: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Asynchronní varianta `_call_google_gemini`.
+        
+        Generování používá `generate_content_async`; upload, dotazy na stav
+        a mazání souboru (SDK pro ně nemá async API) běží ve vlákně přes
+        `asyncio.to_thread` a čekání na zpracování souboru je neblokující.
+        Se zapnutým hedgingem se volání po percentilu latence zduplikuje.
+        
+        Returns:
+            Tuple obsahující textovou odpověď a informace o použití tokenů
+        """
+        diag = ai_diag if ai_diag is not None else {}
+        try:
+            # Při otevřeném breakeru se soubor ani nenahrává
+            self.circuit_breaker.check()
             
-            return response.text.strip(), usage_info
+            if self.hedging is None:
+                return await self._afile_api_attempt(system_prompt, pdf_path, diag)
+            return await self._ahedged_file_api(system_prompt, pdf_path, session, diag)
             
         except Exception as e:
-            # Pokud File API selže, zkusíme base64 fallback
+            # Pokud File API selže, zkusíme textový fallback (ne při výpadku Gemini)
+            diag["file_api_error"] = {"message": str(e), "type": type(e).__name__}
+            if not self._text_fallback_allowed(e, diag):
+                raise
             print(f"Varování: File API selhalo, zkouším base64 fallback: {e}")
-            return self._call_google_gemini_base64(system_prompt, pdf_path)
+            return await self._acall_google_gemini_base64(system_prompt, pdf_path, session=session, ai_diag=diag)
+    
+    async def _afile_api_attempt(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        diag: Dict[str, Any],
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Jeden pokus o extrakci přes File API (upload, čekání, generování, smazání souboru).
+        
+        Pokus lze zrušit (hedging): nahraný soubor se smaže i po zrušení,
+        případně až po doběhnutí uploadu.
+        """
+        import asyncio
+        
+        # Upload PDF souboru přes Gemini File API (ve vlákně; zrušení ho nepřeruší)
+        upload_start = time.perf_counter()
+        upload = asyncio.ensure_future(
+            asyncio.to_thread(self.provider.upload_file, str(pdf_path), "application/pdf")
+        )
+        try:
+            with span("gemini.upload", size_bytes=pdf_path.stat().st_size):
+                uploaded_file = await asyncio.shield(upload)
+        except asyncio.CancelledError:
+            # Soubor, který se ještě nahrává, se smaže po doběhnutí uploadu
+            upload.add_done_callback(self._delete_after_upload)
+            raise
+        diag["upload_seconds"] = round(time.perf_counter() - upload_start, 3)
+        
+        try:
+            # Neblokující čekání na zpracování souboru (adaptivní interval + deadline)
+            with span("gemini.file_processing"):
+                uploaded_file = await await_file_active(
+                    uploaded_file,
+                    self.provider.get_file,
+                    size_bytes=pdf_path.stat().st_size,
+                    diagnostics=diag,
+                )
+            
+            # Příprava promptu
+            user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
+            # Založení/prodloužení cache je síťové volání bez async API
+            client, request_prompt = await asyncio.to_thread(self._prompt_request, system_prompt, user_prompt, diag)
+            
+            # Volání modelu s nahráným souborem (přes slot sdílené kvóty)
+            estimated = estimate_request_tokens(len(request_prompt), pdf_bytes=pdf_path.stat().st_size)
+            
+            async def _generate():
+                async with self._aquota_slot(estimated, diag) as lease:
+                    response = await client.generate_content_async(
+                        [request_prompt, uploaded_file],
+                        generation_config={
+                            "temperature": 0.1,  # Nízká teplota pro konzistentní výsledky
+                        }
+                    )
+                    lease.record_response(response)
+                return response
+            
+            generate_start = time.perf_counter()
+            diag["generate_started"] = True
+            with span("gemini.generate", model=self.model) as generate_span:
+                response = await self.retry_policy.acall(_generate, self.circuit_breaker, diag)
+                generate_span.set(attempts=diag.get("attempts"))
+            diag["generate_seconds"] = round(time.perf_counter() - generate_start, 3)
+            GEMINI_REQUEST_SECONDS.observe(diag["generate_seconds"], model=self.model, method="file_api")
+        finally:
+            # Vyčištění - smazání nahráného souboru (i po timeoutu, chybě generování nebo zrušení)
+            try:
+                await asyncio.shield(asyncio.to_thread(self.provider.delete_file, uploaded_file.name))
+            except Exception as e:
+                print(f"Varování: Nepodařilo se smazat nahráný soubor: {e}")
+        
+        usage_info = self._usage_from_response(response)
+        diag["ai_method"] = "file_api"
+        
+        return response.text.strip(), usage_info
+    
+    def _delete_after_upload(self, upload: Any) -> None:
+        """Smaže soubor zrušeného pokusu, jakmile jeho upload doběhne (callback tasku)."""
+        import asyncio
+        
+        if upload.cancelled() or upload.exception() is not None:
+            return
+        
+        def _delete():
+            try:
+                self.provider.delete_file(upload.result().name)
+            except Exception as e:
+                print(f"Varování: Nepodařilo se smazat nahráný soubor: {e}")
+        
+        asyncio.get_running_loop().run_in_executor(None, _delete)
+    
+    async def _ahedged_file_api(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession],
+        diag: Dict[str, Any],
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Pokus přes File API s hedgingem.
+        
+        Nedoběhne-li pokus do percentilu nedávných latencí dokumentů podobné velikosti
+        (a dovolí-li to limit podílu hedgů), spustí se druhý stejný pokus; použije se
+        první úspěšný, druhý se zruší. Vstupní tokeny zrušeného pokusu (odhad, pokud
+        už běželo generování) se přičtou k nákladům.
+        """
+        import asyncio
+        
+        page_count = session.page_count if session is not None and session.source.path == Path(pdf_path) else None
+        if page_count is None:
+            page_count = await asyncio.to_thread(self._pdf_page_count, pdf_path)
+        delay = self.hedging.hedge_delay(page_count)
+        self.hedging.start_request()
+        
+        attempts: Dict[Any, Dict[str, Any]] = {}
+        
+        def _start(name: str) -> None:
+            attempt_diag: Dict[str, Any] = {}
+            task = asyncio.ensure_future(self._afile_api_attempt(system_prompt, pdf_path, attempt_diag))
+            attempts[task] = {"name": name, "diag": attempt_diag, "start": time.perf_counter()}
+        
+        _start("primary")
+        primary = next(iter(attempts))
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self.hedging.try_reserve_hedge():
+                    print(f"  → Gemini neodpovědělo do {delay:.1f} s ({page_bucket(page_count)} stran), spouštím hedge")
+                    _start("hedge")
+            
+            pending = set(attempts)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                # Selhaly všechny pokusy: chyba primárního pokusu jde do běžného ošetření
+                diag.update(attempts[primary]["diag"])
+                diag.pop("generate_started", None)
+                raise primary.exception()
+        finally:
+            losers = [task for task in attempts if task is not winner and not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+        
+        info = attempts[winner]
+        diag.update(info["diag"])
+        diag.pop("generate_started", None)
+        self.hedging.record_latency(page_count, time.perf_counter() - info["start"])
+        content, usage_info = winner.result()
+        
+        hedging: Dict[str, Any] = {
+            "hedged": len(attempts) > 1,
+            "page_bucket": page_bucket(page_count),
+            "delay_seconds": round(delay, 3) if delay is not None else None,
+            "winner": info["name"],
+        }
+        if len(attempts) > 1:
+            loser = next(task for task in attempts if task is not winner)
+            hedging.update(self._hedge_extra_usage(loser, attempts[loser]["diag"], usage_info))
+            if info["name"] == "hedge":
+                print("  → Hedge doběhl dřív než původní volání")
+        diag["hedging"] = hedging
+        return content, usage_info
+    
+    def _hedge_extra_usage(
+        self,
+        loser: Any,
+        loser_diag: Dict[str, Any],
+        usage_info: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Náklady pokusu, který prohrál, přičte do `usage_info` a vrátí jejich souhrn.
+        
+        Doběhl-li i druhý pokus, použijí se jeho skutečné tokeny; byl-li zrušen během
+        generování, odhadnou se vstupní tokeny podle vítěze (výstupní se nepočítají).
+        """
+        extra = {"extra_prompt_tokens": 0, "extra_completion_tokens": 0, "extra_cost_usd": 0.0, "extra_estimated": False}
+        loser_usage = None
+        if not loser.cancelled() and loser.exception() is None:
+            loser_usage = loser.result()[1]
+        elif loser_diag.get("generate_started") and usage_info:
+            _, loser_usage = self.calculate_cost(usage_info.get("prompt_tokens", 0), 0, usage_info.get("cached_tokens", 0))
+            extra["extra_estimated"] = True
+        if not loser_usage or usage_info is None:
+            return extra
+        
+        extra["extra_prompt_tokens"] = loser_usage.get("prompt_tokens", 0)
+        extra["extra_completion_tokens"] = loser_usage.get("completion_tokens", 0)
+        extra["extra_cost_usd"] = loser_usage.get("total_cost_usd", 0.0)
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"):
+            usage_info[key] = usage_info.get(key, 0) + loser_usage.get(key, 0)
+        for key in ("input_cost_usd", "cached_input_cost_usd", "output_cost_usd", "total_cost_usd"):
+            usage_info[key] = usage_info.get(key, 0.0) + loser_usage.get(key, 0.0)
+        return extra
     
-    def _call_google_gemini_base64(self, system_prompt: str, pdf_path: Path) -> Tuple[str, Optional[Dict[str, Any]]]:
+    @staticmethod
+    def _pdf_page_count(pdf_path: Path) -> int:
+        """Počet stránek PDF (pro skupinu latencí hedgingu)."""
+        from PyPDF2 import PdfReader
+        
+        return len(PdfReader(str(pdf_path)).pages)
+    
+    async def _acall_google_gemini_base64(
+        self,
+        system_prompt: str,
+        pdf_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+        ai_diag: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
         """
-        Fallback metoda pro Gemini API s base64 encoded PDF.
+        Asynchronní varianta `_call_google_gemini_base64` (extrakce textu běží v executoru).
         
         Returns:
             Tuple obsahující textovou odpověď a informace o použití tokenů
         """
-        # Načtení PDF souboru a převod na base64
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_data = pdf_file.read()
-            pdf_base64 = base64.b64encode(pdf_data).decode('utf-8')
+        import asyncio
         
-        # Příprava promptu
         user_prompt = "Extrahuj všechna data z tohoto PDF dokumentu podle pokynů v systémovém promptu. Vrať pouze validní JSON pole."
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
         
-        # Pro base64 musíme použít jiný přístup - Gemini API nepodporuje base64 PDF přímo
-        # Místo toho použijeme textovou extrakci
-        pdf_text = self.extract_text_from_pdf(pdf_path)
-        user_prompt_with_text = f"{user_prompt}\n\nPDF obsah:\n{pdf_text}"
-        full_prompt_with_text = f"{system_prompt}\n\n{user_prompt_with_text}"
-        
-        response = self.google_client.generate_content(
-            full_prompt_with_text,
-            generation_config={
-                "temperature": 0.1,
-            }
+        loop = asyncio.get_running_loop()
+        pdf_text = await loop.run_in_executor(None, lambda: self.extract_text_from_pdf(pdf_path, session=session))
+        client, request_prompt = await asyncio.to_thread(
+            self._prompt_request, system_prompt, f"{user_prompt}\n\nPDF obsah:\n{pdf_text}", ai_diag
         )
         
+        async def _generate():
+            async with self._aquota_slot(estimate_request_tokens(len(request_prompt)), ai_diag) as lease:
+                response = await client.generate_content_async(
+                    request_prompt,
+                    generation_config={
+                        "temperature": 0.1,
+                    }
+                )
+                lease.record_response(response)
+            return response
+        
+        generate_start = time.perf_counter()
+        with span("gemini.generate", model=self.model, method="base64"):
+            response = await self.retry_policy.acall(_generate, self.circuit_breaker, ai_diag)
+        
+        usage_info = self._usage_from_response(response)
+        GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - generate_start, model=self.model, method="base64")
+        if ai_diag is not None:
+            ai_diag["ai_method"] = "base64"
+            ai_diag["generate_seconds"] = round(time.perf_counter() - generate_start, 3)
+        
+        return response.text.strip(), usage_info
+    
+    def _prompt_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        ai_diag: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Vrátí (model, text požadavku) pro volání Gemini.
+        
+        Je-li systémový prompt v kontextové cache, posílá se jen uživatelská část;
+        jinak se použije výchozí model a prompt spojený s uživatelskou částí.
+        """
+        cached_model = self.prompt_cache.model_for(system_prompt) if self.prompt_cache is not None else None
+        if ai_diag is not None:
+            ai_diag["prompt_cache"] = cached_model is not None
+            skipped = self.prompt_cache.skip_reason(system_prompt) if self.prompt_cache is not None else None
+            if skipped:
+                ai_diag["prompt_cache_skipped"] = skipped
+        if cached_model is not None:
+            return cached_model, user_prompt
+        return self.google_client, f"{system_prompt}\n\n{user_prompt}"
+    
+    def _text_fallback_allowed(self, error: Exception, ai_diag: Dict[str, Any]) -> bool:
+        """
+        Rozhodne, zda po chybě File API zkusit textový fallback.
+        
+        Při výpadku Gemini (otevřený breaker, přechodné chyby po vyčerpání pokusů) by šlo
+        o další drahé volání proti stejnému backendu; požadavek se místo toho označí jako
+        degradovaný a procesor použije deterministickou extrakci.
+        """
+        kind = classify_error(error)
+        if kind in RETRYABLE_ERRORS or kind == ERROR_CIRCUIT_OPEN:
+            print(f"  → Gemini nedostupné ({kind}), textový fallback přeskakuji: {error}")
+            ai_diag["degraded"] = True
+            ai_diag["degraded_reason"] = kind
+            return False
+        return True
+    
+    @classmethod
+    def _outcome(cls, usage_info: Optional[Dict[str, Any]]) -> str:
+        """Výsledek extrakce pro metriky: cache_hit, degraded, fallback nebo ai."""
+        if ((usage_info or {}).get("cache") or {}).get("hit"):
+            return "cache_hit"
+        if cls._is_degraded(usage_info):
+            return "degraded"
+        if ((usage_info or {}).get("ai_diagnostics") or {}).get("fallback_used"):
+            return "fallback"
+        return "ai"
+    
+    @staticmethod
+    def _is_degraded(usage_info: Optional[Dict[str, Any]]) -> bool:
+        """True, pokud výsledek (nebo některý segment) vznikl bez AI kvůli výpadku Gemini."""
+        ai_diag = (usage_info or {}).get("ai_diagnostics") or {}
+        return bool(ai_diag.get("degraded") or any(d.get("degraded") for d in ai_diag.get("segments") or []))
+    
+    def _quota_slot(self, estimated_tokens: int, ai_diag: Optional[Dict[str, Any]] = None):
+        """Context manager se slotem sdílené kvóty Gemini pro jedno generování."""
+        from contextlib import nullcontext
+        
+        if self.quota_governor is None:
+            return nullcontext(QuotaLease(self.model, None, estimated_tokens))
+        return self.quota_governor.slot(self.model, estimated_tokens, ai_diag)
+    
+    def _aquota_slot(self, estimated_tokens: int, ai_diag: Optional[Dict[str, Any]] = None):
+        """Asynchronní varianta `_quota_slot` (čekání na slot neblokuje event loop)."""
+        from contextlib import nullcontext
+        
+        if self.quota_governor is None:
+            return nullcontext(QuotaLease(self.model, None, estimated_tokens))
+        return self.quota_governor.aslot(self.model, estimated_tokens, ai_diag)
+    
+    def _usage_from_response(self, response: Any) -> Optional[Dict[str, Any]]:
+        """Získá počty tokenů a náklady z odpovědi Gemini (None, pokud chybí)."""
         usage_info = None
         # Získání informací o tokenech z response
         if hasattr(response, 'usage_metadata') and response.usage_metadata:
             prompt_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0) or 0
             completion_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0) or 0
+            # Tokeny promptu z kontextové cache (jsou zahrnuté v prompt_token_count)
+            cached_tokens = getattr(response.usage_metadata, 'cached_content_token_count', 0) or 0
             
             # Výpočet nákladů a zobrazení informací pouze pokud máme alespoň nějaké tokeny
             if prompt_tokens > 0 or completion_tokens > 0:
-                _, usage_info = self.calculate_cost(prompt_tokens, completion_tokens)
+                _, usage_info = self.calculate_cost(prompt_tokens, completion_tokens, cached_tokens)
                 self.print_token_usage(usage_info)
+                record_gemini_usage(usage_info)
         
-        return response.text.strip(), usage_info
+        return usage_info
     
-    def extract_pages_by_type(self, pdf_path: Path, page_types: List[str]) -> Dict[str, List[int]]:
+    def extract_pages_by_type(
+        self,
+        pdf_path: Path,
+        page_types: List[str],
+        session: Optional[PDFDocumentSession] = None,
+        workers: Optional[int] = None,
+    ) -> Dict[str, List[int]]:
         """
-        Identifikuje stránky podle typu (Consignment Note, MRN, atd.).
-        Používá PyPDF2 pro úsporu paměti.
+        Identifikuje stránky podle typu (Consignment Note, MRN, Commercial Invoice, Other).
+        Používá PyPDF2 pro úsporu paměti; všechny typy se klasifikují jedním průchodem stránkou.
         
         Args:
             pdf_path: Cesta k PDF souboru
             page_types: Seznam typů stránek k identifikaci (např. ["Consignment Note", "MRN"])
+            session: Sdílená relace dokumentu (volitelné, jinak se PDF otevře znovu)
+            workers: Počet procesů pro extrakci textu (výchozí `PAGE_TEXT_WORKERS`,
+                malé dokumenty se zpracují sériově)
             
         Returns:
             Slovník s typy stránek jako klíče a seznamy čísel stránek jako hodnoty
         """
-        import gc
-        from PyPDF2 import PdfReader
-        
         result = {page_type: [] for page_type in page_types}
         
         try:
-            with open(pdf_path, 'rb') as f:
-                reader = PdfReader(f)
-                
-                for page_num, page in enumerate(reader.pages, start=1):
+            with open_session(pdf_path, session) as doc:
+                doc.prefetch_texts(workers)
+                for page_num in range(1, doc.page_count + 1):
                     try:
-                        text = page.extract_text() or ""
-                        text_lower = text.lower()
-                        
-                        # Identifikace Consignment Note
-                        if "consignment note" in text_lower and "Consignment Note" in page_types:
-                            result["Consignment Note"].append(page_num)
-                        
-                        # Identifikace MRN stránky
-                        if "mrn" in text_lower and "MRN" in page_types:
-                            # Kontrola přítomnosti dlouhého kódu (např. "25CZ3O000OO1DAGMB8")
-                            has_long_code = any(
-                                len(word) >= 15 and word.isalnum() 
-                                for word in text.split() 
-                                if word
-                            )
-                            if has_long_code:
-                                result["MRN"].append(page_num)
+                        flags = doc.page_flags(page_num)
+                        for page_type in page_types:
+                            if flags.get(page_type):
+                                result[page_type].append(page_num)
                     except Exception as e:
                         print(f"Warning: Failed to process page {page_num}: {e}")
-            
-            # Explicit cleanup
-            del reader
-            gc.collect()
-            
         except Exception as e:
             print(f"Error processing PDF for page types: {e}")
         
         return result
     
-    def save_extracted_pages(self, pdf_path: Path, page_numbers: List[int], output_path: Path):
+    def save_extracted_pages(
+        self,
+        pdf_path: Path,
+        page_numbers: List[int],
+        output_path: Path,
+        session: Optional[PDFDocumentSession] = None,
+    ):
         """
         Uloží specifické stránky z PDF do nového souboru.
         
@@ -531,14 +1405,13 @@ class PDFProcessor:
             pdf_path: Cesta k originálnímu PDF
             page_numbers: Seznam čísel stránek k extrakci
             output_path: Cesta k výstupnímu PDF souboru
+            session: Sdílená relace dokumentu (volitelné, jinak se PDF otevře znovu)
         """
-        import gc
-        from PyPDF2 import PdfReader, PdfWriter
+        from PyPDF2 import PdfWriter
         
         # Optimalizace: Čteme pouze potřebné stránky, minimalizujeme paměť
-        # Použití streamu místo načtení celého souboru
-        with open(pdf_path, 'rb') as f:
-            reader = PdfReader(f)
+        with open_session(pdf_path, session) as doc:
+            reader = doc.reader
             writer = PdfWriter()
             
             for page_num in page_numbers:
@@ -549,88 +1422,881 @@ class PDFProcessor:
             with open(output_path, 'wb') as output_file:
                 writer.write(output_file)
         
-        # Explicitní úklid paměti po náročné operaci
-        del reader
+        # Úklid paměti po náročné operaci (plný gc jen nad prahem GC_THRESHOLD_MB)
         del writer
-        gc.collect()
+        maybe_collect()
     
     def convert_to_csv(self, data: List[Dict[str, Any]], output_path: Path):
         """
         Konvertuje seznam slovníků na CSV soubor.
         
+        Sloupce jsou dané schématem záznamu (`record_writers.CN_RECORD_SCHEMA`),
+        řádky se zapisují průběžně.
+        
         Args:
             data: Seznam slovníků s daty
             output_path: Cesta k výstupnímu CSV souboru
         """
-        if not data:
-            # Vytvoří prázdný CSV s hlavičkou pokud nejsou žádná data
-            with open(output_path, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['No data extracted'])
-            return
+        write_records(data, output_path, "csv")
+    
+    def _open_outputs(self, session: PDFDocumentSession, output_dir: Path) -> RecordOutputs:
+        """
+        Otevře výstupní CSV a formáty z `OUTPUT_EXTRA_FORMATS` ještě před extrakcí.
         
-        # Získání všech možných klíčů ze všech záznamů
-        all_keys = set()
-        for item in data:
-            all_keys.update(item.keys())
+        Výstupy se napojí na relaci (`record_sink`), takže záznamy se zapisují,
+        jak je vrací streamovaný parser nebo slučování segmentů.
+        """
+        pdf_path = session.pdf_path
+        # Krok 4: Vytvoření výstupní složky s názvem PDF (bez přípony)
+        outputs = RecordOutputs(output_dir / pdf_path.stem, pdf_path.stem)
+        try:
+            outputs.add("csv")
+            for fmt in OUTPUT_EXTRA_FORMATS:
+                if fmt == "csv":
+                    continue
+                try:
+                    outputs.add(fmt)
+                except (ValueError, ImportError) as e:
+                    print(f"  → Varování: {e}, přeskakuji")
+        except Exception:
+            outputs.discard()
+            raise
+        session.record_sink = outputs.write_many
+        return outputs
+    
+    def process_pdf(
+        self,
+        pdf_path: DocumentInput,
+        output_dir: Path,
+        extraction_id: Optional[str] = None,
+        filename: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Hlavní metoda pro zpracování PDF souboru.
+        
+        Args:
+            pdf_path: Cesta k PDF souboru, nebo dokument v paměti (bytes / memoryview / mmap / DocumentSource)
+            output_dir: Složka pro výstupní soubory
+            extraction_id: ID vytěžení pro logování (volitelné)
+            filename: Název dokumentu pro vstupy bez cesty (určuje názvy výstupů)
+            user: Uživatel pro rozpočty nákladů (volitelné)
+            
+        Returns:
+            Slovník s výsledky zpracování
+        """
+        start_time = time.time()
+        memory = MemoryGovernor()
         
-        # Seřazení klíčů pro konzistentní výstup
-        fieldnames = sorted(all_keys)
+        with trace("process_pdf", extraction_id=extraction_id) as root:
+            # PDF se naparsuje jednou; reader i cache textů stránek sdílí všechny kroky níže
+            with memory.stage("parse"):
+                session = PDFDocumentSession(pdf_path, name=filename)
+            with session:
+                root.set(pdf_filename=session.name, pages=session.page_count)
+                print(f"Zpracovávám soubor: {session.name}")
+                return self._process_session(session, output_dir, extraction_id, start_time, memory, user)
+    
+    def _process_session(
+        self,
+        session: PDFDocumentSession,
+        output_dir: Path,
+        extraction_id: Optional[str],
+        start_time: float,
+        memory: Optional[MemoryGovernor] = None,
+        user: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Kroky `process_pdf` nad již otevřenou relací dokumentu."""
+        memory = memory or MemoryGovernor()
+        self._plan_memory(session, memory)
         
-        with open(output_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
+        with self._open_outputs(session, output_dir) as outputs:
+            # Krok 0: Cache výsledků (stejné PDF + prompt + model => bez volání Gemini)
+            cache_key, cached = self._lookup_cached_result(session)
             
-            for row in data:
-                # Konverze seznamů na řetězce pro CSV
-                csv_row = {}
-                for key in fieldnames:
-                    value = row.get(key, '')
-                    if isinstance(value, list):
-                        csv_row[key] = '; '.join(str(v) for v in value)
-                    elif value is None:
-                        csv_row[key] = ''
-                    else:
-                        csv_row[key] = str(value)
-                writer.writerow(csv_row)
+            if cached is not None:
+                extracted_data, page_types, usage_info = cached
+            else:
+                with memory.stage("extract"):
+                    extracted_data, usage_info = self._extract_records(session, user)
+                memory.collect_if_needed()
+                with memory.stage("classify"):
+                    page_types = self._assign_mrn_pages(session, extracted_data)
+                self._store_result(cache_key, extracted_data, page_types, usage_info)
+            
+            return self._write_outputs(
+                session, output_dir, extraction_id, start_time, extracted_data, page_types, usage_info, memory, outputs
+            )
     
-    def process_pdf(self, pdf_path: Path, output_dir: Path, extraction_id: Optional[str] = None) -> Dict[str, Any]:
+    async def aprocess_pdf(
+        self,
+        pdf_path: DocumentInput,
+        output_dir: Path,
+        extraction_id: Optional[str] = None,
+        filename: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """
-        Hlavní metoda pro zpracování PDF souboru.
+        Asynchronní varianta `process_pdf` pro použití z event loopu (FastAPI).
+        
+        Volání Gemini neblokují event loop a lokální CPU kroky (parsování, klasifikace,
+        zápis výstupů) běží v executoru, takže jeden proces obslouží více souběžných extrakcí.
         
         Args:
-            pdf_path: Cesta k PDF souboru
+            pdf_path: Cesta k PDF souboru, nebo dokument v paměti (bytes / memoryview / mmap / DocumentSource)
             output_dir: Složka pro výstupní soubory
             extraction_id: ID vytěžení pro logování (volitelné)
+            filename: Název dokumentu pro vstupy bez cesty (určuje názvy výstupů)
+            user: Uživatel pro rozpočty nákladů (volitelné)
             
         Returns:
-            Slovník s výsledky zpracování
+            Slovník s výsledky zpracování (stejný tvar jako `process_pdf`)
         """
+        import asyncio
+        
         start_time = time.time()
-        print(f"Zpracovávám soubor: {pdf_path.name}")
+        
+        loop = asyncio.get_running_loop()
+        memory = MemoryGovernor()
+        with trace("process_pdf", extraction_id=extraction_id) as root:
+            with memory.stage("parse"):
+                session = await loop.run_in_executor(None, PDFDocumentSession, pdf_path, filename)
+            root.set(pdf_filename=session.name, pages=session.page_count)
+            print(f"Zpracovávám soubor: {session.name}")
+            try:
+                outputs = await loop.run_in_executor(None, self._open_outputs, session, output_dir)
+                with outputs:
+                    extracted_data, page_types, usage_info = await self._aextract_session(session, memory, user)
+                    return await loop.run_in_executor(
+                        None,
+                        in_context(self._write_outputs),
+                        session, output_dir, extraction_id, start_time, extracted_data, page_types, usage_info,
+                        memory, outputs,
+                    )
+            finally:
+                session.close()
+    
+    async def _aextract_session(
+        self,
+        session: PDFDocumentSession,
+        memory: MemoryGovernor,
+        user: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, List[int]], Optional[Dict[str, Any]]]:
+        """Kroky 0–3 `aprocess_pdf` nad otevřenou relací: cache, AI extrakce a přiřazení MRN stránek."""
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        self._plan_memory(session, memory)
+        cache_key, cached = await loop.run_in_executor(None, self._lookup_cached_result, session)
+        if cached is not None:
+            return cached
+        
+        with memory.stage("extract"):
+            extracted_data, usage_info = await self._aextract_records(session, user)
+        memory.collect_if_needed()
+        with memory.stage("classify"):
+            page_types = await loop.run_in_executor(None, self._assign_mrn_pages, session, extracted_data)
+        await loop.run_in_executor(
+            None, self._store_result, cache_key, extracted_data, page_types, usage_info
+        )
+        return extracted_data, page_types, usage_info
+    
+    def process_pdf_stream(
+        self,
+        pdf_path: DocumentInput,
+        output_dir: Path,
+        extraction_id: Optional[str] = None,
+        filename: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Varianta `process_pdf`, která průběžně vrací události pro streamované odpovědi (NDJSON).
+        
+        Události:
+        - `{"event": "record", "index": i, "record": {...}}` pro každý záznam, jakmile je znám
+        - `{"event": "result", "result": {...}}` na konci; výsledek má stejný tvar jako
+          `process_pdf` a obsahuje definitivní záznamy (po doplnění `mrn_pages`)
+        
+        Args:
+            pdf_path: Cesta k PDF souboru, nebo dokument v paměti (bytes / memoryview / mmap / DocumentSource)
+            output_dir: Složka pro výstupní soubory
+            extraction_id: ID vytěžení pro logování (volitelné)
+            filename: Název dokumentu pro vstupy bez cesty (určuje názvy výstupů)
+            user: Uživatel pro rozpočty nákladů (volitelné)
+        """
+        start_time = time.time()
+        memory = MemoryGovernor()
+        
+        # Generátor může po každém yield pokračovat v jiném kontextu (StreamingResponse),
+        # proto se po yield obnovuje aktuální span (`resume`)
+        with trace("process_pdf_stream", extraction_id=extraction_id) as root:
+            with memory.stage("parse"):
+                session = PDFDocumentSession(pdf_path, name=filename)
+            with session:
+                root.set(pdf_filename=session.name, pages=session.page_count)
+                print(f"Zpracovávám soubor (stream): {session.name}")
+                self._plan_memory(session, memory)
+                with self._open_outputs(session, output_dir) as outputs:
+                    cache_key, cached = self._lookup_cached_result(session)
+                    
+                    if cached is not None:
+                        extracted_data, page_types, usage_info = cached
+                        for index, record in enumerate(extracted_data):
+                            yield {"event": "record", "index": index, "record": record}
+                            resume(root)
+                    else:
+                        print("  → Extrahuji data pomocí Google Gemini Vision API (stream)...")
+                        extracted_data = []
+                        usage_info = None
+                        # Stream posílá celý dokument jedním voláním
+                        preflight = self._preflight(session, None, user)
+                        # Krok "extract" zahrnuje i čas, kdy generátor čeká na konzumenta streamu
+                        with memory.stage("extract") as extract_span:
+                            try:
+                                if preflight["budget"].get("action") == "deterministic":
+                                    usage_info = self._budget_skipped_usage()
+                                else:
+                                    processor = self._for_model(preflight["budget"].get("model") or self.model)
+                                    stream = processor.stream_data_with_ai(session.pdf_path, session=session)
+                                    while True:
+                                        try:
+                                            record = next(stream)
+                                        except StopIteration as stop:
+                                            usage_info = stop.value
+                                            break
+                                        extracted_data.append(record)
+                                        self._emit_records(session, [record])
+                                        yield {"event": "record", "index": len(extracted_data) - 1, "record": record}
+                                        resume(extract_span)
+                            finally:
+                                self._settle_budget(preflight, usage_info)
+                            
+                            streamed = len(extracted_data)
+                            extracted_data, usage_info = self._complete_extraction(session, extracted_data, usage_info)
+                        # Záznamy z fallback extrakce bez AI ještě nebyly odeslány
+                        for index in range(streamed, len(extracted_data)):
+                            yield {"event": "record", "index": index, "record": extracted_data[index]}
+                            resume(root)
+                        
+                        memory.collect_if_needed()
+                        with memory.stage("classify"):
+                            page_types = self._assign_mrn_pages(session, extracted_data)
+                        self._store_result(cache_key, extracted_data, page_types, usage_info)
+                    
+                    result = self._write_outputs(
+                        session, output_dir, extraction_id, start_time, extracted_data, page_types, usage_info, memory, outputs
+                    )
+            
+        yield {"event": "result", "result": result}
+    
+    def _plan_memory(self, session: PDFDocumentSession, memory: MemoryGovernor) -> None:
+        """
+        Odhadne paměťovou náročnost dokumentu a nastaví relaci zvolený režim zpracování.
+        
+        Plán se počítá jednou na job; dávkové zpracování ho aplikuje už před `preload`,
+        aby změna režimu nezahodila předem spočítané texty stránek.
+        """
+        if memory.estimated_mb is None:
+            memory.plan(session.size, session.page_count)
+        session.set_processing_mode(memory.mode)
+    
+    def _lookup_cached_result(
+        self,
+        session: PDFDocumentSession,
+    ) -> Tuple[Optional[str], Optional[Tuple[List[Dict[str, Any]], Dict[str, List[int]], Dict[str, Any]]]]:
+        """Vrátí klíč cache a při zásahu i (záznamy, page_types, usage_info)."""
+        cache_key = self._result_cache_key(session)
+        cached = self.result_cache.get(cache_key, model=self.model) if cache_key else None
+        if cached is None:
+            return cache_key, None
+        
+        print("  → Výsledek nalezen v cache (stejné PDF, prompt i model), Gemini se nevolá")
+        extracted_data = cached.get("extracted_data") or []
+        page_types = cached.get("page_types") or {"Consignment Note": [], "MRN": []}
+        return cache_key, (extracted_data, page_types, self._cache_hit_usage(cache_key, cached))
+    
+    def _store_result(
+        self,
+        cache_key: Optional[str],
+        extracted_data: List[Dict[str, Any]],
+        page_types: Dict[str, List[int]],
+        usage_info: Optional[Dict[str, Any]],
+    ) -> None:
+        """Uloží výsledek AI extrakce do cache a označí usage_info jako miss."""
+        if not cache_key:
+            return
+        ai_diag = (usage_info or {}).get("ai_diagnostics") or {}
+        # Ukládáme jen skutečný výsledek AI (fallback bez AI se příště zkusí znovu přes Gemini)
+        # modelu, pro který je klíč; výsledek levnějšího modelu (rozpočet, router) by se jinak
+        # vracel místo výsledku AI_MODEL
+        produced_by = (usage_info or {}).get("model")
+        if ai_diag.get("ai_json_parsed") and not self._is_degraded(usage_info) and produced_by == self.model:
+            self.result_cache.put(cache_key, extracted_data, page_types, usage_info, model=produced_by)
+        if usage_info is not None:
+            usage_info["cache"] = {"hit": False, "key": cache_key}
+    
+    def _result_cache_key(self, session: PDFDocumentSession) -> Optional[str]:
+        """Vrátí klíč cache výsledků pro dokument (None, pokud je cache vypnutá)."""
+        if self.result_cache is None:
+            return None
+        try:
+            return self.result_cache.make_key(session.sha256(), EXTRACTION_PROMPT, self.model)
+        except OSError as e:
+            print(f"Varování: Nepodařilo se spočítat hash PDF pro cache: {e}")
+            return None
+    
+    def _cache_hit_usage(self, cache_key: str, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """Sestaví usage_info pro zásah cache (nulové tokeny i cena, původní usage pro přehled)."""
+        _, usage_info = self.calculate_cost(0, 0)
+        usage_info["cache"] = {
+            "hit": True,
+            "key": cache_key,
+            "cached_at": cached.get("created_at"),
+            "original_usage": cached.get("usage_info"),
+        }
+        return usage_info
+    
+    def _extract_records(
+        self,
+        session: PDFDocumentSession,
+        user: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Krok 1: AI extrakce záznamů, při prázdném výsledku deterministický fallback."""
+        # Hybridní režim: deterministická extrakce první, Gemini jen pro bloky s nízkou jistotou
+        hybrid = self._hybrid_plan(session) if self.layout_registry is not None else None
+        if hybrid is not None and hybrid["result"] is not None:
+            return self._complete_extraction(session, *hybrid["result"])
+        # Nejisté bloky jdou do Gemini stejnou cestou (rozpočet, router) jako celý dokument
+        partial = hybrid if hybrid is not None and hybrid["ai_segments"] else None
         
         # Krok 1: Extrakce dat pomocí Google Gemini Vision API
-        print("  → Extrahuji data pomocí Google Gemini Vision API (PDF)...")
-        extracted_data, usage_info = self.extract_data_with_ai(pdf_path=pdf_path)
+        segments = partial["ai_segments"] if partial else self._plan_ai_extraction(session)
+        preflight = self._preflight(session, segments, user)
+        usage_info = None
+        try:
+            action = preflight["budget"].get("action")
+            if action == "deterministic":
+                extracted_data, usage_info = [], self._budget_skipped_usage()
+            elif action == "downgrade":
+                extracted_data, usage_info = self._for_model(preflight["budget"]["model"])._ai_extract(
+                    session, segments, partial
+                )
+            elif self.model_router is None:
+                extracted_data, usage_info = self._ai_extract(session, segments, partial)
+            else:
+                extracted_data, usage_info = self._routed_ai_extract(session, segments, partial)
+        finally:
+            self._settle_budget(preflight, usage_info)
+        
+        if hybrid is not None and partial is None:
+            self._learn_layout(hybrid, extracted_data, usage_info)
+        return self._complete_extraction(session, extracted_data, usage_info)
+    
+    async def _aextract_records(
+        self,
+        session: PDFDocumentSession,
+        user: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Asynchronní varianta `_extract_records`."""
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        hybrid = None
+        if self.layout_registry is not None:
+            # Deterministická část hybridního režimu běží v executoru
+            hybrid = await loop.run_in_executor(None, in_context(self._hybrid_plan), session)
+            if hybrid is not None and hybrid["result"] is not None:
+                return await loop.run_in_executor(None, in_context(self._complete_extraction), session, *hybrid["result"])
+        partial = hybrid if hybrid is not None and hybrid["ai_segments"] else None
+        
+        if partial:
+            segments = partial["ai_segments"]
+        else:
+            segments = await loop.run_in_executor(None, self._plan_ai_extraction, session)
+        # Rezervace v SQLite může krátce čekat na zámek
+        preflight = await loop.run_in_executor(None, self._preflight, session, segments, user)
+        usage_info = None
+        try:
+            action = preflight["budget"].get("action")
+            if action == "deterministic":
+                extracted_data, usage_info = [], self._budget_skipped_usage()
+            elif action == "downgrade":
+                extracted_data, usage_info = await self._for_model(preflight["budget"]["model"])._aai_extract(
+                    session, segments, partial
+                )
+            elif self.model_router is None:
+                extracted_data, usage_info = await self._aai_extract(session, segments, partial)
+            else:
+                extracted_data, usage_info = await self._arouted_ai_extract(session, segments, partial)
+        finally:
+            await loop.run_in_executor(None, self._settle_budget, preflight, usage_info)
+        
+        if hybrid is not None and partial is None:
+            await loop.run_in_executor(None, self._learn_layout, hybrid, extracted_data, usage_info)
+        return await loop.run_in_executor(None, in_context(self._complete_extraction), session, extracted_data, usage_info)
+    
+    def estimate_extraction(self, session: PDFDocumentSession) -> Dict[str, Any]:
+        """
+        Odhad tokenů, ceny a doby AI extrakce dokumentu bez volání Gemini.
+        
+        Použije stejný výběr stránek a segmentaci jako extrakce.
+        """
+        return self._estimate(session, self._plan_ai_extraction(session, verbose=False))
+    
+    def _estimate(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        sizes = [session.page_count] if segments is None else [len(pages) for pages in segments]
+        return self.cost_estimator.estimate(model or self.model, sum(sizes), len(sizes), session.size)
+    
+    def _preflight(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        user: Optional[str],
+    ) -> Dict[str, Any]:
+        """
+        Odhad ceny před voláním Gemini a kontrola rozpočtů (rezervuje odhad).
+        
+        Raises:
+            BudgetExceededError: Odhad se nevejde do rozpočtu a akce je `reject`
+        """
+        estimate = self._estimate(session, segments)
+        print(
+            f"  → Odhad: ~{estimate['total_tokens']:,} tokenů, ~{estimate['cost_usd']:.4f} USD, "
+            f"~{estimate['seconds']:.0f} s"
+        )
+        if self.cost_budget is None:
+            return {"estimate": estimate, "budget": {}}
+        
+        # Levnější modely pro downgrade, od nejdražšího
+        alternatives = [self._estimate(session, segments, model) for model in MODEL_ROUTER_MODELS if model != self.model]
+        alternatives = sorted(
+            (e for e in alternatives if e["cost_usd"] < estimate["cost_usd"]),
+            key=lambda e: e["cost_usd"],
+            reverse=True,
+        )
+        budget = self.cost_budget.admit(user, [estimate] + alternatives)
+        if budget["action"] == "downgrade":
+            print(f"  → Rozpočet ({budget['scope']}): místo {self.model} použiji levnější {budget['model']}")
+        elif budget["action"] == "deterministic":
+            print(f"  → Rozpočet ({budget['scope']}) vyčerpán, extrakce proběhne bez AI")
+        return {"estimate": estimate, "budget": budget}
+    
+    def _settle_budget(self, preflight: Dict[str, Any], usage_info: Optional[Dict[str, Any]]) -> None:
+        """Zapíše skutečnou cenu do rozpočtu a odhad do usage_info."""
+        if usage_info is not None:
+            usage_info["preflight"] = preflight
+        if self.cost_budget is not None and preflight["budget"]:
+            self.cost_budget.settle(preflight["budget"], (usage_info or {}).get("total_cost_usd", 0.0))
+    
+    def _budget_skipped_usage(self) -> Dict[str, Any]:
+        """usage_info extrakce, u které rozpočet nedovolil volat Gemini."""
+        ai_diag = self._new_ai_diagnostics()
+        ai_diag.update({"ai_used": False, "degraded": True, "degraded_reason": "budget"})
+        return {"ai_diagnostics": ai_diag}
+    
+    def _ai_extract(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        hybrid: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        AI extrakce celého dokumentu (segments=None) nebo po segmentech modelem procesoru.
+        
+        S plánem `hybrid` jsou segmenty nejisté bloky a výsledky se vloží
+        mezi deterministické záznamy jistých bloků.
+        """
+        if hybrid is not None:
+            results, bytes_sent = self._run_segment_extractions(session, segments)
+            return self._merge_hybrid_results(session, hybrid, results, bytes_sent)
+        if segments is None:
+            # File API potřebuje soubor; dokument v paměti se zapíše jen v tomto případě
+            return self.extract_data_with_ai(pdf_path=session.file_path(), session=session)
+        return self.extract_data_with_ai_segmented(session, segments)
+    
+    async def _aai_extract(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        hybrid: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Asynchronní varianta `_ai_extract`."""
+        import asyncio
+        
+        if hybrid is not None:
+            results, bytes_sent = await self._arun_segment_extractions(session, segments)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._merge_hybrid_results, session, hybrid, results, bytes_sent
+            )
+        if segments is None:
+            upload_path = await asyncio.get_running_loop().run_in_executor(None, session.file_path)
+            return await self.aextract_data_with_ai(pdf_path=upload_path, session=session)
+        return await self.aextract_data_with_ai_segmented(session, segments)
+    
+    def _routed_ai_extract(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        hybrid: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        AI extrakce modelem zvoleným routerem.
+        
+        Neprojde-li výstup validací, extrakce se zopakuje silnějším modelem
+        (nejvýše `MODEL_ROUTER_MAX_ESCALATIONS`krát).
+        """
+        decision = self._route_document(session, segments)
+        attempts = []
+        model = decision["model"]
+        while model is not None:
+            start = time.perf_counter()
+            extracted_data, usage_info = self._for_model(model)._ai_extract(session, segments, hybrid)
+            attempts.append((model, extracted_data, usage_info))
+            model = self._after_routed_attempt(decision, model, time.perf_counter() - start, extracted_data, usage_info)
+        return self._routed_result(decision, attempts)
+    
+    async def _arouted_ai_extract(
+        self,
+        session: PDFDocumentSession,
+        segments: Optional[List[List[int]]],
+        hybrid: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Asynchronní varianta `_routed_ai_extract`."""
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        decision = await loop.run_in_executor(None, self._route_document, session, segments)
+        attempts = []
+        model = decision["model"]
+        while model is not None:
+            start = time.perf_counter()
+            extracted_data, usage_info = await self._for_model(model)._aai_extract(session, segments, hybrid)
+            attempts.append((model, extracted_data, usage_info))
+            model = self._after_routed_attempt(decision, model, time.perf_counter() - start, extracted_data, usage_info)
+        return self._routed_result(decision, attempts)
+    
+    def _route_document(self, session: PDFDocumentSession, segments: Optional[List[List[int]]]) -> Dict[str, Any]:
+        """Rozhodnutí routeru pro dokument (odhad tokenů z odesílaných stránek)."""
+        prompt_chars = len(self._system_prompt())
+        # Každý segment je samostatný požadavek včetně promptu
+        sizes = [session.page_count] if segments is None else [len(pages) for pages in segments]
+        estimates = [estimate_document_tokens(prompt_chars, size) for size in sizes]
+        
+        decision = self.model_router.route(
+            sum(sizes),
+            sum(input_tokens for input_tokens, _ in estimates),
+            sum(output_tokens for _, output_tokens in estimates),
+            max(input_tokens for input_tokens, _ in estimates),
+        )
+        if decision["model"] is None:
+            decision["model"] = self.model
+        decision["attempts"] = []
+        print(f"  → Model: {decision['model']} ({decision['reason']}, politika {decision['policy']})")
+        return decision
+    
+    def _after_routed_attempt(
+        self,
+        decision: Dict[str, Any],
+        model: str,
+        seconds: float,
+        extracted_data: List[Dict[str, Any]],
+        usage_info: Optional[Dict[str, Any]],
+    ) -> Optional[str]:
+        """Zapíše pokus do historie routeru a vrátí model pro eskalaci (None = konec)."""
+        failure = validate_extraction(extracted_data, usage_info)
+        degraded = self._is_degraded(usage_info)
+        self.model_router.record(model, decision["pages"], seconds, failure is None)
+        decision["attempts"].append({
+            "model": model,
+            "seconds": round(seconds, 3),
+            "records": len(extracted_data),
+            "validation": failure or "ok",
+        })
+        
+        # Při výpadku Gemini se neeskaluje (selhal backend, ne kvalita výstupu)
+        if failure is None or degraded or len(decision["escalations"]) >= MODEL_ROUTER_MAX_ESCALATIONS:
+            return None
+        stronger = self.model_router.escalation_for(model)
+        if stronger is None:
+            return None
+        print(f"  → Výstup {model} neprošel validací ({failure}), eskaluji na {stronger}")
+        decision["escalations"].append({"from": model, "to": stronger, "reason": failure})
+        return stronger
+    
+    def _routed_result(
+        self,
+        decision: Dict[str, Any],
+        attempts: List[Tuple[str, List[Dict[str, Any]], Optional[Dict[str, Any]]]],
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Výsledek routované extrakce: poslední validní pokus, jinak poslední se záznamy.
+        
+        Tokeny a náklady jsou součtem všech pokusů, rozhodnutí routeru je v `usage_info["routing"]`.
+        """
+        valid = [attempt for attempt, info in zip(attempts, decision["attempts"]) if info["validation"] == "ok"]
+        with_records = [attempt for attempt in attempts if attempt[1]]
+        model, extracted_data, usage_info = (valid or with_records or attempts)[-1]
+        
+        usage_info = dict(usage_info) if usage_info is not None else {}
+        if len(attempts) > 1:
+            merged = merge_usage_infos([u for _, _, u in attempts]) or {}
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens",
+                        "input_cost_usd", "output_cost_usd", "total_cost_usd", "cached_input_cost_usd"):
+                if key in merged:
+                    usage_info[key] = merged[key]
+        usage_info["model"] = model
+        decision["selected_model"] = model
+        usage_info["routing"] = decision
+        return extracted_data, usage_info
+    
+    def _for_model(self, model: str) -> "PDFProcessor":
+        """
+        Procesor pro daný model (sdílí cache, kvóty, retry a logger).
+        
+        Souběžné dokumenty se zpracovávají různými modely, proto se model
+        nepřepíná na sdíleném procesoru, ale v jeho mělké kopii.
+        """
+        import copy
+        
+        if model == self.model:
+            return self
+        processor = self._model_processors.get(model)
+        if processor is None:
+            processor = copy.copy(self)
+            processor.model = model
+            processor.google_client = self.provider.model(model)
+            processor.prompt_cache = create_prompt_cache(model) if self.provider.supports_prompt_cache else None
+            processor.circuit_breaker = circuit_breaker_for(model)
+            processor.hedging = create_hedging_policy()
+            # Souběžné vytvoření dvou kopií je neškodné, platí ta zapsaná později
+            self._model_processors[model] = processor
+        return processor
+    
+    def _hybrid_plan(self, session: PDFDocumentSession) -> Optional[Dict[str, Any]]:
+        """
+        Hybridní režim: deterministická extrakce po CN blocích s ohodnocením jistoty.
+        
+        U důvěryhodného layoutu se do Gemini pošlou jen bloky s jistotou pod
+        `HYBRID_MIN_CONFIDENCE` (`ai_segments`); když jsou jisté všechny, Gemini se nevolá vůbec.
+        
+        Returns:
+            None, pokud hybridní režim nejde použít (dokument bez CN stránek), jinak slovník
+            s otiskem layoutu, deterministickými záznamy, diagnostikou, segmenty pro AI
+            a výsledkem (`result` = (záznamy, usage_info), pokud se Gemini nevolá)
+        """
+        cn_pages = session.pages_of_type("Consignment Note")
+        if not cn_pages:
+            return None
+        
+        # Jeden blok = CN stránka + stránky do další CN
+        blocks = plan_segments(list(range(1, session.page_count + 1)), cn_pages, 1)
+        block_records = [
+            self.extract_data_without_ai(session.pdf_path, session=session, pages=block) for block in blocks
+        ]
+        confidences = [block_confidence(records) for records in block_records]
+        low = [i for i, confidence in enumerate(confidences) if confidence < HYBRID_MIN_CONFIDENCE]
+        
+        first_record = block_records[0][0] if block_records[0] else None
+        fingerprint = layout_fingerprint(session.reader, cn_pages[0], first_record)
+        trusted = self.layout_registry.is_trusted(fingerprint)
+        
+        plan: Dict[str, Any] = {
+            "fingerprint": fingerprint,
+            "deterministic": [record for records in block_records for record in records],
+            "diag": {
+                "layout_fingerprint": fingerprint,
+                "layout_trusted": trusted,
+                "blocks": len(blocks),
+                "low_confidence_blocks": len(low),
+                "min_confidence": min(confidences),
+            },
+            "block_records": block_records,
+            "low": low,
+            "ai_segments": None,
+            "result": None,
+        }
+        if not trusted or len(low) == len(blocks):
+            return plan
+        
+        if not low:
+            print(f"  → Hybridní režim: známý layout, všech {len(blocks)} bloků s vysokou jistotou, Gemini se nevolá")
+            _, usage_info = self.calculate_cost(0, 0)
+            usage_info["ai_diagnostics"] = {
+                "ai_used": False,
+                "ai_method": "deterministic",
+                "ai_json_parsed": False,
+                "ai_error": None,
+                "hybrid": plan["diag"],
+            }
+            usage_info["ai_input"] = {"pages_sent": 0, "bytes_sent": 0}
+            plan["result"] = (plan["deterministic"], usage_info)
+            return plan
+        
+        print(f"  → Hybridní režim: do Gemini posílám {len(low)} z {len(blocks)} bloků s nízkou jistotou")
+        ai_pages = set(self._select_ai_pages(session))
+        plan["ai_segments"] = [[p for p in blocks[i] if p in ai_pages] or blocks[i] for i in low]
+        return plan
+    
+    def _merge_hybrid_results(
+        self,
+        session: PDFDocumentSession,
+        hybrid: Dict[str, Any],
+        results: List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]],
+        bytes_sent: int,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Vloží výsledky AI na místo nejistých bloků (pořadí záznamů odpovídá dokumentu)."""
+        ai_segments = hybrid["ai_segments"]
+        ai_by_block = dict(zip(hybrid["low"], zip(ai_segments, results)))
+        extracted_data: List[Dict[str, Any]] = []
+        segment_diags: List[Dict[str, Any]] = []
+        for index, records in enumerate(hybrid["block_records"]):
+            if index in ai_by_block:
+                records, diag = self._merge_segment(session, *ai_by_block[index])
+                segment_diags.append(diag)
+            self._emit_records(session, records)
+            extracted_data.extend(records)
+        
+        usage_info = merge_usage_infos([u for _, u in results]) or {}
+        all_parsed = all(d.get("ai_json_parsed") for d in segment_diags)
+        usage_info["ai_diagnostics"] = {
+            "ai_used": True,
+            "ai_method": "hybrid",
+            "ai_json_parsed": all_parsed,
+            "ai_error": None if all_parsed else "segment_failed",
+            "segments": segment_diags,
+            "hybrid": hybrid["diag"],
+        }
+        usage_info["ai_input"] = {
+            "pages_sent": sum(len(segment) for segment in ai_segments),
+            "bytes_sent": bytes_sent,
+        }
+        return extracted_data, usage_info
+    
+    def _learn_layout(
+        self,
+        hybrid: Dict[str, Any],
+        extracted_data: List[Dict[str, Any]],
+        usage_info: Optional[Dict[str, Any]],
+    ) -> None:
+        """Porovná výsledek AI s deterministickou extrakcí a zapíše shodu/neshodu do registru layoutů."""
+        ai_diag = (usage_info or {}).get("ai_diagnostics") or {}
+        if not ai_diag.get("ai_json_parsed"):
+            return
+        agreed = records_agree(hybrid["deterministic"], extracted_data)
+        entry = self.layout_registry.record_comparison(hybrid["fingerprint"], agreed)
+        ai_diag["hybrid"] = {**hybrid["diag"], "agreed_with_ai": agreed, "layout_trusted": entry["trusted"]}
+    
+    def _plan_ai_extraction(self, session: PDFDocumentSession, verbose: bool = True) -> Optional[List[List[int]]]:
+        """
+        Rozhodne, co se pošle do Gemini.
+        
+        Args:
+            session: Relace dokumentu
+            verbose: Vypsat, co se do Gemini pošle
+        
+        Returns:
+            None = celý dokument jedním voláním, jinak segmenty (čísla stránek originálu)
+        """
+        ai_pages = self._select_ai_pages(session)
+        segments = self._plan_ai_segments(session, ai_pages)
+        if len(segments) == 1 and len(ai_pages) == session.page_count:
+            if verbose:
+                print("  → Extrahuji data pomocí Google Gemini Vision API (PDF)...")
+            return None
+        if not verbose:
+            return segments
+        
+        if len(ai_pages) < session.page_count:
+            print(f"  → Do Gemini posílám jen relevantní stránky: {len(ai_pages)} z {session.page_count}")
+        if len(segments) > 1:
+            print(f"  → Extrahuji data pomocí Google Gemini po segmentech ({len(segments)} segmentů, max {SEGMENT_WORKERS} souběžně)...")
+        else:
+            print("  → Extrahuji data pomocí Google Gemini Vision API (PDF, vybrané stránky)...")
+        return segments
+    
+    def _complete_extraction(
+        self,
+        session: PDFDocumentSession,
+        extracted_data: List[Dict[str, Any]],
+        usage_info: Optional[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Doplní statistiku vstupu do AI a při prázdném výsledku spustí fallback bez AI."""
+        pdf_path = session.pdf_path
+        
+        if usage_info is not None:
+            ai_input = usage_info.setdefault("ai_input", {
+                "pages_sent": session.page_count,
+                "bytes_sent": session.size,
+            })
+            ai_input["pages_total"] = session.page_count
 
         # Fallback: pokud AI nic nevrátí, zkusíme deterministickou extrakci z textu PDF
         if not extracted_data:
-            print("  → AI nevrátila žádná data, zkouším fallback extrakci bez AI...")
+            if self._is_degraded(usage_info):
+                reason = ((usage_info or {}).get("ai_diagnostics") or {}).get("degraded_reason")
+                if reason == "budget":
+                    print("  → Rozpočet vyčerpán, degradovaný režim: deterministická extrakce bez AI...")
+                else:
+                    print("  → Gemini nedostupné, degradovaný režim: deterministická extrakce bez AI...")
+            else:
+                print("  → AI nevrátila žádná data, zkouším fallback extrakci bez AI...")
             try:
-                extracted_data = self.extract_data_without_ai(pdf_path=pdf_path)
+                with span("fallback") as fallback_span:
+                    extracted_data = self.extract_data_without_ai(pdf_path=pdf_path, session=session)
+                    fallback_span.set(records=len(extracted_data))
+                if usage_info is not None:
+                    usage_info.setdefault("ai_diagnostics", {})["fallback_used"] = True
                 print(f"  → Fallback extrakce: {len(extracted_data)} záznamů")
             except Exception as e:
                 print(f"  → Fallback extrakce selhala: {e}")
         
+        return extracted_data, usage_info
+    
+    def _select_ai_pages(self, session: PDFDocumentSession) -> List[int]:
+        """
+        Vybere stránky pro Gemini: Consignment Note + kandidáti na MRN z lokální klasifikace.
+        
+        Prompt stejně instruuje model, aby Commercial Invoice a ostatní stránky ignoroval,
+        takže jejich upload jen zvyšuje počet vstupních tokenů. Bez nalezených CN stránek
+        (např. sken bez textové vrstvy) se posílá celý dokument.
+        """
+        all_pages = list(range(1, session.page_count + 1))
+        if not PAGE_PREFILTER:
+            return all_pages
+        
+        cn_pages = session.pages_of_type("Consignment Note")
+        if not cn_pages:
+            return all_pages
+        
+        mrn_pages = session.pages_of_type("MRN")
+        return sorted(set(cn_pages) | set(mrn_pages))
+    
+    def _plan_ai_segments(self, session: PDFDocumentSession, pages: List[int]) -> List[List[int]]:
+        """Rozhodne o segmentaci: velký dokument s CN stránkami => více segmentů, jinak jeden."""
+        # Paměťový governor může segmentaci vynutit i pod SEGMENT_MIN_PAGES
+        min_pages = 1 if session.processing_mode == MODE_SEGMENTED else SEGMENT_MIN_PAGES
+        if not SEGMENTED_EXTRACTION or len(pages) < min_pages:
+            return [pages]
+        
+        cn_pages = session.pages_of_type("Consignment Note")
+        if not cn_pages:
+            # Bez textové vrstvy nevíme, kde dokument bezpečně rozdělit
+            return [pages]
+        return plan_segments(pages, cn_pages, SEGMENT_MAX_PAGES)
+    
+    def _assign_mrn_pages(self, session: PDFDocumentSession, extracted_data: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        """Krok 3: Identifikace CN/MRN stránek a doplnění `mrn_pages` do záznamů."""
+        pdf_path = session.pdf_path
+        
         # Krok 3: Identifikace typů stránek (CN a MRN)
         print("  → Identifikuji MRN stránky...")
         
-        # Optimalizace: Uvolnění paměti po náročné operaci Gemini
-        # Gemini data už máme v extracted_data
-        import gc
-        gc.collect()
-
-        page_types = self.extract_pages_by_type(pdf_path, ["Consignment Note", "MRN"])
+        page_types = self.extract_pages_by_type(pdf_path, ["Consignment Note", "MRN"], session=session)
         found_cn_pages = page_types.get("Consignment Note", [])
         found_mrn_pages = page_types.get("MRN", [])
         
@@ -706,32 +2372,66 @@ class PDFProcessor:
                         else:
                             record["mrn_pages"] = []
         
-        # Krok 4: Vytvoření výstupní složky s názvem PDF (bez přípony)
-        output_folder = output_dir / pdf_path.stem
-        output_folder.mkdir(parents=True, exist_ok=True)
-        
-        # Krok 5: Uložení CSV s extrahovanými daty
-        csv_path = output_folder / f"{pdf_path.stem}.csv"
-        self.convert_to_csv(extracted_data, csv_path)
-        print(f"  → Uloženo: {csv_path}")
-        
-        # Krok 6: Extrakt MRN stránek do samostatného PDF
-        mrn_pdf_path = None
-        mrn_pages_to_extract = page_types.get("MRN", [])
-        if mrn_pages_to_extract:
-            mrn_pdf_path = output_folder / f"{pdf_path.stem}_MRN.pdf"
-            self.save_extracted_pages(pdf_path, mrn_pages_to_extract, mrn_pdf_path)
-            print(f"  → Uloženo: {mrn_pdf_path} ({len(mrn_pages_to_extract)} stránek)")
-        else:
-            print("  → Varování: Nebyly nalezeny žádné MRN stránky")
+        return page_types
+    
+    def _write_outputs(
+        self,
+        session: PDFDocumentSession,
+        output_dir: Path,
+        extraction_id: Optional[str],
+        start_time: float,
+        extracted_data: List[Dict[str, Any]],
+        page_types: Dict[str, List[int]],
+        usage_info: Optional[Dict[str, Any]],
+        memory: Optional[MemoryGovernor] = None,
+        outputs: Optional[RecordOutputs] = None,
+    ) -> Dict[str, Any]:
+        """
+        Kroky 4–6: výstupní CSV a MRN PDF, zalogování a sestavení výsledku.
+        
+        `outputs` jsou výstupy otevřené před extrakcí (`_open_outputs`); zapisují se
+        do nich jen záznamy, které ještě nebyly zapsány průběžně.
+        """
+        pdf_path = session.pdf_path
+        memory = memory or MemoryGovernor()
+        
+        with memory.stage("write"):
+            if outputs is None:
+                outputs = self._open_outputs(session, output_dir)
+            output_folder = outputs.output_folder
+            
+            # Krok 5: Uložení CSV (a dalších formátů) s extrahovanými daty
+            with outputs:
+                extra_outputs = outputs.finish(extracted_data)
+            csv_path = extra_outputs.pop("csv")
+            print(f"  → Uloženo: {csv_path}")
+            for path in extra_outputs.values():
+                print(f"  → Uloženo: {path}")
+            
+            # Krok 6: Extrakt MRN stránek do samostatného PDF
+            mrn_pdf_path = None
+            mrn_pages_to_extract = page_types.get("MRN", [])
+            if mrn_pages_to_extract:
+                mrn_pdf_path = output_folder / f"{pdf_path.stem}_MRN.pdf"
+                self.save_extracted_pages(pdf_path, mrn_pages_to_extract, mrn_pdf_path, session=session)
+                print(f"  → Uloženo: {mrn_pdf_path} ({len(mrn_pages_to_extract)} stránek)")
+            else:
+                print("  → Varování: Nebyly nalezeny žádné MRN stránky")
+        
+        # Strom spanů extrakce (do výsledku, logu a hlavičky Server-Timing)
+        timings = current_timings()
+        if usage_info is not None:
+            usage_info["memory"] = memory.summary()
         
         processing_time = time.time() - start_time
+        record_extraction(processing_time, session.page_count, self._outcome(usage_info))
         
         # Logování úspěšného vytěžení
         if self.logger and extraction_id and usage_info:
             output_files_dict = {
                 "csv": str(csv_path),
-                "mrn_pdf": str(mrn_pdf_path) if mrn_pdf_path else None
+                "mrn_pdf": str(mrn_pdf_path) if mrn_pdf_path else None,
+                **extra_outputs,
             }
             self.logger.log_extraction_success(
                 extraction_id=extraction_id,
@@ -739,7 +2439,8 @@ class PDFProcessor:
                 usage_info=usage_info,
                 extracted_records_count=len(extracted_data) if extracted_data else 0,
                 processing_time=processing_time,
-                output_files=output_files_dict
+                output_files=output_files_dict,
+                timings=timings,
             )
         
         return {
@@ -748,9 +2449,13 @@ class PDFProcessor:
             "output_folder": str(output_folder),
             "output_files": {
                 "csv": str(csv_path),
-                "mrn_pdf": str(mrn_pdf_path) if mrn_pdf_path else None
+                "mrn_pdf": str(mrn_pdf_path) if mrn_pdf_path else None,
+                **extra_outputs,
             },
             "usage_info": usage_info,
-            "processing_time": processing_time
+            "processing_time": processing_time,
+            "timings": timings,
+            # Gemini bylo nedostupné, záznamy jsou z deterministické extrakce
+            "degraded": self._is_degraded(usage_info),
         }
 
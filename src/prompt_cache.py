@@ -0,0 +1,169 @@
+"""Kontextová cache Gemini pro statický extrakční prompt.
+
+`EXTRACTION_PROMPT` se uloží jako `system_instruction` do Gemini cached content
+(`genai.caching.CachedContent`) a volání pak posílají jen krátký pokyn a PDF.
+
+- Cache má TTL (`GEMINI_PROMPT_CACHE_TTL`); před vypršením se prodlouží.
+- Klíčem je hash promptu a modelu: změna promptu založí novou cache
+  (starou, kterou založil tento proces, smaže).
+- Workery sdílí cache přes `display_name` (najdou existující místo zakládání další).
+- Prompt pod minimem tokenů, které model pro cached content vyžaduje
+  (`min_cache_tokens`), se do cache vůbec nezakládá; důvod vrací `skip_reason`.
+- Když cache nejde založit (API ji nepodporuje), vrací se None a volající
+  použije původní spojený prompt; další pokus až po `_RETRY_AFTER` sekundách.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import GEMINI_PROMPT_CACHE, GEMINI_PROMPT_CACHE_TTL
+
+_DISPLAY_PREFIX = "dsv-extraction-"
+# Cache se prodlouží, když do vypršení zbývá méně než tolik sekund
+_REFRESH_MARGIN = 120.0
+# Po neúspěšném založení cache se další pokus odloží
+_RETRY_AFTER = 600.0
+# Minimum tokenů pro `CachedContent` podle prefixu názvu modelu (nejdelší shoda vyhrává)
+_MIN_CACHE_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+    "gemini-2.0-flash": 4096,
+    "gemini-1.5": 32768,
+}
+_DEFAULT_MIN_CACHE_TOKENS = 4096
+
+
+def min_cache_tokens(model_name: str) -> int:
+    """Nejmenší počet tokenů obsahu, který model přijme do cached content."""
+    prefixes = [prefix for prefix in _MIN_CACHE_TOKENS if model_name.startswith(prefix)]
+    return _MIN_CACHE_TOKENS[max(prefixes, key=len)] if prefixes else _DEFAULT_MIN_CACHE_TOKENS
+
+
+def prompt_hash(model_name: str, system_prompt: str) -> str:
+    """Krátký hash modelu a promptu (určuje, kdy je potřeba nová cache)."""
+    return hashlib.sha256(f"{model_name}\n{system_prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+def _expire_timestamp(cached: Any) -> float:
+    expire_time = getattr(cached, "expire_time", None)
+    if isinstance(expire_time, datetime.datetime):
+        if expire_time.tzinfo is None:
+            expire_time = expire_time.replace(tzinfo=datetime.timezone.utc)
+        return expire_time.timestamp()
+    return 0.0
+
+
+class PromptContextCache:
+    """Správa jedné Gemini cached content se systémovým promptem pro daný model."""
+
+    def __init__(self, model_name: str, ttl_seconds: float = GEMINI_PROMPT_CACHE_TTL):
+        """
+        Args:
+            model_name: Název modelu (např. "gemini-2.5-flash")
+            ttl_seconds: Životnost cache v Gemini
+        """
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hash: Optional[str] = None
+        self._cached: Any = None
+        self._model: Any = None
+        self._expires_at = 0.0
+        self._owned = False
+        self._failed: Dict[str, float] = {}
+
+    def skip_reason(self, system_prompt: str) -> Optional[str]:
+        """Důvod, proč se prompt do cache nezakládá (None = cache se použije)."""
+        # Odhad ~4 znaky na token (jako `rate_governor.estimate_request_tokens`)
+        estimated = len(system_prompt) // 4
+        minimum = min_cache_tokens(self.model_name)
+        if estimated < minimum:
+            return f"prompt_below_minimum ({estimated} < {minimum} tokenů)"
+        return None
+
+    def model_for(self, system_prompt: str) -> Optional[Any]:
+        """
+        Vrátí `GenerativeModel` nad cache s daným systémovým promptem.
+
+        Returns:
+            Model, nebo None (cache není k dispozici => použít prompt v obsahu požadavku)
+        """
+        if self.skip_reason(system_prompt) is not None:
+            return None
+
+        import google.generativeai as genai
+
+        key = prompt_hash(self.model_name, system_prompt)
+        with self._lock:
+            if self._failed.get(key, 0.0) > time.time():
+                return None
+            try:
+                if self._hash != key:
+                    self._replace(genai, key, system_prompt)
+                elif self._expires_at - time.time() < _REFRESH_MARGIN:
+                    self._extend(genai, key, system_prompt)
+            except Exception as e:
+                print(f"Varování: Kontextová cache promptu není dostupná, posílám prompt v požadavku: {e}")
+                self._failed[key] = time.time() + _RETRY_AFTER
+                self._hash = self._cached = self._model = None
+                return None
+            return self._model
+
+    def _replace(self, genai: Any, key: str, system_prompt: str) -> None:
+        """Nový prompt (nebo první volání): najde nebo založí cache a starou vlastní smaže."""
+        previous, previous_owned = self._cached, self._owned
+        cached, owned = self._find_existing(genai, key), False
+        if cached is None:
+            cached, owned = self._create(genai, key, system_prompt), True
+        self._use(genai, key, cached, owned)
+        if previous is not None and previous_owned:
+            try:
+                previous.delete()
+            except Exception:
+                pass
+
+    def _extend(self, genai: Any, key: str, system_prompt: str) -> None:
+        """Prodlouží TTL aktuální cache; když už neexistuje, založí novou."""
+        try:
+            self._cached.update(ttl=datetime.timedelta(seconds=self.ttl_seconds))
+            self._expires_at = _expire_timestamp(self._cached) or time.time() + self.ttl_seconds
+        except Exception:
+            self._use(genai, key, self._create(genai, key, system_prompt), True)
+
+    def _find_existing(self, genai: Any, key: str) -> Optional[Any]:
+        """Najde platnou cache se stejným promptem (např. založenou jiným workerem)."""
+        try:
+            for cached in genai.caching.CachedContent.list():
+                if (
+                    getattr(cached, "display_name", None) == _DISPLAY_PREFIX + key
+                    and _expire_timestamp(cached) - time.time() > _REFRESH_MARGIN
+                ):
+                    return cached
+        except Exception:
+            pass
+        return None
+
+    def _create(self, genai: Any, key: str, system_prompt: str) -> Any:
+        return genai.caching.CachedContent.create(
+            model=f"models/{self.model_name}",
+            display_name=_DISPLAY_PREFIX + key,
+            system_instruction=system_prompt,
+            ttl=datetime.timedelta(seconds=self.ttl_seconds),
+        )
+
+    def _use(self, genai: Any, key: str, cached: Any, owned: bool) -> None:
+        self._model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+        self._cached, self._owned, self._hash = cached, owned, key
+        self._expires_at = _expire_timestamp(cached) or time.time() + self.ttl_seconds
+
+
+def create_prompt_cache(model_name: str) -> Optional[PromptContextCache]:
+    """Vytvoří správu kontextové cache podle konfigurace (None = vypnuto)."""
+    if not GEMINI_PROMPT_CACHE:
+        return None
+    return PromptContextCache(model_name)
@@ -0,0 +1,314 @@
+"""Sdílený governor kvót Gemini (RPM/TPM) s adaptivním limitem souběhu.
+
+Každé generování prochází slotem governoru, který koordinuje souběžné
+extrakce (uvicorn workery, `--workers` v CLI):
+
+- token bucket požadavků (RPM) a odhadnutých tokenů (TPM) pro každý model;
+  po odpovědi se odhad srovná se skutečným počtem tokenů,
+- AIMD limit souběžných volání: po úspěchu roste o 1/limit, po 429 /
+  ResourceExhausted se sníží na polovinu (nejvýš jednou za `_DECREASE_COOLDOWN`),
+- stav je v SQLite (`GEMINI_QUOTA_DB`), takže ho sdílí všechny procesy na stroji;
+  zámky drží SQLite (`BEGIN IMMEDIATE`).
+
+Když SQLite selže, governor propouští volání bez omezení (extrakce nesmí
+skončit kvůli cache souboru).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from .config import (
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_QUOTA_DB,
+    GEMINI_QUOTA_ENABLED,
+    GEMINI_QUOTA_MAX_WAIT,
+    GEMINI_QUOTAS,
+    GEMINI_RPM,
+    GEMINI_TPM,
+)
+
+# Lease starší než tohle patří spadlému procesu a nepočítá se do souběhu (sekundy)
+_LEASE_TIMEOUT = 900.0
+# Po snížení limitu se další 429 ze stejné vlny už nepočítají (sekundy)
+_DECREASE_COOLDOWN = 5.0
+# Interval dotazování, když je plný limit souběhu (sekundy)
+_SLOT_POLL = 0.1
+
+# Odhad tokenů požadavku (Gemini počítá ~258 tokenů na stránku PDF)
+TOKENS_PER_PDF_PAGE = 258
+_BYTES_PER_PAGE_ESTIMATE = 50 * 1024
+_OUTPUT_TOKENS_ESTIMATE = 2000
+
+
+class QuotaWaitTimeout(TimeoutError):
+    """Na volný slot kvóty se nepodařilo dočkat do `GEMINI_QUOTA_MAX_WAIT`."""
+
+
+def estimate_request_tokens(prompt_chars: int, pdf_bytes: int = 0, text_chars: int = 0) -> int:
+    """
+    Odhadne tokeny jednoho volání (vstup + rezerva na výstup).
+
+    Počet stránek PDF se odhaduje z velikosti souboru; nepřesnost vyrovná
+    srovnání se skutečnými tokeny po odpovědi.
+    """
+    pdf_pages = math.ceil(pdf_bytes / _BYTES_PER_PAGE_ESTIMATE) if pdf_bytes else 0
+    return (prompt_chars + text_chars) // 4 + pdf_pages * TOKENS_PER_PDF_PAGE + _OUTPUT_TOKENS_ESTIMATE
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Rozpozná odmítnutí kvůli kvótě (HTTP 429 / gRPC RESOURCE_EXHAUSTED)."""
+    if type(error).__name__ in {"ResourceExhausted", "TooManyRequests"}:
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    # Text zprávy se nebere v úvahu ("429" nebo "quota" se objeví i v nesouvisejících chybách),
+    # jen gRPC stav RESOURCE_EXHAUSTED
+    status = getattr(error, "grpc_status_code", None)
+    return getattr(status, "name", status) == "RESOURCE_EXHAUSTED" or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class QuotaLease:
+    """Přidělený slot jednoho volání; po odpovědi se do něj zapíší skutečné tokeny."""
+
+    def __init__(self, model: str, lease_id: Optional[int], estimated_tokens: int):
+        self.model = model
+        self.lease_id = lease_id
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def record_response(self, response: Any) -> None:
+        """Převezme skutečný počet tokenů z `usage_metadata` odpovědi Gemini."""
+        metadata = getattr(response, "usage_metadata", None)
+        total = getattr(metadata, "total_token_count", None) if metadata else None
+        if total:
+            self.actual_tokens = int(total)
+
+
+class QuotaGovernor:
+    """Token buckety RPM/TPM a AIMD limit souběhu pro modely Gemini, sdílené přes SQLite."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        rpm: int = GEMINI_RPM,
+        tpm: int = GEMINI_TPM,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        model_limits: Optional[Dict[str, Dict[str, int]]] = None,
+        max_wait: float = GEMINI_QUOTA_MAX_WAIT,
+    ):
+        """
+        Args:
+            db_path: SQLite soubor se sdíleným stavem
+            rpm: Výchozí limit požadavků za minutu
+            tpm: Výchozí limit tokenů za minutu
+            max_concurrency: Strop AIMD limitu souběžných volání
+            model_limits: Limity pro jednotlivé modely {"model": {"rpm": .., "tpm": ..}}
+            max_wait: Nejdelší čekání na slot (sekundy)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.model_limits = model_limits or {}
+        self.max_wait = max_wait
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "model TEXT, kind TEXT, level REAL, updated REAL, PRIMARY KEY (model, kind))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS concurrency ("
+                "model TEXT PRIMARY KEY, max_in_flight REAL, last_decrease REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT, pid INTEGER, started REAL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Nové spojení pro každou operaci: sqlite3 spojení nelze sdílet mezi vlákny
+        return sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Zapisovací transakce (`BEGIN IMMEDIATE` zamkne stav pro ostatní procesy)."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _limits(self, model: str) -> Tuple[int, int]:
+        limits = self.model_limits.get(model) or {}
+        return int(limits.get("rpm", self.rpm)), int(limits.get("tpm", self.tpm))
+
+    def _refill(self, conn: sqlite3.Connection, model: str, kind: str, capacity: float, now: float) -> float:
+        row = conn.execute("SELECT level, updated FROM buckets WHERE model = ? AND kind = ?", (model, kind)).fetchone()
+        if row is None:
+            return capacity
+        level, updated = row
+        return min(capacity, level + max(0.0, now - updated) * capacity / 60.0)
+
+    def _store_level(self, conn: sqlite3.Connection, model: str, kind: str, level: float, now: float) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (model, kind, level, updated) VALUES (?, ?, ?, ?)",
+            (model, kind, level, now),
+        )
+
+    def _concurrency_limit(self, conn: sqlite3.Connection, model: str) -> Tuple[float, float]:
+        row = conn.execute("SELECT max_in_flight, last_decrease FROM concurrency WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            # Start v polovině stropu; AIMD limit dál najde sám
+            return max(1.0, self.max_concurrency / 2), 0.0
+        return row
+
+    def try_acquire(self, model: str, estimated_tokens: int) -> Tuple[Optional[QuotaLease], float]:
+        """
+        Jeden pokus o získání slotu (neblokuje).
+
+        Returns:
+            (lease, 0) při úspěchu, jinak (None, doporučená prodleva před dalším pokusem)
+        """
+        rpm, tpm = self._limits(model)
+        needed_tokens = min(float(estimated_tokens), float(tpm))
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM leases WHERE started < ?", (now - _LEASE_TIMEOUT,))
+                limit, _ = self._concurrency_limit(conn, model)
+                in_flight = conn.execute("SELECT COUNT(*) FROM leases WHERE model = ?", (model,)).fetchone()[0]
+                if in_flight >= math.floor(limit):
+                    return None, _SLOT_POLL
+
+                requests = self._refill(conn, model, "rpm", rpm, now)
+                tokens = self._refill(conn, model, "tpm", tpm, now)
+                if requests < 1.0 or tokens < needed_tokens:
+                    return None, max((1.0 - requests) * 60.0 / rpm, (needed_tokens - tokens) * 60.0 / tpm, _SLOT_POLL)
+
+                self._store_level(conn, model, "rpm", requests - 1.0, now)
+                self._store_level(conn, model, "tpm", tokens - needed_tokens, now)
+                cursor = conn.execute(
+                    "INSERT INTO leases (model, pid, started) VALUES (?, ?, ?)", (model, os.getpid(), now)
+                )
+                return QuotaLease(model, cursor.lastrowid, int(needed_tokens)), 0.0
+        except sqlite3.Error as e:
+            print(f"Varování: Governor kvót Gemini nedostupný, volám bez omezení: {e}")
+            return QuotaLease(model, None, estimated_tokens), 0.0
+
+    def release(self, lease: QuotaLease, throttled: bool) -> None:
+        """Uvolní slot, srovná TPM bucket se skutečnými tokeny a upraví AIMD limit."""
+        if lease.lease_id is None:
+            return
+        _, tpm = self._limits(lease.model)
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM leases WHERE id = ?", (lease.lease_id,))
+                if lease.actual_tokens is not None:
+                    # Rozdíl proti odhadu: podhodnocení se strhne (bucket může jít do mínusu), přebytek vrátí
+                    tokens = self._refill(conn, lease.model, "tpm", tpm, now)
+                    tokens -= lease.actual_tokens - lease.estimated_tokens
+                    self._store_level(conn, lease.model, "tpm", max(-float(tpm), min(float(tpm), tokens)), now)
+
+                limit, last_decrease = self._concurrency_limit(conn, lease.model)
+                if throttled:
+                    if now - last_decrease >= _DECREASE_COOLDOWN:
+                        limit, last_decrease = max(1.0, limit / 2), now
+                        print(f"  → Kvóta Gemini vyčerpána, limit souběhu {lease.model} snížen na {math.floor(limit)}")
+                    # Prázdný RPM bucket: ostatní procesy počkají na doplnění místo dalších 429
+                    self._store_level(conn, lease.model, "rpm", 0.0, now)
+                else:
+                    limit = min(float(self.max_concurrency), limit + 1.0 / limit)
+                conn.execute(
+                    "INSERT OR REPLACE INTO concurrency (model, max_in_flight, last_decrease) VALUES (?, ?, ?)",
+                    (lease.model, limit, last_decrease),
+                )
+        except sqlite3.Error as e:
+            print(f"Varování: Governor kvót Gemini nemohl uvolnit slot: {e}")
+
+    @contextmanager
+    def slot(self, model: str, estimated_tokens: int, diagnostics: Optional[Dict[str, Any]] = None) -> Iterator[QuotaLease]:
+        """Počká na slot (blokuje vlákno), po dokončení ho uvolní; 429 sníží limit souběhu."""
+        start = time.perf_counter()
+        while True:
+            lease, wait = self.try_acquire(model, estimated_tokens)
+            if lease is not None:
+                break
+            if time.perf_counter() - start + wait > self.max_wait:
+                raise QuotaWaitTimeout(f"Slot kvóty Gemini pro {model} nebyl volný do {self.max_wait:.0f} s")
+            time.sleep(wait)
+        self._record_wait(diagnostics, start)
+        try:
+            yield lease
+        except BaseException as e:
+            self.release(lease, throttled=is_rate_limit_error(e))
+            raise
+        self.release(lease, throttled=False)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, estimated_tokens: int, diagnostics: Optional[Dict[str, Any]] = None) -> AsyncIterator[QuotaLease]:
+        """Asynchronní varianta `slot` (čekání neblokuje event loop)."""
+        start = time.perf_counter()
+        while True:
+            lease, wait = await asyncio.to_thread(self.try_acquire, model, estimated_tokens)
+            if lease is not None:
+                break
+            if time.perf_counter() - start + wait > self.max_wait:
+                raise QuotaWaitTimeout(f"Slot kvóty Gemini pro {model} nebyl volný do {self.max_wait:.0f} s")
+            await asyncio.sleep(wait)
+        self._record_wait(diagnostics, start)
+        try:
+            yield lease
+        except BaseException as e:
+            await asyncio.to_thread(self.release, lease, is_rate_limit_error(e))
+            raise
+        await asyncio.to_thread(self.release, lease, False)
+
+    @staticmethod
+    def _record_wait(diagnostics: Optional[Dict[str, Any]], start: float) -> None:
+        if diagnostics is not None:
+            diagnostics["quota_wait_seconds"] = round(
+                diagnostics.get("quota_wait_seconds", 0.0) + time.perf_counter() - start, 3
+            )
+
+
+def _parse_model_limits(raw: str) -> Dict[str, Dict[str, int]]:
+    if not raw.strip():
+        return {}
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else {}
+    except json.JSONDecodeError as e:
+        print(f"Varování: GEMINI_QUOTAS není validní JSON, použijí se výchozí limity: {e}")
+        return {}
+
+
+def create_quota_governor() -> Optional[QuotaGovernor]:
+    """Vytvoří governor kvót podle konfigurace (None = vypnuto nebo nelze založit)."""
+    if not GEMINI_QUOTA_ENABLED:
+        return None
+    try:
+        return QuotaGovernor(GEMINI_QUOTA_DB, model_limits=_parse_model_limits(GEMINI_QUOTAS))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Varování: Governor kvót Gemini není dostupný: {e}")
+        return None
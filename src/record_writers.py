@@ -0,0 +1,381 @@
+"""Zápis extrahovaných záznamů (Consignment Note) do výstupních formátů.
+
+Sloupce jsou dané deklarovaným schématem `CN_RECORD_SCHEMA`, takže výstup má
+stejný tvar bez ohledu na to, co model vrátil (chybějící pole jsou prázdná,
+neznámá pole se nezapisují). Díky pevnému schématu se řádky zapisují průběžně
+bez dalšího průchodu všemi záznamy a velké dávky se nemusí držet v paměti.
+
+Formáty: CSV, JSONL, Parquet a Arrow IPC (volitelně `pyarrow`), XLSX
+(volitelně `XlsxWriter` v režimu constant_memory).
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+# Pořadí sloupců odpovídá dřívějšímu CSV (abecedně seřazené klíče záznamů)
+CN_RECORD_SCHEMA: List[Tuple[str, str]] = [
+    ("consignment_note", "str"),
+    ("gross_weight_kg", "float"),
+    ("hs_codes", "str_list"),
+    ("mrn_pages", "int_list"),
+    ("packages", "int"),
+    ("volume_m3", "float"),
+]
+
+FIELD_NAMES = [name for name, _ in CN_RECORD_SCHEMA]
+
+
+def _to_float(value: Any) -> Optional[float]:
+    text = str(value).strip().replace(" ", "").replace(",", ".") if value is not None else ""
+    try:
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    number = _to_float(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def _to_list(value: Any) -> List[Any]:
+    if value in (None, ""):
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _to_int_list(value: Any) -> List[int]:
+    return [n for n in (_to_int(v) for v in _to_list(value)) if n is not None]
+
+
+def _to_str_list(value: Any) -> List[str]:
+    return [str(v) for v in _to_list(value)]
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return None if value in (None, "") else str(value)
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "str": _to_str,
+    "float": _to_float,
+    "int": _to_int,
+    "int_list": _to_int_list,
+    "str_list": _to_str_list,
+}
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Převede záznam na typované hodnoty podle schématu (nepřevoditelné hodnoty => None)."""
+    return {name: _CONVERTERS[kind](record.get(name)) for name, kind in CN_RECORD_SCHEMA}
+
+
+def _csv_cell(value: Any) -> str:
+    # Stejná textová podoba jako dřívější `convert_to_csv`
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value)
+    if value is None:
+        return ""
+    return str(value)
+
+
+class RecordWriter:
+    """Základ pro průběžný zápis záznamů; použití jako context manager."""
+
+    extension = ""
+
+    def __init__(self, output_path: Path):
+        self.output_path = Path(output_path)
+        self.rows_written = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Zapíše jeden záznam."""
+        self._write_row(record)
+        self.rows_written += 1
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.write(record)
+
+    def _write_row(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class CsvRecordWriter(RecordWriter):
+    """CSV s hlavičkou podle schématu; hodnoty v původní textové podobě, seznamy oddělené "; "."""
+
+    extension = ".csv"
+
+    def __init__(self, output_path: Path):
+        super().__init__(output_path)
+        self._file = open(self.output_path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._header_written = False
+
+    def _write_row(self, record: Dict[str, Any]) -> None:
+        if not self._header_written:
+            self._writer.writerow(FIELD_NAMES)
+            self._header_written = True
+        self._writer.writerow([_csv_cell(record.get(name, "")) for name in FIELD_NAMES])
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if not self._header_written:
+            # Prázdný výstup označíme stejně jako dřív
+            self._writer.writerow(["No data extracted"])
+        self._file.close()
+
+
+class JsonlRecordWriter(RecordWriter):
+    """JSON Lines s typovanými hodnotami (čísla jako čísla, seznamy jako pole)."""
+
+    extension = ".jsonl"
+
+    def __init__(self, output_path: Path):
+        super().__init__(output_path)
+        self._file = open(self.output_path, "w", encoding="utf-8")
+
+    def _write_row(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(normalize_record(record), ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ArrowRecordWriterBase(RecordWriter):
+    """Společný základ Parquet/Arrow: záznamy se zapisují po dávkách (konstantní paměť)."""
+
+    batch_size = 1000
+
+    def __init__(self, output_path: Path):
+        super().__init__(output_path)
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("Výstup Parquet/Arrow vyžaduje balíček pyarrow (pip install pyarrow)") from e
+        self._pa = pa
+        types = {
+            "str": pa.string(),
+            "float": pa.float64(),
+            "int": pa.int64(),
+            "int_list": pa.list_(pa.int64()),
+            "str_list": pa.list_(pa.string()),
+        }
+        self.schema = pa.schema([(name, types[kind]) for name, kind in CN_RECORD_SCHEMA])
+        self._batch: List[Dict[str, Any]] = []
+        self._writer = self._open_writer()
+
+    def _open_writer(self):
+        raise NotImplementedError
+
+    def _write_row(self, record: Dict[str, Any]) -> None:
+        self._batch.append(normalize_record(record))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._writer.write_table(self._pa.Table.from_pylist(self._batch, schema=self.schema))
+            self._batch = []
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+
+class ParquetRecordWriter(_ArrowRecordWriterBase):
+    extension = ".parquet"
+
+    def _open_writer(self):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(str(self.output_path), self.schema)
+
+
+class ArrowRecordWriter(_ArrowRecordWriterBase):
+    """Arrow IPC soubor (Feather v2)."""
+
+    extension = ".arrow"
+
+    def _open_writer(self):
+        import pyarrow as pa
+
+        return pa.ipc.new_file(str(self.output_path), self.schema)
+
+
+class XlsxRecordWriter(RecordWriter):
+    """XLSX přes XlsxWriter v režimu constant_memory (řádky se hned zapisují na disk)."""
+
+    extension = ".xlsx"
+
+    def __init__(self, output_path: Path):
+        super().__init__(output_path)
+        try:
+            import xlsxwriter
+        except ImportError as e:
+            raise ImportError("Výstup XLSX vyžaduje balíček XlsxWriter (pip install XlsxWriter)") from e
+        self._workbook = xlsxwriter.Workbook(str(self.output_path), {"constant_memory": True})
+        self._sheet = self._workbook.add_worksheet("records")
+        for col, name in enumerate(FIELD_NAMES):
+            self._sheet.write_string(0, col, name)
+
+    def _write_row(self, record: Dict[str, Any]) -> None:
+        row = self.rows_written + 1
+        for col, value in enumerate(normalize_record(record).values()):
+            if isinstance(value, list):
+                self._sheet.write_string(row, col, "; ".join(str(v) for v in value))
+            elif value is not None:
+                self._sheet.write(row, col, value)
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+
+RECORD_WRITERS: Dict[str, Type[RecordWriter]] = {
+    "csv": CsvRecordWriter,
+    "jsonl": JsonlRecordWriter,
+    "parquet": ParquetRecordWriter,
+    "arrow": ArrowRecordWriter,
+    "xlsx": XlsxRecordWriter,
+}
+
+
+def open_record_writer(fmt: str, output_path: Path) -> RecordWriter:
+    """
+    Vytvoří writer pro daný formát.
+
+    Args:
+        fmt: Název formátu (csv, jsonl, parquet, arrow, xlsx)
+        output_path: Cesta k výstupnímu souboru
+
+    Raises:
+        ValueError: Neznámý formát
+        ImportError: Chybí volitelná závislost formátu
+    """
+    writer_cls = RECORD_WRITERS.get(fmt.lower())
+    if writer_cls is None:
+        raise ValueError(f"Neznámý výstupní formát: {fmt} (podporováno: {', '.join(RECORD_WRITERS)})")
+    return writer_cls(output_path)
+
+
+def write_records(records: Iterable[Dict[str, Any]], output_path: Path, fmt: str = "csv") -> int:
+    """Zapíše záznamy do souboru v daném formátu; vrací počet zapsaných řádků."""
+    with open_record_writer(fmt, output_path) as writer:
+        writer.write_many(records)
+    return writer.rows_written
+
+
+def _row_digest(record: Dict[str, Any]) -> int:
+    """Otisk hodnot záznamu, ze kterých writery skládají řádek."""
+    return hash(repr([record.get(name) for name in FIELD_NAMES]))
+
+
+class RecordOutputs:
+    """
+    Výstupní soubory jednoho dokumentu otevřené už před extrakcí.
+
+    Záznamy se zapisují, jakmile jsou známé (`write_many`), do souborů `*.part`.
+    `finish` dostane definitivní záznamy: jsou-li zapsané řádky jejich začátkem,
+    dopíše jen zbytek, jinak (dodatečně doplněné `mrn_pages`, eskalace modelu)
+    výstupy přepíše. Teprve pak se soubory přejmenují na finální názvy, takže
+    nedokončená extrakce nezanechá neúplný výstup.
+    """
+
+    def __init__(self, output_folder: Path, stem: str):
+        self.output_folder = Path(output_folder)
+        self.stem = stem
+        self.paths: Dict[str, Path] = {}
+        self._writers: Dict[str, RecordWriter] = {}
+        self._digests: List[int] = []
+        self._finished = False
+        self._created_folder = not self.output_folder.exists()
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+
+    def add(self, fmt: str) -> Path:
+        """
+        Otevře výstup daného formátu; vrací finální cestu souboru.
+
+        Raises:
+            ValueError: Neznámý formát
+            ImportError: Chybí volitelná závislost formátu
+        """
+        writer_cls = RECORD_WRITERS.get(fmt.lower())
+        if writer_cls is None:
+            raise ValueError(f"Neznámý výstupní formát: {fmt} (podporováno: {', '.join(RECORD_WRITERS)})")
+        path = self.output_folder / f"{self.stem}{writer_cls.extension}"
+        self._writers[fmt] = writer_cls(self._part_path(path))
+        self.paths[fmt] = path
+        return path
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Zapíše další záznamy (v pořadí dokumentu) do všech otevřených výstupů."""
+        for record in records:
+            for writer in self._writers.values():
+                writer.write(record)
+            self._digests.append(_row_digest(record))
+
+    def finish(self, records: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Dorovná výstupy na definitivní záznamy, uzavře je a vrátí {formát: cesta}."""
+        written = len(self._digests)
+        if written > len(records) or any(_row_digest(r) != d for r, d in zip(records, self._digests)):
+            self._reopen()
+            written = 0
+        self.write_many(records[written:])
+        for fmt, writer in self._writers.items():
+            writer.close()
+            os.replace(writer.output_path, self.paths[fmt])
+        self._finished = True
+        return {fmt: str(path) for fmt, path in self.paths.items()}
+
+    def discard(self) -> None:
+        """Uzavře a smaže nedokončené výstupy (extrakce selhala)."""
+        if self._finished:
+            return
+        self._finished = True
+        for writer in self._writers.values():
+            try:
+                writer.close()
+            finally:
+                writer.output_path.unlink(missing_ok=True)
+        if self._created_folder:
+            try:
+                self.output_folder.rmdir()
+            except OSError:
+                pass
+
+    def _reopen(self) -> None:
+        # Writery otevřené na stejné cestě soubor zkrátí
+        for fmt, writer in self._writers.items():
+            writer.close()
+            self._writers[fmt] = type(writer)(writer.output_path)
+        self._digests = []
+
+    @staticmethod
+    def _part_path(path: Path) -> Path:
+        return path.with_name(path.name + ".part")
+
+    def __enter__(self) -> "RecordOutputs":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.discard()
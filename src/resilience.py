@@ -0,0 +1,238 @@
+"""Odolnost volání Gemini: klasifikace chyb, retry s jitterem a circuit breaker.
+
+- chyby se klasifikují (`classify_error`): přechodné (výpadek, timeout, 429)
+  se opakují s exponenciálním backoffem a plným jitterem, trvalé ne,
+- každý model má circuit breaker; po `GEMINI_BREAKER_FAILURES` přechodných
+  chybách v řadě se otevře a volání na `GEMINI_BREAKER_RESET` sekund rovnou
+  selžou (`CircuitOpenError`), pak projde jeden zkušební požadavek,
+- při otevřeném breakeru nebo vyčerpaných pokusech se textový fallback
+  nevolá; procesor použije deterministickou extrakci a výsledek označí
+  jako degradovaný.
+
+Stav breakeru je lokální pro proces.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from .config import (
+    GEMINI_BREAKER_FAILURES,
+    GEMINI_BREAKER_RESET,
+    GEMINI_RETRY_ATTEMPTS,
+    GEMINI_RETRY_BASE_DELAY,
+    GEMINI_RETRY_MAX_DELAY,
+)
+from .rate_governor import is_rate_limit_error
+
+T = TypeVar("T")
+
+ERROR_RATE_LIMIT = "rate_limit"
+ERROR_TRANSIENT = "transient"
+ERROR_TIMEOUT = "timeout"
+ERROR_FILE = "file"
+ERROR_CIRCUIT_OPEN = "circuit_open"
+ERROR_PERMANENT = "permanent"
+
+# Chyby, které vypovídají o stavu backendu: opakují se a počítají do breakeru
+RETRYABLE_ERRORS = {ERROR_RATE_LIMIT, ERROR_TRANSIENT, ERROR_TIMEOUT}
+
+_TRANSIENT_NAMES = {
+    "ServiceUnavailable",
+    "InternalServerError",
+    "BadGateway",
+    "GatewayTimeout",
+    "Aborted",
+    "Unknown",
+    "ConnectionError",
+    "ConnectionResetError",
+    "RemoteDisconnected",
+    "RetryError",
+}
+_TIMEOUT_NAMES = {"DeadlineExceeded", "ReadTimeout", "ConnectTimeout", "TimeoutError"}
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuit breaker modelu je otevřený; volání se neprovádí."""
+
+
+def classify_error(error: BaseException) -> str:
+    """Zařadí výjimku z volání Gemini do jedné z tříd `ERROR_*`."""
+    if isinstance(error, CircuitOpenError):
+        return ERROR_CIRCUIT_OPEN
+    name = type(error).__name__
+    # Soubor se na straně File API nezpracoval; textový fallback má smysl
+    if name == "FileNotReadyError":
+        return ERROR_FILE
+    if name == "QuotaWaitTimeout" or is_rate_limit_error(error):
+        return ERROR_RATE_LIMIT
+    if name in _TIMEOUT_NAMES or isinstance(error, TimeoutError):
+        return ERROR_TIMEOUT
+    if name in _TRANSIENT_NAMES or isinstance(error, ConnectionError):
+        return ERROR_TRANSIENT
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code >= 500:
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+
+class CircuitBreaker:
+    """Breaker jednoho modelu: closed → open (po sérii chyb) → half-open (jeden zkušební požadavek)."""
+
+    def __init__(self, name: str, failure_threshold: int = GEMINI_BREAKER_FAILURES, reset_timeout: float = GEMINI_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self) -> None:
+        """Vyhodí `CircuitOpenError`, je-li breaker otevřený (nespotřebuje zkušební požadavek)."""
+        if self.state == "open":
+            raise CircuitOpenError(f"Circuit breaker pro {self.name} je otevřený, Gemini se nevolá")
+
+    def before_call(self) -> None:
+        """Propustí volání, nebo vyhodí `CircuitOpenError` (v half-open jen jeden zkušební požadavek)."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+        raise CircuitOpenError(f"Circuit breaker pro {self.name} je otevřený, Gemini se nevolá")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                print(f"  → Circuit breaker {self.name}: Gemini opět odpovídá, zavírám")
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                print(f"  → Circuit breaker {self.name}: otevírám na {self.reset_timeout:.0f} s po {self._failures} chybách")
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Zkušební požadavek skončil chybou, která o backendu nic neříká."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def circuit_breaker_for(model: str) -> CircuitBreaker:
+    """Vrátí sdílený (v rámci procesu) breaker modelu."""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(model)
+        if breaker is None:
+            breaker = _BREAKERS[model] = CircuitBreaker(model)
+        return breaker
+
+
+class RetryPolicy:
+    """Opakování přechodných chyb s exponenciálním backoffem a plným jitterem."""
+
+    def __init__(
+        self,
+        max_attempts: int = GEMINI_RETRY_ATTEMPTS,
+        base_delay: float = GEMINI_RETRY_BASE_DELAY,
+        max_delay: float = GEMINI_RETRY_MAX_DELAY,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Prodleva před dalším pokusem (`attempt` od 1): náhodně z <0, min(max, base * 2^(attempt-1))>."""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _after_failure(
+        self,
+        error: BaseException,
+        attempt: int,
+        breaker: CircuitBreaker,
+        diagnostics: Optional[Dict[str, Any]],
+    ) -> Optional[float]:
+        """Zapíše chybu do breakeru a diagnostiky; vrátí prodlevu před dalším pokusem, nebo None (nepokračovat)."""
+        kind = classify_error(error)
+        if diagnostics is not None:
+            diagnostics["attempts"] = attempt
+            diagnostics["last_error_class"] = kind
+        if kind not in RETRYABLE_ERRORS:
+            breaker.release_probe()
+            return None
+        breaker.record_failure()
+        if attempt >= self.max_attempts or breaker.state != "closed":
+            return None
+        wait = self.delay(attempt)
+        print(f"  → Gemini: přechodná chyba ({kind}: {error}), pokus {attempt + 1}/{self.max_attempts} za {wait:.1f} s")
+        return wait
+
+    def call(self, func: Callable[[], T], breaker: CircuitBreaker, diagnostics: Optional[Dict[str, Any]] = None) -> T:
+        """Zavolá `func` přes breaker; přechodné chyby opakuje, poslední chybu vyhodí."""
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call()
+            try:
+                result = func()
+            except Exception as e:
+                wait = self._after_failure(e, attempt, breaker, diagnostics)
+                if wait is None:
+                    raise
+                time.sleep(wait)
+                continue
+            breaker.record_success()
+            if diagnostics is not None:
+                diagnostics["attempts"] = attempt
+            return result
+
+    async def acall(
+        self,
+        func: Callable[[], Awaitable[T]],
+        breaker: CircuitBreaker,
+        diagnostics: Optional[Dict[str, Any]] = None,
+    ) -> T:
+        """Asynchronní varianta `call` (`func` vrací nový awaitable pro každý pokus)."""
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call()
+            try:
+                result = await func()
+            except Exception as e:
+                wait = self._after_failure(e, attempt, breaker, diagnostics)
+                if wait is None:
+                    raise
+                await asyncio.sleep(wait)
+                continue
+            breaker.record_success()
+            if diagnostics is not None:
+                diagnostics["attempts"] = attempt
+            return result
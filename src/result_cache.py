@@ -0,0 +1,183 @@
+"""Perzistentní cache výsledků extrakce.
+
+Klíč je obsahový: SHA-256 bajtů PDF + hash extrakčního promptu a názvu modelu.
+Změna promptu nebo modelu tak automaticky znamená nový klíč (staré záznamy
+postupně vypadnou přes TTL / LRU). Záznam nese i model, který výsledek
+skutečně vytvořil; `get(key, model=...)` jiný model bere jako miss.
+
+Každý záznam je samostatný JSON soubor `{key}.json`; čas posledního přístupu
+(LRU) se drží v mtime souboru, takže cache mohou sdílet i různé procesy
+(uvicorn workery, CLI) bez další koordinace.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_MB,
+    RESULT_CACHE_TTL_HOURS,
+)
+
+
+class ExtractionResultCache:
+    """Obsahově adresovaná cache (records, page_types, usage_info) s LRU a TTL."""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_entries: int = 500,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl_seconds: float = 30 * 24 * 3600,
+    ):
+        """
+        Args:
+            cache_dir: Složka pro JSON záznamy
+            max_entries: Maximální počet záznamů (LRU eviction)
+            max_bytes: Maximální celková velikost záznamů v bajtech (LRU eviction)
+            ttl_seconds: Doba platnosti záznamu od uložení
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(pdf_sha256: str, prompt: str, model: str) -> str:
+        """
+        Sestaví klíč cache.
+
+        Args:
+            pdf_sha256: SHA-256 (hex) bajtů PDF
+            prompt: Extrakční prompt
+            model: Název AI modelu
+
+        Returns:
+            Hex klíč `{pdf_sha256}-{hash(prompt, model)[:16]}`
+        """
+        config_hash = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+        return f"{pdf_sha256}-{config_hash[:16]}"
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Vrátí záznam z cache nebo None (chybí / expiroval / je poškozený).
+
+        Při zásahu se aktualizuje mtime souboru (LRU).
+
+        Args:
+            key: Klíč z `make_key`
+            model: Očekávaný model, který výsledek vytvořil (jiný nebo neuvedený = miss)
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError):
+            self._remove(path)
+            return None
+
+        created_at = entry.get("created_at") or 0
+        if self.ttl_seconds and time.time() - created_at > self.ttl_seconds:
+            self._remove(path)
+            return None
+        if model is not None and entry.get("model") != model:
+            return None
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(
+        self,
+        key: str,
+        extracted_data: List[Dict[str, Any]],
+        page_types: Dict[str, List[int]],
+        usage_info: Optional[Dict[str, Any]],
+        model: Optional[str] = None,
+    ) -> None:
+        """Uloží výsledek extrakce (atomicky přes dočasný soubor) a provede eviction."""
+        entry = {
+            "key": key,
+            "created_at": time.time(),
+            "model": model,
+            "extracted_data": extracted_data,
+            "page_types": page_types,
+            "usage_info": usage_info,
+        }
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Varování: Nepodařilo se uložit výsledek do cache: {e}")
+            self._remove(tmp_path)
+            return
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Smaže expirované záznamy a pak nejdéle nepoužité nad limit počtu/velikosti."""
+        now = time.time()
+        entries: List[Tuple[float, int, Path]] = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        # Nejnovější přístup první
+        entries.sort(key=lambda e: e[0], reverse=True)
+
+        total_bytes = 0
+        kept = 0
+        for mtime, size, path in entries:
+            # mtime >= created_at, takže TTL podle mtime maže jen jistě expirované záznamy
+            expired = bool(self.ttl_seconds) and now - mtime > self.ttl_seconds
+            over_limit = kept >= self.max_entries or total_bytes + size > self.max_bytes
+            if expired or over_limit:
+                self._remove(path)
+                continue
+            kept += 1
+            total_bytes += size
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def create_result_cache() -> Optional[ExtractionResultCache]:
+    """Vytvoří cache podle konfigurace (None, pokud je vypnutá nebo nejde založit)."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    try:
+        return ExtractionResultCache(
+            cache_dir=RESULT_CACHE_DIR,
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=RESULT_CACHE_TTL_HOURS * 3600,
+        )
+    except OSError as e:
+        print(f"Varování: Cache výsledků není dostupná: {e}")
+        return None
@@ -0,0 +1,131 @@
+"""Dělení PDF na segmenty pro paralelní AI extrakci.
+
+Velký balík se rozdělí na hranicích Consignment Note stránek (CN + následující
+MRN/ostatní stránky tvoří nedělitelný blok), bloky se seskupí do segmentů
+o konfigurovatelné velikosti a každý segment se pošle do Gemini jako samostatné
+sub-PDF. Čísla stránek, která model vrátí (`mrn_pages`), jsou relativní
+k sub-PDF, proto se přes `page_map` přemapují zpět na stránky originálu.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def plan_segments(pages: List[int], cn_pages: Iterable[int], max_pages: int) -> List[List[int]]:
+    """
+    Rozdělí seznam stránek na segmenty začínající na CN stránkách.
+
+    Stránky před první CN stránkou se připojí k prvnímu bloku. Blok delší než
+    `max_pages` se nedělí (CN by se oddělila od svých MRN stránek).
+
+    Args:
+        pages: Seřazená čísla stránek (1-based), která se mají zpracovat
+        cn_pages: Čísla Consignment Note stránek
+        max_pages: Maximální počet stránek v segmentu
+
+    Returns:
+        Seznam segmentů (každý = seřazený seznam čísel stránek originálu)
+    """
+    cn_set = set(cn_pages)
+    blocks: List[List[int]] = []
+    block_has_cn = False
+    for page_num in pages:
+        is_cn = page_num in cn_set
+        if not blocks or (is_cn and block_has_cn):
+            blocks.append([page_num])
+            block_has_cn = is_cn
+        else:
+            blocks[-1].append(page_num)
+            block_has_cn = block_has_cn or is_cn
+
+    segments: List[List[int]] = []
+    for block in blocks:
+        if segments and len(segments[-1]) + len(block) <= max(1, max_pages):
+            segments[-1].extend(block)
+        else:
+            segments.append(list(block))
+    return segments
+
+
+def write_subset_pdf(reader: Any, pages: List[int], output_path: Path) -> None:
+    """
+    Zapíše vybrané stránky (1-based, v daném pořadí) do nového PDF.
+
+    Args:
+        reader: PyPDF2 `PdfReader` originálu
+        pages: Čísla stránek originálu
+        output_path: Cesta k výstupnímu PDF
+    """
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for page_num in pages:
+        if 1 <= page_num <= len(reader.pages):
+            writer.add_page(reader.pages[page_num - 1])
+    with open(output_path, "wb") as f:
+        writer.write(f)
+
+
+def _remap_page(value: Any, page_map: List[int]) -> Optional[int]:
+    try:
+        local = int(value)
+    except (ValueError, TypeError):
+        return None
+    if 1 <= local <= len(page_map):
+        return page_map[local - 1]
+    return None
+
+
+def remap_mrn_pages(records: List[Dict[str, Any]], page_map: List[int]) -> List[Dict[str, Any]]:
+    """
+    Přemapuje `mrn_pages` ze stránek sub-PDF na stránky originálu (in-place).
+
+    Zachovává tvar hodnoty (číslo / seznam); čísla mimo rozsah sub-PDF zahodí.
+
+    Args:
+        records: Záznamy vrácené modelem pro sub-PDF
+        page_map: page_map[i] = číslo stránky originálu pro stránku i+1 sub-PDF
+
+    Returns:
+        Stejný seznam záznamů
+    """
+    for record in records:
+        value = record.get("mrn_pages")
+        if value in (None, "", []):
+            continue
+        if isinstance(value, list):
+            remapped = [p for p in (_remap_page(v, page_map) for v in value) if p is not None]
+            record["mrn_pages"] = remapped
+        else:
+            page = _remap_page(value, page_map)
+            record["mrn_pages"] = page if page is not None else []
+    return records
+
+
+def merge_usage_infos(usage_infos: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    Sečte tokeny a náklady z více AI volání do jednoho usage_info.
+
+    Args:
+        usage_infos: usage_info jednotlivých volání (None se přeskakuje)
+
+    Returns:
+        Souhrnné usage_info nebo None, pokud žádné volání usage nevrátilo
+    """
+    present = [u for u in usage_infos if u]
+    if not present:
+        return None
+
+    merged: Dict[str, Any] = {}
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"):
+        merged[key] = sum(int(u.get(key) or 0) for u in present)
+    for key in ("input_cost_usd", "output_cost_usd", "total_cost_usd", "cached_input_cost_usd"):
+        merged[key] = sum(float(u.get(key) or 0.0) for u in present)
+    for key in ("input_price_per_million", "output_price_per_million", "cached_input_price_per_million", "model"):
+        for u in present:
+            if u.get(key) is not None:
+                merged[key] = u[key]
+                break
+    return merged
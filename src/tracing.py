@@ -0,0 +1,160 @@
+"""Lehké trasování kroků extrakce (spany se začátkem, dobou a atributy).
+
+- `trace(...)` založí kořenový span extrakce (s `extraction_id` a `request_id`
+  z `logging_setup`), `span(name)` v něm vnořený krok. Aktuální span se drží
+  v contextvars, takže se propaguje do asyncio tasků a `asyncio.to_thread`;
+  do `run_in_executor` a vláken poolu jen přes `contextvars.copy_context()`.
+- Mimo trasovanou extrakci je `span` no-op (bez alokace).
+- `current_timings()` vrací strom spanů a souhrn dob podle názvu kroku
+  (jde do výsledku, extraction logu a hlavičky `Server-Timing`).
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .config import TRACING_ENABLED
+from .logging_setup import get_request_id
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    """Jeden krok: název, začátek, doba, atributy a vnořené kroky."""
+
+    __slots__ = ("name", "attributes", "children", "root", "start", "duration", "_started")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], root: Optional["Span"] = None):
+        self.name = name
+        self.attributes = attributes
+        self.children: List[Span] = []
+        self.root = root or self
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        """Doplní atributy spanu."""
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        """Doba v sekundách (u neukončeného spanu dosavadní)."""
+        return self.duration if self.duration is not None else time.perf_counter() - self._started
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """Strom spanu; `offset_ms` je začátek relativně ke kořeni."""
+        origin = self.start if origin is None else origin
+        data: Dict[str, Any] = {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round(self.elapsed() * 1000, 1),
+        }
+        if self.attributes:
+            data["attributes"] = dict(self.attributes)
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in list(self.children)]
+        return data
+
+
+class _NoopSpan:
+    """Span mimo trasovanou extrakci."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def trace(name: str, extraction_id: Optional[str] = None, **attributes: Any) -> Iterator[Any]:
+    """Kořenový span extrakce (no-op při `TRACING_ENABLED=0`)."""
+    if not TRACING_ENABLED:
+        yield _NOOP
+        return
+    root = Span(name, {
+        "trace_id": uuid.uuid4().hex[:16],
+        "extraction_id": extraction_id,
+        "request_id": get_request_id(),
+        **attributes,
+    })
+    previous = _current_span.get()
+    _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.duration = time.perf_counter() - root._started
+        _current_span.set(previous)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Vnořený krok aktuálního spanu; výjimka se zapíše do atributu `error`."""
+    parent = _current_span.get()
+    if parent is None:
+        yield _NOOP
+        return
+    child = Span(name, attributes, parent.root)
+    parent.children.append(child)
+    _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        child.duration = time.perf_counter() - child._started
+        # Bez reset(token): generátor může pokračovat v jiném kontextu (StreamingResponse)
+        _current_span.set(parent)
+
+
+def resume(current: Any) -> None:
+    """Obnoví aktuální span po `yield` generátoru, který může pokračovat v jiném kontextu."""
+    if isinstance(current, Span):
+        _current_span.set(current)
+
+
+def in_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Obalí funkci aktuálním kontextem (pro `run_in_executor` a vlákna poolu, které ho nepřenáší)."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def breakdown(root: Span) -> Dict[str, float]:
+    """Součet dob (ms) podle názvu kroku přes celý strom, bez kořene."""
+    totals: Dict[str, float] = {}
+    stack = list(root.children)
+    while stack:
+        item = stack.pop()
+        totals[item.name] = round(totals.get(item.name, 0.0) + item.elapsed() * 1000, 1)
+        stack.extend(item.children)
+    return totals
+
+
+def current_timings() -> Optional[Dict[str, Any]]:
+    """Časy aktuální extrakce: celkem, souhrn podle kroků a strom spanů (None = netrasuje se)."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    root = current.root
+    return {
+        "trace_id": root.attributes.get("trace_id"),
+        "extraction_id": root.attributes.get("extraction_id"),
+        "request_id": root.attributes.get("request_id"),
+        "total_ms": round(root.elapsed() * 1000, 1),
+        "breakdown": breakdown(root),
+        "spans": root.to_dict(),
+    }
+
+
+def server_timing_header(timings: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Hodnota hlavičky `Server-Timing` ze souhrnu `current_timings()`."""
+    if not timings:
+        return None
+    metrics = [f"{name};dur={ms}" for name, ms in sorted(timings.get("breakdown", {}).items(), key=lambda kv: -kv[1])]
+    metrics.append(f"total;dur={timings['total_ms']}")
+    return ", ".join(metrics)
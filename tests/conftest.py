@@ -0,0 +1,55 @@
+"""Společné nastavení testů: izolované cesty v dočasné složce a fake LLM bez sítě."""
+
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_TMP = Path(tempfile.mkdtemp(prefix="dsv_tests_"))
+
+# Konfigurace se čte při importu `src.config`, proto se nastavuje před importem src
+for _name, _value in {
+    "LLM_PROVIDER": "fake",
+    "FAKE_LLM_LATENCY": "fixed:0",
+    "FAKE_LLM_FILE_READY": "0",
+    "GEMINI_QUOTA_ENABLED": "0",
+    "GEMINI_PROMPT_CACHE": "0",
+    "RESULT_CACHE_DIR": str(_TMP / "results"),
+    "GEMINI_QUOTA_DB": str(_TMP / "quota.sqlite"),
+    "COST_BUDGET_DB": str(_TMP / "budget.sqlite"),
+    "LAYOUT_REGISTRY_FILE": str(_TMP / "layouts.json"),
+    "LLM_CASSETTE_DIR": str(_TMP / "cassettes"),
+    "METRICS_DIR": str(_TMP / "metrics"),
+    "BENCHMARK_DIR": str(_TMP / "benchmarks"),
+    "PDF_INPUT_DIR": str(_TMP / "input"),
+    "PDF_OUTPUT_DIR": str(_TMP / "output"),
+}.items():
+    os.environ.setdefault(_name, _value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def blank_pdf() -> bytes:
+    """Dvoustránkové PDF bez textu."""
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.add_blank_page(width=595, height=842)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def processor():
+    """Procesor s fake poskytovatelem, bez cache výsledků."""
+    from src.pdf_processor import PDFProcessor
+
+    proc = PDFProcessor()
+    proc.result_cache = None
+    return proc
@@ -0,0 +1,135 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.budget import BudgetExceededError, CostBudget, LOCAL_USER, SCOPE_REQUEST, SCOPE_USER_DAY
+from src.pdf_document import PDFDocumentSession
+
+
+def _estimate(model: str, cost: float) -> dict:
+    return {"model": model, "cost_usd": cost}
+
+
+def _spent(budget: CostBudget, user: str = LOCAL_USER) -> float:
+    conn = sqlite3.connect(str(budget.db_path))
+    try:
+        row = conn.execute("SELECT COALESCE(SUM(usd), 0) FROM spend WHERE user = ?", (user,)).fetchone()
+    finally:
+        conn.close()
+    return row[0]
+
+
+def test_admit_without_limits_allows_and_reserves_nothing(tmp_path):
+    budget = CostBudget(tmp_path / "b.sqlite", per_request=0, per_user_day=0, per_day=0)
+    decision = budget.admit("alice", [_estimate("m", 5.0)])
+    assert decision["action"] == "allow"
+    assert decision["reserved_usd"] == 0.0
+    assert _spent(budget, "alice") == 0.0
+
+
+def test_admit_reserves_estimate_and_settle_replaces_it(tmp_path):
+    budget = CostBudget(tmp_path / "b.sqlite", per_request=0, per_user_day=1.0, per_day=0)
+    decision = budget.admit("alice", [_estimate("m", 0.4)])
+    assert decision["action"] == "allow"
+    assert _spent(budget, "alice") == pytest.approx(0.4)
+
+    budget.settle(decision, 0.1)
+    assert _spent(budget, "alice") == pytest.approx(0.1)
+
+
+def test_user_day_budget_downgrades_then_goes_deterministic(tmp_path):
+    budget = CostBudget(tmp_path / "b.sqlite", per_request=0, per_user_day=1.0, per_day=0, action="downgrade")
+    estimates = [_estimate("pro", 0.8), _estimate("flash", 0.15)]
+
+    first = budget.admit("bob", estimates)
+    assert first["action"] == "allow" and first["model"] == "pro"
+
+    second = budget.admit("bob", estimates)
+    assert second["action"] == "downgrade"
+    assert second["model"] == "flash"
+    assert second["scope"] == SCOPE_USER_DAY
+
+    third = budget.admit("bob", estimates)
+    assert third["action"] == "deterministic"
+    assert third["model"] is None
+    assert third["reserved_usd"] == 0.0
+    # Jiný uživatel má vlastní denní rozpočet
+    assert budget.admit("carol", estimates)["action"] == "allow"
+
+
+def test_reject_action_raises(tmp_path):
+    budget = CostBudget(tmp_path / "b.sqlite", per_request=0.1, per_user_day=0, per_day=0, action="reject")
+    with pytest.raises(BudgetExceededError) as excinfo:
+        budget.admit(None, [_estimate("m", 0.5), _estimate("cheap", 0.05)])
+    assert excinfo.value.scope == SCOPE_REQUEST
+    assert _spent(budget) == 0.0
+
+
+def _hybrid_plan(ai_segments):
+    return {
+        "fingerprint": "test-layout",
+        "deterministic": [],
+        "diag": {"blocks": 1, "low_confidence_blocks": 1},
+        "block_records": [[]],
+        "low": [0],
+        "ai_segments": ai_segments,
+        "result": None,
+    }
+
+
+def test_hybrid_ai_leg_is_skipped_when_budget_is_exhausted(processor, blank_pdf, tmp_path, monkeypatch):
+    processor.layout_registry = object()
+    processor.cost_budget = CostBudget(tmp_path / "b.sqlite", per_request=1e-9, per_user_day=0, per_day=0)
+    monkeypatch.setattr(processor, "_hybrid_plan", lambda session: _hybrid_plan([[1]]))
+    calls = []
+    monkeypatch.setattr(processor, "_run_segment_extractions", lambda *args, **kwargs: calls.append(args))
+
+    with PDFDocumentSession(blank_pdf) as session:
+        _, usage_info = processor._extract_records(session)
+
+    assert calls == []
+    assert usage_info["ai_diagnostics"]["degraded_reason"] == "budget"
+
+
+def test_hybrid_ai_leg_is_reserved_and_settled(processor, blank_pdf, tmp_path, monkeypatch):
+    processor.layout_registry = object()
+    processor.cost_budget = CostBudget(tmp_path / "b.sqlite", per_request=0, per_user_day=10.0, per_day=0)
+    monkeypatch.setattr(processor, "_hybrid_plan", lambda session: _hybrid_plan([[2]]))
+    _, segment_usage = processor.calculate_cost(1000, 100)
+    segment_usage["ai_diagnostics"] = {"ai_json_parsed": True}
+    sent = []
+
+    def fake_run(session, segments, *args, **kwargs):
+        sent.append(segments)
+        return [([{"cn_number": "1"}], dict(segment_usage))], 100
+
+    monkeypatch.setattr(processor, "_run_segment_extractions", fake_run)
+
+    with PDFDocumentSession(blank_pdf) as session:
+        records, usage_info = processor._extract_records(session, user="alice")
+
+    assert sent == [[[2]]]
+    assert records == [{"cn_number": "1"}]
+    assert usage_info["ai_diagnostics"]["ai_method"] == "hybrid"
+    assert usage_info["preflight"]["budget"]["action"] == "allow"
+    # Rezervace odhadu je nahrazena skutečnou cenou
+    assert _spent(processor.cost_budget, "alice") == pytest.approx(segment_usage["total_cost_usd"])
+
+
+def test_async_hybrid_ai_leg_is_skipped_when_budget_is_exhausted(processor, blank_pdf, tmp_path, monkeypatch):
+    processor.layout_registry = object()
+    processor.cost_budget = CostBudget(tmp_path / "b.sqlite", per_request=1e-9, per_user_day=0, per_day=0)
+    monkeypatch.setattr(processor, "_hybrid_plan", lambda session: _hybrid_plan([[1]]))
+    calls = []
+
+    async def fake_arun(*args, **kwargs):
+        calls.append(args)
+
+    monkeypatch.setattr(processor, "_arun_segment_extractions", fake_arun)
+
+    with PDFDocumentSession(blank_pdf) as session:
+        _, usage_info = asyncio.run(processor._aextract_records(session))
+
+    assert calls == []
+    assert usage_info["ai_diagnostics"]["degraded_reason"] == "budget"
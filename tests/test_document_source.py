@@ -0,0 +1,86 @@
+import io
+import tempfile
+
+from src.document_source import DocumentSource, as_document_source
+
+PDF_BYTES = b"%PDF-1.4\n" + b"0" * 64
+
+
+def _spooled(max_size: int) -> tempfile.SpooledTemporaryFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spooled.write(PDF_BYTES)
+    spooled.seek(0)
+    return spooled
+
+
+def test_from_fileobj_keeps_small_spooled_upload_in_memory():
+    spooled = _spooled(max_size=1024)
+    source = DocumentSource.from_fileobj(spooled, name="a.pdf")
+    assert not spooled._rolled
+    assert source.size == len(PDF_BYTES)
+    assert source.open_stream().read() == PDF_BYTES
+    source.close()
+    spooled.close()
+
+
+def test_from_fileobj_maps_rolled_over_upload():
+    spooled = _spooled(max_size=8)
+    assert spooled._rolled
+    source = DocumentSource.from_fileobj(spooled, name="a.pdf")
+    assert source.sha256() == DocumentSource(PDF_BYTES).sha256()
+    source.close()
+    spooled.close()
+
+
+def test_from_fileobj_reads_spooled_upload_without_known_internals(monkeypatch):
+    spooled = _spooled(max_size=1024)
+    # Jiná implementace SpooledTemporaryFile bez interního `_rolled`
+    monkeypatch.delattr(tempfile.SpooledTemporaryFile, "_rolled", raising=False)
+    monkeypatch.delattr(spooled, "_rolled", raising=False)
+    source = DocumentSource.from_fileobj(spooled, name="a.pdf", owned=True)
+    assert source.open_stream().read() == PDF_BYTES
+    assert spooled.closed
+    source.close()
+
+
+def test_owned_source_outlives_the_upload_and_closes_it():
+    for max_size in (1024, 8):
+        spooled = _spooled(max_size)
+        source = DocumentSource.from_fileobj(spooled, name="a.pdf", owned=True)
+        assert source.open_stream().read() == PDF_BYTES
+        source.close()
+        assert spooled.closed
+
+
+def test_file_path_is_written_once_and_removed_on_close():
+    source = DocumentSource(PDF_BYTES, name="a.pdf")
+    path = source.file_path()
+    assert source.file_path() == path
+    assert path.read_bytes() == PDF_BYTES
+    source.close()
+    assert not path.exists()
+
+
+class _ExportedView:
+    """View, který nejde uvolnit (řez bufferu ještě někdo drží)."""
+
+    def release(self):
+        raise BufferError("existing exports")
+
+
+def test_close_removes_temp_file_even_when_view_is_still_exported():
+    source = DocumentSource(PDF_BYTES, name="a.pdf")
+    path = source.file_path()
+    source._view = _ExportedView()
+    source.close()
+    assert not path.exists()
+
+
+def test_as_document_source_owns_only_sources_it_creates(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(PDF_BYTES)
+    source, owned = as_document_source(pdf)
+    assert owned and source.path == pdf and source.size == len(PDF_BYTES)
+    assert as_document_source(source) == (source, False)
+    source.close()
+    assert as_document_source(io.BytesIO(PDF_BYTES).getvalue(), name="b.pdf")[0].name == "b.pdf"
@@ -0,0 +1,25 @@
+import pytest
+
+import src.pdf_processor as pdf_processor
+from src.main import dry_run
+from src.pdf_processor import PDFProcessor
+
+
+def test_dry_run_estimates_without_llm_provider(monkeypatch, blank_pdf, tmp_path, capsys):
+    def no_provider(*args, **kwargs):
+        raise ValueError("GOOGLE_API_KEY není nastaven!")
+
+    monkeypatch.setattr(pdf_processor, "create_provider", no_provider)
+    with pytest.raises(ValueError):
+        PDFProcessor()
+
+    processor = PDFProcessor(with_llm=False)
+    assert processor.provider is None and processor.google_client is None
+
+    pdf_file = tmp_path / "doc.pdf"
+    pdf_file.write_bytes(blank_pdf)
+    dry_run(processor, [pdf_file])
+    captured = capsys.readouterr()
+    assert "chyba" not in captured.err
+    assert "doc.pdf" in captured.out
+    assert "Odhad celkem" in captured.out
@@ -0,0 +1,41 @@
+from src.hedging import HedgingPolicy, page_bucket
+
+
+def test_page_bucket():
+    assert page_bucket(1) == "1-5"
+    assert page_bucket(5) == "1-5"
+    assert page_bucket(6) == "6-20"
+    assert page_bucket(60) == "21-60"
+    assert page_bucket(61) == "61+"
+
+
+def test_hedge_delay_waits_for_min_samples_per_bucket():
+    policy = HedgingPolicy(percentile=90, max_fraction=0.1, min_samples=10)
+    for seconds in range(1, 10):
+        policy.record_latency(3, float(seconds))
+    assert policy.hedge_delay(3) is None
+    policy.record_latency(3, 10.0)
+    assert policy.hedge_delay(3) == 9.0
+    # Jiná skupina stránek má vlastní měření
+    assert policy.hedge_delay(30) is None
+
+
+def _reserve(policy, calls):
+    hedges = 0
+    for _ in range(calls):
+        policy.start_request()
+        hedges += policy.try_reserve_hedge()
+    return hedges
+
+
+def test_hedge_cap_right_after_start_uses_min_samples():
+    policy = HedgingPolicy(max_fraction=0.1, min_samples=20)
+    # Po startu se nehedguje každé volání: 2 hedge na prvních 20 volání
+    assert _reserve(policy, 20) == 2
+
+
+def test_hedge_cap_follows_calls_in_window():
+    policy = HedgingPolicy(max_fraction=0.1, min_samples=20)
+    hedges = _reserve(policy, 150)
+    assert hedges == 15
+    assert hedges / 150 <= 0.1
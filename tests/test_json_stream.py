@@ -0,0 +1,74 @@
+import json
+
+from src.json_stream import IncrementalJSONArrayParser, scan_json_regions
+
+
+def _region_texts(text):
+    regions, _ = scan_json_regions(text)
+    return [text[start:end] for start, end in regions]
+
+
+def test_incremental_parser_emits_records_as_they_close():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('```json\n[{"a": 1}, {"b": "x}') == [{"a": 1}]
+    assert parser.feed('"}, {"c": [1, 2]}') == [{"b": "x}"}, {"c": [1, 2]}]
+    assert parser.feed("]\nkonec [{\"d\": 1}]") == []
+    assert parser.closed
+    assert parser.records_count == 3
+
+
+def test_incremental_parser_skips_arrays_without_objects():
+    parser = IncrementalJSONArrayParser()
+    records = parser.feed('Stránky [1, 2] obsahují: [{"a": 1}]')
+    assert records == [{"a": 1}]
+    assert parser.closed
+
+
+def test_scan_finds_json_between_prose():
+    text = 'Výsledek:\n[{"a": "x]"}]\nHotovo {"b": 2}.'
+    assert _region_texts(text) == ['[{"a": "x]"}]', '{"b": 2}']
+
+
+def test_scan_recovers_json_after_stray_opening_bracket_in_prose():
+    text = 'Note: values in {brackets are approximate.\n[{"a": 1}, {"a": 2}]'
+    regions, _ = scan_json_regions(text)
+    assert [json.loads(text[start:end]) for start, end in regions] == [[{"a": 1}, {"a": 2}]]
+
+
+def test_scan_recovers_json_after_mismatched_bracket():
+    text = '{ [{"a": 1}] ]'
+    assert _region_texts(text) == ['[{"a": 1}]']
+
+
+def test_scan_repairs_truncated_array():
+    text = 'Here [{"a": 1}, {"a": 2}, {"a": '
+    _, repairs = scan_json_regions(text)
+    assert json.loads(repairs[0]) == [{"a": 1}, {"a": 2}]
+
+
+def test_scan_repairs_truncated_array_after_prose_bracket():
+    text = 'Note {x.\n[{"a": 1}, {"a": 2}, {"a"'
+    _, repairs = scan_json_regions(text)
+    valid = []
+    for repaired in repairs:
+        try:
+            valid.append(json.loads(repaired))
+        except json.JSONDecodeError:
+            pass
+    assert valid == [[{"a": 1}, {"a": 2}]]
+
+
+def test_parse_ai_response_prefers_repaired_array_over_single_objects(processor):
+    records, usage_info = processor._parse_ai_response(
+        'Here [{"a": 1}, {"a": 2}, {"a": ', None, processor._new_ai_diagnostics()
+    )
+    assert records == [{"a": 1}, {"a": 2}]
+    assert usage_info["ai_diagnostics"]["ai_json_strategy"] == "truncated_repair"
+
+
+def test_parse_ai_response_handles_prose_bracket(processor):
+    records, usage_info = processor._parse_ai_response(
+        'Note: values in {brackets are approximate.\n[{"a": 1}, {"a": 2}]', None, processor._new_ai_diagnostics()
+    )
+    assert records == [{"a": 1}, {"a": 2}]
+    assert usage_info["ai_diagnostics"]["ai_json_strategy"] == "scan"
@@ -0,0 +1,33 @@
+from src.memory_governor import MODE_FULL, MODE_PAGE_STREAMING, MemoryGovernor, estimate_footprint_mb
+from src.pdf_document import PDFDocumentSession
+
+
+def _prepared(session):
+    pages = range(1, session.page_count + 1)
+    return {p: f"text {p}" for p in pages}, {p: {} for p in pages}, {p: {} for p in pages}
+
+
+def test_preloaded_texts_survive_replanning_in_full_mode(processor, blank_pdf):
+    with PDFDocumentSession(blank_pdf, name="doc.pdf") as session:
+        memory = MemoryGovernor(budget_mb=1e6)
+        processor._plan_memory(session, memory)
+        session.preload(*_prepared(session))
+        # `_aextract_session` plánuje znovu; režim ani cache textů se nesmí změnit
+        processor._plan_memory(session, memory)
+
+        assert session.processing_mode == MODE_FULL
+        assert session.page_text(1) == "text 1"
+
+
+def test_plan_is_computed_once_per_job(processor, blank_pdf, capsys):
+    with PDFDocumentSession(blank_pdf, name="doc.pdf") as session:
+        memory = MemoryGovernor(budget_mb=estimate_footprint_mb(session.size, session.page_count))
+        processor._plan_memory(session, memory)
+        session.preload(*_prepared(session))
+        processor._plan_memory(session, memory)
+
+        assert session.processing_mode == MODE_PAGE_STREAMING
+        # Mimo "full" se texty nedrží, klasifikace z přípravy ale zůstává
+        assert session.page_text(1) == ""
+        assert session.page_flags(1) == {}
+    assert capsys.readouterr().out.count("režim page_streaming") == 1
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+
+import pytest
+
+from src import metrics
+from src.metrics import Counter, Gauge, Histogram, render_metrics
+
+REQUESTS = Counter("test_requests_total", "Testovací čítač", ("route",))
+IN_FLIGHT = Gauge("test_in_flight", "Testovací gauge")
+LATENCY = Histogram("test_latency_seconds", "Testovací histogram", (), (0.1, 1))
+
+# PID, který v testech neběží
+_DEAD_PID = 2 ** 22 + 12345
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", tmp_path)
+    return tmp_path
+
+
+def _value(text: str, series: str, default=None) -> float:
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    if default is None:
+        raise AssertionError(f"{series} chybí ve výstupu")
+    return default
+
+
+def _write_snapshot(directory, name: str, values: dict, **identity) -> None:
+    snapshot = {"host": metrics._process_identity()["host"], "pid": _DEAD_PID, "started": None,
+                "boot_id": name, "written_at": time.time(), "metrics": values, **identity}
+    (directory / f"metrics-{name}.json").write_text(json.dumps(snapshot), encoding="utf-8")
+
+
+def test_render_counter_gauge_and_cumulative_histogram():
+    before = render_metrics()
+    REQUESTS.inc(route="/a")
+    REQUESTS.inc(2, route="/a")
+    LATENCY.observe(0.05)
+    LATENCY.observe(0.5)
+    text = render_metrics()
+
+    assert "# TYPE test_requests_total counter" in text
+    series = 'test_requests_total{route="/a"}'
+    assert _value(text, series) == _value(before, series, 0) + 3
+    bucket = 'test_latency_seconds_bucket{le="%s"}'
+    assert _value(text, bucket % "0.1") == _value(before, bucket % "0.1", 0) + 1
+    assert _value(text, bucket % "1") == _value(before, bucket % "1", 0) + 2
+    assert _value(text, 'test_latency_seconds_bucket{le="+Inf"}') == _value(text, "test_latency_seconds_count")
+
+
+def test_dead_process_counters_fold_into_aggregate(metrics_dir):
+    _write_snapshot(metrics_dir, "dead", {
+        "test_requests_total": {json.dumps(["/dead"]): 5},
+        "test_in_flight": {json.dumps([]): 4},
+    })
+    baseline = _value(render_metrics(), "test_in_flight")
+
+    first = render_metrics()
+    assert _value(first, 'test_requests_total{route="/dead"}') == 5
+    # Gauge ukončeného procesu se nepočítá
+    assert _value(first, "test_in_flight") == baseline
+    assert not (metrics_dir / "metrics-dead.json").exists()
+    assert (metrics_dir / "aggregate.json").exists()
+
+    # Sloučený čítač se neztratí ani nezdvojí
+    assert _value(render_metrics(), 'test_requests_total{route="/dead"}') == 5
+
+
+def test_reused_pid_is_not_mistaken_for_the_old_process(metrics_dir):
+    own = metrics._process_identity()
+    if own["started"] is None:
+        pytest.skip("čas startu procesu není k dispozici (bez /proc)")
+    _write_snapshot(metrics_dir, "old", {"test_in_flight": {json.dumps([]): 7}}, pid=os.getpid(), started=own["started"] - 1)
+
+    text = render_metrics()
+    assert _value(text, "test_in_flight") < 7
+    assert not (metrics_dir / "metrics-old.json").exists()
+
+
+def test_other_host_snapshot_is_live_until_stale(metrics_dir):
+    _write_snapshot(metrics_dir, "fresh", {"test_in_flight": {json.dumps([]): 100}}, host="other-host", pid=os.getpid())
+    assert _value(render_metrics(), "test_in_flight") >= 100
+    assert (metrics_dir / "metrics-fresh.json").exists()
+
+    _write_snapshot(metrics_dir, "fresh", {"test_in_flight": {json.dumps([]): 100}}, host="other-host",
+                    pid=os.getpid(), written_at=time.time() - metrics._STALE_SECONDS - 1)
+    assert _value(render_metrics(), "test_in_flight") < 100
+    assert not (metrics_dir / "metrics-fresh.json").exists()
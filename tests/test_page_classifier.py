@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+from src.page_classifier import OTHER_PAGE_TYPE, default_classifier, has_long_code
+
+SAMPLE = Path(__file__).resolve().parent.parent / "src" / "test-files" / "20251002091816043_02102025_090750_1 (1).PDF"
+
+
+def test_consignment_note_after_long_word_is_recognized():
+    flags, scores = default_classifier.classify("Date: Wednesday\nCONSIGNMENT NOTE\nShipment total 3 colli")
+    assert flags["Consignment Note"]
+    assert scores["Consignment Note"] == pytest.approx(1.0)
+    assert not flags[OTHER_PAGE_TYPE]
+
+
+def test_mrn_code_with_punctuation_is_recognized():
+    assert has_long_code("MRN: 25CZ-3O000-OO1DA-GMB8")
+    flags, _ = default_classifier.classify("MRN: 25CZ-3O000-OO1DA-GMB8")
+    assert flags["MRN"]
+
+
+def test_mrn_keyword_without_long_code_is_other():
+    flags, _ = default_classifier.classify("MRN will follow, see attachment")
+    assert not flags["MRN"]
+    assert flags[OTHER_PAGE_TYPE]
+
+
+@pytest.mark.skipif(not SAMPLE.exists(), reason="ukázkové PDF není k dispozici")
+def test_sample_page_69_is_consignment_note():
+    from PyPDF2 import PdfReader
+
+    text = PdfReader(str(SAMPLE)).pages[68].extract_text() or ""
+    flags, _ = default_classifier.classify(text)
+    assert flags["Consignment Note"]
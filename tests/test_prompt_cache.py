@@ -0,0 +1,30 @@
+from src.pdf_processor import PDFProcessor
+from src.prompt_cache import PromptContextCache, min_cache_tokens
+
+
+def test_min_cache_tokens_uses_longest_prefix_and_default():
+    assert min_cache_tokens("gemini-2.5-flash-lite") == 1024
+    assert min_cache_tokens("gemini-2.5-pro") == 4096
+    assert min_cache_tokens("some-future-model") == 4096
+
+
+def test_short_prompt_is_skipped_without_calling_the_api():
+    cache = PromptContextCache("gemini-2.5-flash")
+    prompt = PDFProcessor._system_prompt()
+    assert cache.skip_reason(prompt).startswith("prompt_below_minimum")
+    # Bez volání Gemini (google.generativeai se ani neimportuje)
+    assert cache.model_for(prompt) is None
+
+
+def test_long_prompt_is_cacheable():
+    cache = PromptContextCache("gemini-2.5-flash")
+    assert cache.skip_reason("x" * 4 * 1024) is None
+
+
+def test_skip_reason_is_recorded_in_diagnostics(processor):
+    processor.prompt_cache = PromptContextCache("gemini-2.5-flash")
+    ai_diag = {}
+    _, text = processor._prompt_request(processor._system_prompt(), "PDF", ai_diag)
+    assert ai_diag["prompt_cache"] is False
+    assert ai_diag["prompt_cache_skipped"].startswith("prompt_below_minimum")
+    assert text.endswith("PDF")
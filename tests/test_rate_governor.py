@@ -0,0 +1,28 @@
+from src.rate_governor import is_rate_limit_error
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class InvalidArgument(Exception):
+    code = 400
+
+
+class _Status:
+    name = "RESOURCE_EXHAUSTED"
+
+
+class _GrpcError(Exception):
+    grpc_status_code = _Status()
+
+
+def test_quota_errors_are_rate_limits():
+    assert is_rate_limit_error(ResourceExhausted("slow down"))
+    assert is_rate_limit_error(_GrpcError("try later"))
+    assert is_rate_limit_error(RuntimeError("status RESOURCE_EXHAUSTED"))
+
+
+def test_unrelated_error_mentioning_429_is_not_a_rate_limit():
+    assert not is_rate_limit_error(InvalidArgument("document has 429 pages, limit is 300"))
+    assert not is_rate_limit_error(RuntimeError("Billing account quota settings changed"))
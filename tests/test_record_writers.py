@@ -0,0 +1,103 @@
+import csv
+from pathlib import Path
+
+from src.pdf_document import PDFDocumentSession
+from src.record_writers import FIELD_NAMES, RecordOutputs, write_records
+
+
+def _record(cn: str, mrn_pages=None) -> dict:
+    return {"consignment_note": cn, "gross_weight_kg": "1,5", "packages": 2, "mrn_pages": mrn_pages or []}
+
+
+def _csv_rows(path: Path) -> list:
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_write_records_csv_uses_schema_columns(tmp_path):
+    path = tmp_path / "out.csv"
+    assert write_records([_record("A", [3, 4]), {"consignment_note": "B", "unknown": "x"}], path) == 2
+
+    rows = _csv_rows(path)
+    assert rows[0] == FIELD_NAMES
+    assert rows[1][FIELD_NAMES.index("mrn_pages")] == "3; 4"
+    assert rows[2] == ["B", "", "", "", "", ""]
+
+
+def test_write_records_csv_marks_empty_output(tmp_path):
+    path = tmp_path / "out.csv"
+    write_records([], path)
+    assert _csv_rows(path) == [["No data extracted"]]
+
+
+def test_outputs_append_only_records_not_streamed_yet(tmp_path):
+    outputs = RecordOutputs(tmp_path / "doc", "doc")
+    outputs.add("csv")
+    outputs.add("jsonl")
+    records = [_record("A"), _record("B"), _record("C")]
+
+    outputs.write_many(records[:2])
+    assert (tmp_path / "doc" / "doc.csv.part").exists()
+    assert not (tmp_path / "doc" / "doc.csv").exists()
+    paths = outputs.finish(records)
+
+    assert [row[0] for row in _csv_rows(Path(paths["csv"]))[1:]] == ["A", "B", "C"]
+    assert len(Path(paths["jsonl"]).read_text(encoding="utf-8").splitlines()) == 3
+    assert sorted(p.name for p in (tmp_path / "doc").iterdir()) == ["doc.csv", "doc.jsonl"]
+
+
+def test_outputs_rewrite_records_changed_after_streaming(tmp_path):
+    outputs = RecordOutputs(tmp_path / "doc", "doc")
+    outputs.add("csv")
+    records = [_record("A"), _record("B")]
+    outputs.write_many(records)
+
+    # `mrn_pages` doplněné po extrakci (textová detekce MRN stránek)
+    records[1]["mrn_pages"] = [7]
+    paths = outputs.finish(records)
+
+    rows = _csv_rows(Path(paths["csv"]))
+    assert len(rows) == 3
+    assert rows[2][FIELD_NAMES.index("mrn_pages")] == "7"
+
+
+def test_outputs_discard_removes_partial_files_and_created_folder(tmp_path):
+    with RecordOutputs(tmp_path / "doc", "doc") as outputs:
+        outputs.add("csv")
+        outputs.write_many([_record("A")])
+    assert not (tmp_path / "doc").exists()
+
+
+def test_segment_merge_feeds_session_outputs(processor, blank_pdf):
+    emitted = []
+    with PDFDocumentSession(blank_pdf, name="doc.pdf") as session:
+        session.record_sink = emitted.extend
+        records, _ = processor._merge_segment_results(
+            session,
+            [[1], [2]],
+            [([_record("A", [1])], None), ([_record("B", [1])], None)],
+            0,
+        )
+    assert [r["consignment_note"] for r in emitted] == ["A", "B"]
+    # Stránky jsou už přemapované na originál
+    assert emitted[1]["mrn_pages"] == [2]
+    assert emitted == records
+
+
+def test_stream_writes_records_into_outputs_opened_before_extraction(processor, blank_pdf, tmp_path):
+    output_folder = tmp_path / "doc"
+    seen_part = []
+
+    def fake_stream(pdf_path, session=None):
+        yield _record("A")
+        seen_part.append((output_folder / "doc.csv.part").exists())
+        yield _record("B")
+        return {"ai_diagnostics": {"ai_json_parsed": True}}
+
+    processor.stream_data_with_ai = fake_stream
+    events = list(processor.process_pdf_stream(blank_pdf, tmp_path, filename="doc.pdf"))
+
+    assert seen_part == [True]
+    result = events[-1]["result"]
+    assert [row[0] for row in _csv_rows(Path(result["output_files"]["csv"]))[1:]] == ["A", "B"]
+    assert not (output_folder / "doc.csv.part").exists()
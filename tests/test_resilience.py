@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+from src import resilience
+from src.resilience import (
+    ERROR_CIRCUIT_OPEN,
+    ERROR_FILE,
+    ERROR_PERMANENT,
+    ERROR_RATE_LIMIT,
+    ERROR_TIMEOUT,
+    ERROR_TRANSIENT,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    classify_error,
+)
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class FileNotReadyError(Exception):
+    pass
+
+
+class _CodedError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Řízený `time.monotonic` breakeru."""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+
+    async def _asleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", _asleep)
+    return sleeps
+
+
+def _failing(errors, result="ok"):
+    """Funkce, která postupně vyhodí `errors` a pak vrátí `result`."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return func, calls
+
+
+@pytest.mark.parametrize("error, kind", [
+    (CircuitOpenError("open"), ERROR_CIRCUIT_OPEN),
+    (FileNotReadyError("processing"), ERROR_FILE),
+    (Exception("429 RESOURCE_EXHAUSTED: quota exceeded"), ERROR_RATE_LIMIT),
+    (_CodedError(429), ERROR_RATE_LIMIT),
+    (TimeoutError(), ERROR_TIMEOUT),
+    (ConnectionResetError(), ERROR_TRANSIENT),
+    (ServiceUnavailable("503"), ERROR_TRANSIENT),
+    (_CodedError(502), ERROR_TRANSIENT),
+    (_CodedError(400), ERROR_PERMANENT),
+    (ValueError("bad prompt"), ERROR_PERMANENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_delay_is_full_jitter_capped_by_max_delay():
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=3.0)
+    for attempt, cap in ((1, 1.0), (2, 2.0), (3, 3.0), (6, 3.0)):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0.0 <= d <= cap for d in delays)
+
+
+def test_transient_errors_are_retried_until_success(no_sleep):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=1.0)
+    breaker = CircuitBreaker("m", failure_threshold=5)
+    func, calls = _failing([ServiceUnavailable(), TimeoutError()])
+    diagnostics = {}
+
+    assert policy.call(func, breaker, diagnostics) == "ok"
+    assert len(calls) == 3
+    assert len(no_sleep) == 2
+    assert diagnostics["attempts"] == 3
+    assert breaker.state == "closed"
+
+
+def test_permanent_error_is_not_retried_nor_counted():
+    policy = RetryPolicy(max_attempts=3)
+    breaker = CircuitBreaker("m", failure_threshold=1)
+    func, calls = _failing([ValueError("bad")])
+    diagnostics = {}
+
+    with pytest.raises(ValueError):
+        policy.call(func, breaker, diagnostics)
+    assert len(calls) == 1
+    assert diagnostics == {"attempts": 1, "last_error_class": ERROR_PERMANENT}
+    assert breaker.state == "closed"
+
+
+def test_exhausted_attempts_raise_last_error():
+    policy = RetryPolicy(max_attempts=2)
+    breaker = CircuitBreaker("m", failure_threshold=10)
+    func, calls = _failing([ServiceUnavailable("a"), ServiceUnavailable("b"), ServiceUnavailable("c")])
+
+    with pytest.raises(ServiceUnavailable, match="b"):
+        policy.call(func, breaker)
+    assert len(calls) == 2
+
+
+def test_breaker_opens_after_threshold_and_stops_retrying(clock):
+    policy = RetryPolicy(max_attempts=5)
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_timeout=30)
+    func, calls = _failing([ServiceUnavailable()] * 5)
+
+    with pytest.raises(ServiceUnavailable):
+        policy.call(func, breaker)
+    # Po otevření breakeru se dál neopakuje
+    assert len(calls) == 2
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    with pytest.raises(CircuitOpenError):
+        policy.call(lambda: "ok", breaker)
+
+
+def test_half_open_lets_single_probe_through(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker("m", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 29
+    assert breaker.state == "open"
+
+
+def test_probe_ending_with_permanent_error_is_released(clock):
+    policy = RetryPolicy(max_attempts=3)
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+
+    with pytest.raises(ValueError):
+        policy.call(_failing([ValueError("bad")])[0], breaker)
+    # Další zkušební požadavek smí projít
+    assert policy.call(lambda: "ok", breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_acall_retries_transient_errors(no_sleep):
+    policy = RetryPolicy(max_attempts=3)
+    breaker = CircuitBreaker("m", failure_threshold=5)
+    func, calls = _failing([ConnectionResetError()])
+
+    async def afunc():
+        return func()
+
+    assert asyncio.run(policy.acall(afunc, breaker)) == "ok"
+    assert len(calls) == 2
+    assert len(no_sleep) == 1
@@ -0,0 +1,77 @@
+import json
+import os
+import time
+
+from src.result_cache import ExtractionResultCache
+
+PAGE_TYPES = {"Consignment Note": [1], "MRN": [2]}
+
+
+def test_make_key_depends_on_pdf_prompt_and_model():
+    key = ExtractionResultCache.make_key("abc", "prompt", "model-a")
+    assert key.startswith("abc-")
+    assert key == ExtractionResultCache.make_key("abc", "prompt", "model-a")
+    assert key != ExtractionResultCache.make_key("abc", "prompt 2", "model-a")
+    assert key != ExtractionResultCache.make_key("abc", "prompt", "model-b")
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = ExtractionResultCache(tmp_path)
+    cache.put("k", [{"a": 1}], PAGE_TYPES, {"total_tokens": 10}, model="model-a")
+    entry = cache.get("k", model="model-a")
+    assert entry["extracted_data"] == [{"a": 1}]
+    assert entry["page_types"] == PAGE_TYPES
+    assert entry["model"] == "model-a"
+    assert cache.get("missing") is None
+
+
+def test_entry_from_other_or_unknown_model_is_a_miss(tmp_path):
+    cache = ExtractionResultCache(tmp_path)
+    cache.put("k", [{"a": 1}], PAGE_TYPES, None, model="model-lite")
+    assert cache.get("k", model="model-a") is None
+    # Záznam bez modelu (starší formát) se nepoužije
+    (tmp_path / "old.json").write_text(json.dumps({"key": "old", "created_at": time.time()}), encoding="utf-8")
+    assert cache.get("old", model="model-a") is None
+
+
+def test_expired_and_corrupted_entries_are_removed(tmp_path):
+    cache = ExtractionResultCache(tmp_path, ttl_seconds=60)
+    cache.put("k", [], PAGE_TYPES, None, model="m")
+    path = tmp_path / "k.json"
+    entry = json.loads(path.read_text(encoding="utf-8"))
+    entry["created_at"] -= 120
+    path.write_text(json.dumps(entry), encoding="utf-8")
+    assert cache.get("k", model="m") is None
+    assert not path.exists()
+
+    (tmp_path / "bad.json").write_text("{", encoding="utf-8")
+    assert cache.get("bad") is None
+    assert not (tmp_path / "bad.json").exists()
+
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    cache = ExtractionResultCache(tmp_path, max_entries=2, ttl_seconds=0)
+    for index, key in enumerate(("a", "b")):
+        cache.put(key, [], PAGE_TYPES, None, model="m")
+        os.utime(tmp_path / f"{key}.json", (1000 + index, 1000 + index))
+    assert cache.get("a", model="m") is not None  # zásah posune "a" na nejnovější
+    cache.put("c", [], PAGE_TYPES, None, model="m")
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c"]
+
+
+def _usage(processor, model, **diag):
+    _, usage_info = processor.calculate_cost(100, 10, model=model)
+    usage_info["ai_diagnostics"] = {"ai_json_parsed": True, **diag}
+    return usage_info
+
+
+def test_processor_caches_only_results_of_its_own_model(processor, tmp_path):
+    processor.result_cache = ExtractionResultCache(tmp_path)
+    records = [{"a": 1}]
+
+    processor._store_result("downgraded", records, PAGE_TYPES, _usage(processor, "gemini-2.5-flash-lite"))
+    processor._store_result("degraded", records, PAGE_TYPES, _usage(processor, processor.model, degraded=True))
+    processor._store_result("ok", records, PAGE_TYPES, _usage(processor, processor.model))
+
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["ok"]
+    assert processor.result_cache.get("ok", model=processor.model)["extracted_data"] == records